@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# --- CONFIGURACIÓN ---
+# Incrementar cuando cambie la forma de calcular las claves, para invalidar todos los artefactos.
+STORE_VERSION = 1
+INDEX_NAME = 'artifacts.json'
+KEY_LENGTH = 16
+
+_ARTIFACT_RE = re.compile(r'^(?P<name>.+)_(?P<key>[0-9a-f]{%d})\.(?P<ext>png|svg|pdf)$' % KEY_LENGTH)
+# Figuras de corridas anteriores, nombradas con la marca de tiempo de su generación
+_LEGACY_RE = re.compile(r'^.+_\d{8}_\d{6}\.png$')
+
+
+def _update_hash(h, part):
+    if isinstance(part, (pd.DataFrame, pd.Series)):
+        h.update(repr(part.shape).encode())
+        h.update(json.dumps([str(c) for c in (part.columns if isinstance(part, pd.DataFrame) else [part.name])]).encode())
+        h.update(pd.util.hash_pandas_object(part, index=True).to_numpy().tobytes())
+    elif isinstance(part, np.ndarray):
+        h.update(f"{part.dtype}{part.shape}".encode())
+        h.update(np.ascontiguousarray(part).tobytes())
+    else:
+        h.update(json.dumps(part, sort_keys=True, default=str).encode())
+
+
+def artifact_key(*parts):
+    """
+    Content key of an artifact: a SHA-256 over its input data and plot parameters.
+
+    `parts` may be DataFrames/Series (hashed by value, index and labels), NumPy arrays or any
+    JSON-serializable object (e.g. a distribution summary or a dict of parameters).
+    """
+    h = hashlib.sha256(f"v{STORE_VERSION}".encode())
+    for part in parts:
+        h.update(b'\x00')
+        _update_hash(h, part)
+    return h.hexdigest()[:KEY_LENGTH]
+
+
+def artifact_file(name, key, ext='png'):
+    """File name of the artifact `name` with content key `key`, e.g. 'C208_before_3fa2c1d9e0ab4c17.png'."""
+    return f"{name}_{key}.{ext}"
+
+
+def artifact_path(store_dir, name, key, ext='png'):
+    """Path of an artifact inside `store_dir`."""
+    return os.path.join(store_dir, artifact_file(name, key, ext))
+
+
+def load_index(store_dir):
+    """Returns {artifact name: {'file', 'key', 'updated'}} for the artifacts registered in `store_dir`."""
+    index_path = os.path.join(store_dir, INDEX_NAME)
+    if not os.path.exists(index_path):
+        return {}
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return index.get('artifacts', {}) if index.get('version') == STORE_VERSION else {}
+
+
+def register(store_dir, paths):
+    """
+    Records `paths` ({artifact name: path}) as the current version of each artifact.
+
+    The index is re-read just before the atomic write, so the pipeline and the EDA script can
+    register artifacts in the same directory without losing each other's entries.
+    """
+    if not paths:
+        return
+    artifacts = load_index(store_dir)
+    updated = datetime.now().isoformat(timespec='seconds')
+    for name, path in paths.items():
+        match = _ARTIFACT_RE.match(os.path.basename(path))
+        artifacts[name] = {'file': os.path.basename(path), 'key': match.group('key') if match else None, 'updated': updated}
+    index_path = os.path.join(store_dir, INDEX_NAME)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': STORE_VERSION, 'artifacts': artifacts}, f, indent=2, sort_keys=True, ensure_ascii=False)
+    os.replace(tmp_path, index_path)
+
+
+def lookup(store_dir, name):
+    """File name of the current version of artifact `name`, or None if it is not registered or was deleted."""
+    entry = load_index(store_dir).get(name)
+    if entry and os.path.exists(os.path.join(store_dir, entry['file'])):
+        return entry['file']
+    return None
+
+
+def collect_garbage(store_dir, legacy=True, dry_run=False):
+    """
+    Deletes the artifacts of `store_dir` that the index no longer references.
+
+    Only files named like store artifacts ('{name}_{key}.png') are candidates; with `legacy`, figures
+    from timestamped runs ('{name}_YYYYmmdd_HHMMSS.png') are removed too. Returns the removed names.
+    """
+    if not os.path.isdir(store_dir):
+        return []
+    current = {entry['file'] for entry in load_index(store_dir).values()}
+    removed = []
+    for file in sorted(os.listdir(store_dir)):
+        if file in current:
+            continue
+        if _ARTIFACT_RE.match(file) or (legacy and _LEGACY_RE.match(file)):
+            if not dry_run:
+                os.remove(os.path.join(store_dir, file))
+            removed.append(file)
+    return removed
@@ -0,0 +1,175 @@
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from linear_scorer import compile_scorer, load_scoring_artifact, score_frame
+from weighted_stats import WEIGHT_COLUMN, grouped_sums
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: sin él la salida se escribe como CSV
+    pa = None
+    pq = None
+
+# --- CONFIGURACIÓN ---
+INPUT_PATH = '../02_data_processed/datos_limpios_poblacion_trabajo.csv'
+MODEL_PATH = '../05_dashboard/informality_model.json'
+OUTPUT_PATH = '../02_data_processed/probabilidades_informalidad.parquet'
+DEFAULT_CHUNKSIZE = 100_000
+# Columnas del dataset procesado -> nombres de las variables del modelo (ver predictive_modeling.py)
+FEATURE_COLUMNS = {'grupo_edad': 'grupo_edad', 'C207': 'Sexo', 'C366': 'Nivel Educativo', 'C310': 'Tipo de Ocupación', 'whoraT': 'whoraT'}
+# Columnas que acompañan a cada probabilidad en la salida
+ID_COLUMNS = ['periodo', 'OCUP300', 'es_informal', WEIGHT_COLUMN]
+PROBABILITY_COLUMN = 'prob_informal'
+# Tipos fijos al leer: inferidos bloque por bloque, una columna vacía en un bloque (p. ej. OCUP300)
+# saldría como float64 y el esquema del Parquet dejaría de coincidir entre bloques
+CHUNK_DTYPES = {
+    'grupo_edad': 'string', 'C207': 'string', 'C366': 'string', 'C310': 'string',
+    'periodo': 'string', 'OCUP300': 'string', 'es_informal': 'Int64', WEIGHT_COLUMN: 'float64'
+}
+
+_scorer = None
+
+
+def _init_worker(model_path):
+    # Cada proceso compila el modelo una sola vez
+    global _scorer
+    _scorer = compile_scorer(load_scoring_artifact(model_path))
+
+
+def score_chunk(chunk):
+    """Worker: scores one chunk of the processed population and returns its output columns."""
+    features = chunk[list(FEATURE_COLUMNS)].rename(columns=FEATURE_COLUMNS)
+    out = chunk[['fila'] + [col for col in ID_COLUMNS if col in chunk.columns]].copy()
+    out[PROBABILITY_COLUMN] = score_frame(_scorer, features).astype('float32')
+    return out
+
+
+def iter_chunks(input_path, chunksize):
+    """
+    Streams the columns needed for scoring, with a global row number so the output can be joined
+    back. Columns are read with the fixed CHUNK_DTYPES, so every chunk has the same schema.
+    """
+    header = pd.read_csv(input_path, nrows=0).columns
+    usecols = list(FEATURE_COLUMNS) + [col for col in ID_COLUMNS if col in header]
+    start = 0
+    dtype = {col: kind for col, kind in CHUNK_DTYPES.items() if col in usecols}
+    with pd.read_csv(input_path, usecols=usecols, dtype=dtype, chunksize=chunksize, low_memory=False) as reader:
+        for chunk in reader:
+            chunk.insert(0, 'fila', np.arange(start, start + len(chunk), dtype=np.int64))
+            start += len(chunk)
+            yield chunk
+
+
+class _OutputSink:
+    """Appends scored chunks to a Parquet file (one row group per chunk), or to a CSV without pyarrow."""
+
+    def __init__(self, path):
+        self.path = path if pq is not None else os.path.splitext(path)[0] + '.csv'
+        self.tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        self.writer = None
+        self.header = True
+
+    def write(self, df):
+        if pq is None:
+            df.to_csv(self.tmp_path, mode='w' if self.header else 'a', header=self.header, index=False)
+            self.header = False
+            return
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.tmp_path, table.schema, compression='snappy')
+        self.writer.write_table(table)
+
+    def close(self):
+        """Finishes the file and moves it into place; only called after every chunk was written."""
+        if self.writer is not None:
+            self.writer.close()
+        if os.path.exists(self.tmp_path):
+            os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        """Drops the partial file after a failed run, leaving any previous output untouched."""
+        if self.writer is not None:
+            self.writer.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def run(input_path, model_path, output_path, chunksize=DEFAULT_CHUNKSIZE, workers=1):
+    """
+    Scores every row of the processed working-age population in chunks of `chunksize` rows.
+
+    With workers > 1 the chunks are scored in a process pool whose workers compile the model once
+    (pool initializer); at most two chunks per worker are in flight, so memory stays bounded, and
+    results are written in input order. Returns (rows, seconds, per-period summary, output path).
+    """
+    started = time.perf_counter()
+    sink = _OutputSink(output_path)
+    rows = 0
+    summaries = []
+
+    def consume(scored):
+        nonlocal rows
+        sink.write(scored)
+        rows += len(scored)
+        if 'periodo' in scored.columns:
+            # Sumas por periodo aditivas entre bloques; el promedio se calcula al final
+            summaries.append(grouped_sums(scored, 'periodo', [PROBABILITY_COLUMN]))
+
+    try:
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path,)) as pool:
+                pending = deque()
+                for chunk in iter_chunks(input_path, chunksize):
+                    pending.append(pool.submit(score_chunk, chunk))
+                    if len(pending) >= 2 * workers:
+                        consume(pending.popleft().result())
+                while pending:
+                    consume(pending.popleft().result())
+        else:
+            _init_worker(model_path)
+            for chunk in iter_chunks(input_path, chunksize):
+                consume(score_chunk(chunk))
+    except BaseException:
+        sink.abort()
+        raise
+    sink.close()
+
+    elapsed = time.perf_counter() - started
+    summary = None
+    if summaries:
+        totals = pd.concat(summaries).groupby(level=0, sort=True).sum()
+        summary = pd.DataFrame({
+            'filas': totals['n'],
+            'prob_media_ponderada': totals[f'{PROBABILITY_COLUMN}_suma'] / totals[f'{PROBABILITY_COLUMN}_peso']
+        })
+    return rows, elapsed, summary, sink.path
+
+
+def main(argv=None):
+    """Scores the full processed population and reports throughput."""
+    parser = argparse.ArgumentParser(description="Calcula la probabilidad de informalidad de toda la población procesada.")
+    parser.add_argument('--input', default=INPUT_PATH, help=f"CSV procesado a puntuar (por defecto: {INPUT_PATH}).")
+    parser.add_argument('--model', default=MODEL_PATH, help=f"Artefacto de scoring exportado por predictive_modeling.py (por defecto: {MODEL_PATH}).")
+    parser.add_argument('--output', default=OUTPUT_PATH, help=f"Archivo Parquet de salida (por defecto: {OUTPUT_PATH}).")
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help=f"Filas por bloque (por defecto: {DEFAULT_CHUNKSIZE:,}).")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Procesos de scoring (por defecto: uno por CPU).")
+    args = parser.parse_args(argv)
+
+    print(f"--- Scoring por lotes: {args.input} ---")
+    rows, elapsed, summary, output_path = run(args.input, args.model, args.output, args.chunksize, args.workers)
+    print(f"{rows:,} filas puntuadas en {elapsed:.2f} s ({rows / elapsed if elapsed else 0:,.0f} filas/s, {args.workers} worker(s)).")
+    if summary is not None:
+        print("\nProbabilidad media de informalidad por periodo (ponderada):")
+        print(summary.round({'prob_media_ponderada': 4}).to_markdown())
+    print(f"\nProbabilidades guardadas en: {output_path}")
+
+
+if __name__ == '__main__':
+    main()
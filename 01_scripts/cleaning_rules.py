@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+# --- REGLAS DE LIMPIEZA ---
+# Una fila por código centinela: (columna, código, descripción). El código se reemplaza por NaN.
+SPECIAL_CODE_RULES = [
+    ('C208', 99, 'Edad: missing value'),
+    ('C301_DIA', 99, 'Fecha de nacimiento (día): missing value'),
+    ('C301_MES', 99, 'Fecha de nacimiento (mes): missing value'),
+    ('C301_ANIO', 9999, 'Fecha de nacimiento (año): missing value'),
+    ('C308_COD', 9999, 'Código de ocupación principal: missing value'),
+    ('C309_COD', 9999, 'Código de actividad económica: missing value'),
+    ('C317A', 9999, 'Personas en el centro de trabajo: missing value'),
+    ('C318_1', 99, 'Horas trabajadas (día 1): missing value'),
+    ('C318_2', 99, 'Horas trabajadas (día 2): missing value'),
+    ('C318_3', 99, 'Horas trabajadas (día 3): missing value'),
+    ('C318_4', 99, 'Horas trabajadas (día 4): missing value'),
+    ('C318_5', 99, 'Horas trabajadas (día 5): missing value'),
+    ('C318_6', 99, 'Horas trabajadas (día 6): missing value'),
+    ('C318_7', 99, 'Horas trabajadas (día 7): missing value'),
+    ('C318_T', 99, 'Horas trabajadas en la semana: missing value'),
+    ('C328_T', 99, 'Horas en ocupación secundaria: missing value'),
+    ('whoraT', 99, 'Horas totales de los ocupados: missing value'),
+    ('I339_1', 999999, 'Ingreso de la ocupación principal: tope sin dato'),
+    ('C341_T', 999999, 'Pago estimado en especies: missing value'),
+    ('C342', 999999, 'Ganancia neta de la ocupación principal: missing value'),
+    ('D344', 999999, 'Ingreso en especies (principal): tope sin dato'),
+    ('I345_1', 999999, 'Ingreso de la ocupación secundaria: tope sin dato'),
+    ('D347_T', 999999, 'Pago en especies (secundaria): tope sin dato'),
+    ('C348', 999999, 'Ganancia neta de la ocupación secundaria: missing value'),
+    ('D350', 999999, 'Ingreso en especies (secundaria): tope sin dato'),
+    ('INGTOT', 999999, 'Ingresos totales: tope sin dato'),
+    ('INGTOTP', 999999, 'Ingreso principal mensual: tope sin dato'),
+    ('INGTRABW', 999999, 'Ingreso laboral: tope sin dato'),
+]
+
+# El dashboard trata además el "NO SABE" de C312 como dato faltante.
+DASHBOARD_RULES = SPECIAL_CODE_RULES + [
+    ('C312', 4, 'Registro en SUNAT: NO SABE (solo dependientes)'),
+]
+
+
+def rule_columns(rules):
+    """Columns touched by a rules table, in first-appearance order."""
+    return list(dict.fromkeys(column for column, _, _ in rules))
+
+
+def _block_kind(series):
+    if pd.api.types.is_extension_array_dtype(series.dtype) and pd.api.types.is_integer_dtype(series.dtype):
+        return 'masked'
+    if pd.api.types.is_float_dtype(series.dtype) and not pd.api.types.is_extension_array_dtype(series.dtype):
+        return 'float'
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return 'other'
+    return 'object'
+
+
+def apply_rules(df, rules=SPECIAL_CODE_RULES):
+    """
+    Replaces every sentinel code in `rules` by NaN, in place and in one vectorized pass per dtype.
+
+    Rule columns that arrive as text are coerced to numbers first. Columns are then grouped by
+    dtype; each group is pulled into one NumPy block, compared against its sentinels in a single
+    broadcast, and written back (masked integers keep their dtype, with the sentinel cells
+    added to their NA mask). Returns the number of cells each rule matched, aligned with `rules`.
+    """
+    hits = np.zeros(len(rules), dtype=np.int64)
+    present = [col for col in rule_columns(rules) if col in df.columns]
+    for col in present:
+        if _block_kind(df[col]) == 'object':
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    groups = {}
+    for col in present:
+        groups.setdefault((_block_kind(df[col]), str(df[col].dtype)), []).append(col)
+
+    for (kind, dtype), columns in groups.items():
+        # Bloque (n_columnas, n_filas): cada columna queda contigua en memoria
+        if kind == 'masked':
+            na = np.stack([df[col].isna().to_numpy() for col in columns])
+            block = np.stack([df[col].to_numpy(dtype=df[col].dtype.numpy_dtype, na_value=0) for col in columns])
+        else:
+            block = np.stack([df[col].to_numpy(dtype='float64', na_value=np.nan) if kind == 'other' else df[col].to_numpy() for col in columns])
+            na = None
+
+        # Códigos como matriz (k, n_columnas) en el dtype del bloque; `valid` marca las celdas usadas,
+        # ya que no todas las columnas tienen el mismo número de reglas
+        rule_ids = [[i for i, (col, _, _) in enumerate(rules) if col == column] for column in columns]
+        depth = max(len(ids) for ids in rule_ids)
+        codes = np.zeros((depth, len(columns)), dtype=block.dtype)
+        valid = np.zeros((depth, len(columns)), dtype=bool)
+        limits = np.iinfo(block.dtype) if block.dtype.kind in 'iu' else None
+        for j, ids in enumerate(rule_ids):
+            for k, rule_id in enumerate(ids):
+                code = rules[rule_id][1]
+                if limits is None or limits.min <= code <= limits.max:  # un código fuera del rango del dtype no puede aparecer
+                    codes[k, j], valid[k, j] = code, True
+
+        matches = (block[None, :, :] == codes[:, :, None]) & valid[:, :, None]
+        if na is not None:
+            matches &= ~na[None, :, :]
+        counts = matches.sum(axis=2)
+        for j, ids in enumerate(rule_ids):
+            for k, rule_id in enumerate(ids):
+                hits[rule_id] += int(counts[k, j])
+
+        # Solo se reescriben las columnas con al menos un centinela
+        mask = matches.any(axis=0) if depth > 1 else matches[0]
+        for j in np.flatnonzero(counts.sum(axis=0)):
+            col = columns[j]
+            if kind == 'masked':
+                df[col] = pd.arrays.IntegerArray(block[j], na[j] | mask[j])
+            else:
+                values = block[j] if kind == 'float' else block[j].astype('float64', copy=False)
+                values[mask[j]] = np.nan
+                df[col] = values
+    return hits
+
+
+def rules_report(rules, hits):
+    """Table of rules with the number of cells each one cleaned."""
+    return pd.DataFrame(
+        [(col, code, description, int(n)) for (col, code, description), n in zip(rules, hits)],
+        columns=['Columna', 'Código', 'Descripción', 'Celdas reemplazadas']
+    )
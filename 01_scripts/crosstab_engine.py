@@ -0,0 +1,136 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from weighted_stats import WEIGHT_COLUMN, coded_quantiles, group_codes, normalize_table, weights_of
+
+# --- CONFIGURACIÓN ---
+# Normalizaciones que se calculan para cada tabla: nombre en los archivos -> argumento de normalize_table
+NORMALIZATIONS = {'pct_fila': 'index', 'pct_columna': 'columns', 'pct_total': 'all'}
+
+
+def encode_columns(df, columns):
+    """
+    Factorizes every column of `columns` once: {column: (codes, levels)}, with levels sorted and
+    code -1 for missing values. Tables and medians that share a column reuse its codes.
+    """
+    encoded = {}
+    for col in dict.fromkeys(columns):
+        codes, n_levels, labels = group_codes(df, col)
+        levels = labels(np.arange(n_levels)) if (codes >= 0).any() else pd.Index([], name=col)
+        encoded[col] = (codes, levels)
+    return encoded
+
+
+def _cell_codes(encoded, cols):
+    # Código combinado de varias columnas (-1 si alguna falta) y el número de celdas posibles
+    codes = np.zeros(len(encoded[cols[0]][0]), dtype=np.int64)
+    missing = np.zeros(len(codes), dtype=bool)
+    n_cells = 1
+    for col in cols:
+        col_codes, levels = encoded[col]
+        codes = codes * max(len(levels), 1) + col_codes
+        missing |= col_codes < 0
+        n_cells *= max(len(levels), 1)
+    codes[missing] = -1
+    return codes, n_cells
+
+
+def _labels(encoded, cols, ids):
+    if len(cols) == 1:
+        return encoded[cols[0]][1].take(ids)
+    sizes = [max(len(encoded[col][1]), 1) for col in cols]
+    positions = np.unravel_index(ids, sizes)
+    return pd.MultiIndex.from_arrays([encoded[col][1].take(pos) for col, pos in zip(cols, positions)], names=cols)
+
+
+def crosstab_pass(df, tables=None, medians=None, weight=WEIGHT_COLUMN):
+    """
+    Computes every requested two-way table and group median of `df` in one vectorized pass.
+
+    `tables` maps a name to an (index, columns) pair of columns and `medians` maps a name to a
+    (value, by) pair, `by` being a column or a list of columns. Each column is factorized once;
+    the cells of all tables are laid out in one shared code space and counted with a single
+    weighted np.bincount (plus an unweighted one, to drop the rows and columns without
+    observations as pd.crosstab does), and all the medians come from one sort of (group, value).
+
+    Returns {'tablas': {name: {'total': weighted totals, 'pct_fila', 'pct_columna', 'pct_total'}},
+    'medianas': {name: Series of weighted medians}}.
+    """
+    tables = tables or {}
+    medians = medians or {}
+    median_by = {name: [by] if isinstance(by, str) else list(by) for name, (_, by) in medians.items()}
+    needed = [col for pair in tables.values() for col in pair] + [col for by in median_by.values() for col in by]
+    encoded = encode_columns(df, needed)
+    w = weights_of(df, weight)
+
+    # Todas las tablas en un solo bincount: cada una ocupa un bloque de códigos a partir de su offset
+    layout, codes, weights, offset = {}, [], [], 0
+    for name, (index, columns) in tables.items():
+        cells, n_cells = _cell_codes(encoded, [index, columns])
+        valid = cells >= 0
+        codes.append(cells[valid] + offset)
+        weights.append(w[valid])
+        layout[name] = (offset, index, columns)
+        offset += n_cells
+    result = {'tablas': {}, 'medianas': {}}
+    if tables:
+        codes, weights = np.concatenate(codes), np.concatenate(weights)
+        totals = np.bincount(codes, weights=weights, minlength=offset)
+        counts = np.bincount(codes, minlength=offset)
+        for name, (start, index, columns) in layout.items():
+            rows, cols = encoded[index][1], encoded[columns][1]
+            shape = (max(len(rows), 1), max(len(cols), 1))
+            block = totals[start:start + shape[0] * shape[1]].reshape(shape)
+            seen = counts[start:start + shape[0] * shape[1]].reshape(shape)
+            keep_rows, keep_cols = seen.any(axis=1), seen.any(axis=0)
+            total = pd.DataFrame(
+                block[np.ix_(keep_rows, keep_cols)],
+                index=rows[keep_rows[:len(rows)]],
+                columns=pd.Index(cols[keep_cols[:len(cols)]], name=columns)
+            )
+            result['tablas'][name] = {'total': total}
+            result['tablas'][name].update({suffix: normalize_table(total, how) for suffix, how in NORMALIZATIONS.items()})
+
+    # Todas las medianas en un solo ordenamiento: cada pedido desplaza sus códigos de grupo
+    if medians:
+        codes, values, weights, starts, offset = [], [], [], {}, 0
+        for name, (value, _) in medians.items():
+            groups, n_groups = _cell_codes(encoded, median_by[name])
+            codes.append(np.where(groups >= 0, groups + offset, -1))
+            values.append(pd.to_numeric(df[value], errors='coerce').to_numpy(dtype='float64', na_value=np.nan))
+            weights.append(w)
+            starts[name] = (offset, n_groups)
+            offset += n_groups
+        ids, found = coded_quantiles(np.concatenate(codes), np.concatenate(values), np.concatenate(weights), [0.5])
+        for name, (value, _) in medians.items():
+            start, n_groups = starts[name]
+            mine = (ids >= start) & (ids < start + n_groups)
+            result['medianas'][name] = pd.Series(found[mine, 0], index=_labels(encoded, median_by[name], ids[mine] - start), name=value)
+    return result
+
+
+def _write_csv(frame, path):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    frame.to_csv(tmp_path, encoding='utf-8')
+    os.replace(tmp_path, path)
+
+
+def export_tables(result, tables_dir):
+    """
+    Writes the output of crosstab_pass as CSV files: '{name}.csv' with the weighted totals and
+    '{name}_{normalization}.csv' for each share, plus '{name}.csv' for each median. Returns the paths.
+    """
+    os.makedirs(tables_dir, exist_ok=True)
+    paths = []
+    for name, variants in result['tablas'].items():
+        for variant, table in variants.items():
+            path = os.path.join(tables_dir, f"{name}.csv" if variant == 'total' else f"{name}_{variant}.csv")
+            _write_csv(table, path)
+            paths.append(path)
+    for name, series in result['medianas'].items():
+        path = os.path.join(tables_dir, f"{name}.csv")
+        _write_csv(series.to_frame('mediana_ponderada'), path)
+        paths.append(path)
+    return paths
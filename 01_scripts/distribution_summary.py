@@ -0,0 +1,369 @@
+import json
+
+import numpy as np
+
+from quantiles import digest_quantiles, merge_digests
+
+# --- CONFIGURACIÓN ---
+DEFAULT_BINS = 50
+# Estados combinables (modo streaming): valores distintos que se cuentan exactamente; por encima de
+# ese número solo queda un t-digest de ~STATE_COMPRESSION/2 centroides
+STATE_MAX_DISTINCT = 4096
+STATE_COMPRESSION = 2000
+KDE_GRIDSIZE = 200
+KDE_FINE_BINS = 1024
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+# Tope de outliers que se guardan para dibujar el boxplot; por encima se guardan cuantiles de los outliers
+MAX_FLIERS = 500
+
+
+def _as_sorted(values):
+    values = np.asarray(values, dtype='float64')
+    return np.sort(values[np.isfinite(values)])
+
+
+def _counts(sorted_values, edges):
+    """Histogram counts of already-sorted values (np.histogram semantics: last bin is closed)."""
+    positions = np.searchsorted(sorted_values, edges[:-1], side='left')
+    positions = np.append(positions, np.searchsorted(sorted_values, edges[-1], side='right'))
+    return np.diff(positions)
+
+
+def _kde(sorted_values, lo, hi, bins, transform=None):
+    """
+    Gaussian KDE (Scott's bandwidth) evaluated from a fine histogram of the values instead of every
+    point, scaled to the counts of a `bins`-bin histogram over [lo, hi]. With `transform` (e.g. log10)
+    the density is estimated in the transformed space and the grid is returned in original units.
+    """
+    values = sorted_values if transform is None else transform(sorted_values)
+    if len(values) < 2:
+        return None
+    fine_edges = np.linspace(values[0], values[-1], KDE_FINE_BINS + 1)
+    return _binned_kde(fine_edges, _counts(values, fine_edges), values.std(ddof=1), lo, hi, bins, transform)
+
+
+def _binned_kde(fine_edges, fine_counts, std, lo, hi, bins, transform=None):
+    # KDE de un histograma fino (bordes en el espacio transformado), escalada a `bins` bins sobre [lo, hi]
+    n = fine_counts.sum()
+    lo_t, hi_t = (lo, hi) if transform is None else (transform(lo), transform(hi))
+    if n < 2 or hi_t <= lo_t:
+        return None
+    bandwidth = std * n ** (-1 / 5)
+    if not bandwidth > 0:
+        return None
+    centers = (fine_edges[:-1] + fine_edges[1:]) / 2
+    grid = np.linspace(lo_t, hi_t, KDE_GRIDSIZE)
+    kernel = np.exp(-0.5 * ((grid[:, None] - centers[None, :]) / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    density = kernel @ fine_counts / n
+    y = density * n * (hi_t - lo_t) / bins
+    x = grid if transform is None else 10 ** grid
+    return x.tolist(), y.tolist()
+
+
+def _histogram(sorted_values, edges, kde_range=None, bins=DEFAULT_BINS, transform=None):
+    hist = {'edges': edges.tolist(), 'counts': _counts(sorted_values, edges).tolist()}
+    if kde_range is not None:
+        hist['kde'] = _kde(sorted_values, kde_range[0], kde_range[1], bins, transform)
+    return hist
+
+
+def _box(sorted_values, q1, med, q3, mean):
+    iqr = q3 - q1
+    lower, upper = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+    lo_idx = np.searchsorted(sorted_values, lower, side='left')
+    hi_idx = np.searchsorted(sorted_values, upper, side='right')
+    inside = sorted_values[lo_idx:hi_idx]
+    fliers = np.concatenate([sorted_values[:lo_idx], sorted_values[hi_idx:]])
+    if len(fliers) > MAX_FLIERS:
+        fliers = np.quantile(fliers, np.linspace(0, 1, MAX_FLIERS))
+    return {
+        'q1': q1, 'med': med, 'q3': q3, 'mean': mean, 'iqr': iqr, 'threshold': upper,
+        'whislo': float(inside[0]) if len(inside) else q1, 'whishi': float(inside[-1]) if len(inside) else q3,
+        'n_fliers': int(lo_idx + len(sorted_values) - hi_idx), 'fliers': fliers.tolist()
+    }
+
+
+def summarize(values, bins=DEFAULT_BINS, kde=True, zoom_max=None):
+    """
+    Summarizes one variable in a single pass over its sorted values.
+
+    Returns a JSON-serializable dict with the count, moments, quantiles, boxplot statistics and
+    three histograms: 'linear' (full range), 'log' (log-spaced bins over the positive values) and
+    'zoom' (up to `zoom_max`, by default the Q3 + 1.5*IQR outlier threshold). Each histogram
+    carries a binned KDE scaled to its counts when `kde` is true. Plotting from this summary costs
+    the same whatever the sample size.
+    """
+    sorted_values = _as_sorted(values)
+    n = len(sorted_values)
+    summary = {'n': n, 'bins': bins, 'quantiles': {}, 'histograms': {}}
+    if n == 0:
+        return summary
+    qs = np.quantile(sorted_values, QUANTILES)
+    summary['quantiles'] = {str(q): float(v) for q, v in zip(QUANTILES, qs)}
+    lo, hi = float(sorted_values[0]), float(sorted_values[-1])
+    mean = float(sorted_values.mean())
+    summary.update(min=lo, max=hi, mean=mean, std=float(sorted_values.std(ddof=1)) if n > 1 else 0.0)
+    q1, med, q3 = (summary['quantiles'][q] for q in ('0.25', '0.5', '0.75'))
+    summary['box'] = _box(sorted_values, q1, med, q3, mean)
+
+    linear_edges = np.linspace(lo, hi, bins + 1) if hi > lo else np.array([lo - 0.5, lo + 0.5])
+    summary['histograms']['linear'] = _histogram(sorted_values, linear_edges, (lo, hi) if kde else None, bins)
+
+    positive = sorted_values[np.searchsorted(sorted_values, 0, side='right'):]
+    if len(positive) and positive[-1] > positive[0]:
+        log_edges = np.logspace(np.log10(positive[0]), np.log10(positive[-1]), bins + 1)
+        log_range = (float(positive[0]), float(positive[-1])) if kde else None
+        summary['histograms']['log'] = _histogram(positive, log_edges, log_range, bins, transform=np.log10)
+
+    zoom_max = summary['box']['threshold'] if zoom_max is None else zoom_max
+    zoomed = sorted_values[:np.searchsorted(sorted_values, zoom_max, side='right')]
+    if len(zoomed) and zoomed[-1] > zoomed[0]:
+        zoom_edges = np.linspace(zoomed[0], zoomed[-1], bins + 1)
+        zoom_range = (float(zoomed[0]), float(zoomed[-1])) if kde else None
+        summary['histograms']['zoom'] = _histogram(zoomed, zoom_edges, zoom_range, bins)
+        summary['histograms']['zoom']['max'] = float(zoom_max)
+    return summary
+
+
+def summarize_groups(df, value, by, bins=DEFAULT_BINS, kde=False):
+    """Summaries of `value` for every combination of the `by` columns, keyed by the group labels joined with ' | '."""
+    by = [by] if isinstance(by, str) else list(by)
+    summaries = {}
+    for key, group in df.groupby(by, observed=True, sort=False)[value]:
+        key = key if isinstance(key, tuple) else (key,)
+        summaries[' | '.join(str(k) for k in key)] = summarize(group.to_numpy(), bins=bins, kde=kde)
+    return summaries
+
+
+def _moments(values):
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return {'n': 0, 'mean': 0.0, 'm2': 0.0, 'min': np.inf, 'max': -np.inf}
+    mean = float(values.mean())
+    return {'n': len(values), 'mean': mean, 'm2': float(((values - mean) ** 2).sum()), 'min': float(values.min()), 'max': float(values.max())}
+
+
+def _merge_moments(a, b):
+    # Fórmula de Chan et al.: media y suma de cuadrados centrados de la unión de dos bloques
+    n = a['n'] + b['n']
+    if not n:
+        return dict(a)
+    delta = b['mean'] - a['mean']
+    return {
+        'n': n, 'mean': a['mean'] + delta * b['n'] / n, 'm2': a['m2'] + b['m2'] + delta ** 2 * a['n'] * b['n'] / n,
+        'min': min(a['min'], b['min']), 'max': max(a['max'], b['max'])
+    }
+
+
+def _merge_distinct(a, b):
+    if a is None or b is None:
+        return None
+    values, inverse = np.unique(np.r_[a[0], b[0]], return_inverse=True)
+    if len(values) > STATE_MAX_DISTINCT:
+        return None
+    return values, np.bincount(inverse, weights=np.r_[a[1], b[1]]).astype(np.int64)
+
+
+def summary_state(values, compression=STATE_COMPRESSION):
+    """
+    Mergeable state of one block of values (see merge_states and summarize_state): exact moments
+    of the values and of log10 of the positive ones, a t-digest of the values and, while there
+    are at most STATE_MAX_DISTINCT of them, the count of every distinct value. Streaming runs keep
+    one state per variable instead of the values themselves.
+    """
+    values = np.asarray(values, dtype='float64')
+    values = values[np.isfinite(values)]
+    digest = None
+    if len(values):
+        digest = merge_digests([{
+            'means': values.tolist(), 'weights': [1.0] * len(values), 'min': float(values.min()), 'max': float(values.max()),
+            'weight': float(len(values)), 'n': len(values)
+        }], compression)
+    distinct = np.unique(values, return_counts=True)
+    return {
+        'moments': _moments(values), 'log_moments': _moments(np.log10(values[values > 0])), 'digest': digest,
+        'distinct': distinct if len(distinct[0]) <= STATE_MAX_DISTINCT else None
+    }
+
+
+def merge_states(a, b, compression=STATE_COMPRESSION):
+    """Combines the states of two blocks of the same variable."""
+    return {
+        'moments': _merge_moments(a['moments'], b['moments']),
+        'log_moments': _merge_moments(a['log_moments'], b['log_moments']),
+        'digest': merge_digests([d for d in (a['digest'], b['digest']) if d], compression),
+        'distinct': _merge_distinct(a['distinct'], b['distinct'])
+    }
+
+
+def dump_state(state):
+    """JSON-serializable copy of a state, e.g. to store it with a partition."""
+    distinct = state['distinct']
+    return dict(state, distinct=None if distinct is None else [distinct[0].tolist(), distinct[1].tolist()])
+
+
+def load_state(data):
+    """Inverse of dump_state."""
+    distinct = data['distinct']
+    return dict(data, distinct=None if distinct is None else (np.asarray(distinct[0], dtype='float64'), np.asarray(distinct[1], dtype=np.int64)))
+
+
+def _std(moments):
+    return float(np.sqrt(moments['m2'] / (moments['n'] - 1))) if moments['n'] > 1 else 0.0
+
+
+def _distinct_view(values, counts):
+    # Vista exacta de los valores ordenados a partir de sus conteos, sin materializarlos
+    cum = np.r_[0, np.cumsum(counts)]
+    n = int(cum[-1])
+
+    def below(x, strict):
+        return cum[np.searchsorted(values, x, side='left' if strict else 'right')].astype('float64')
+
+    def quantile(q):
+        # Interpolación lineal de np.quantile sobre la posición (n - 1) * q
+        h = (n - 1) * np.asarray(q, dtype='float64')
+        i = np.floor(h)
+        lo = values[np.searchsorted(cum, i, side='right') - 1]
+        hi = values[np.searchsorted(cum, np.minimum(i + 1, n - 1), side='right') - 1]
+        return lo + (h - i) * (hi - lo)
+
+    def tail(lo_x, hi_x):
+        # Valores y conteos en [lo_x, hi_x]
+        keep = (values >= lo_x) & (values <= hi_x)
+        return values[keep], counts[keep]
+
+    return below, quantile, tail
+
+
+def _digest_view(digest, n, lo, hi):
+    # Vista aproximada: CDF del t-digest interpolada entre centroides, anclada en el mínimo y el máximo
+    means, weights = np.asarray(digest['means']), np.asarray(digest['weights'])
+    knots = np.r_[lo, means, hi]
+    ranks = np.r_[0.0, np.cumsum(weights) - weights / 2, weights.sum()] / weights.sum()
+
+    def below(x, strict):
+        # Redondeado para que los conteos de un histograma sean enteros y sumen n
+        return np.rint(np.interp(np.nextafter(x, -np.inf) if strict else x, knots, ranks) * n)
+
+    def quantile(q):
+        return digest_quantiles(digest, q)
+
+    def tail(lo_x, hi_x):
+        keep = (means >= lo_x) & (means <= hi_x)
+        return means[keep], weights[keep]
+
+    return below, quantile, tail
+
+
+def _weighted_std(values, weights):
+    n = weights.sum()
+    if n < 2:
+        return 0.0
+    mean = np.average(values, weights=weights)
+    return float(np.sqrt((weights * (values - mean) ** 2).sum() / (n - 1)))
+
+
+def summarize_state(state, bins=DEFAULT_BINS, kde=True, zoom_max=None):
+    """
+    Same summary as summarize, from a mergeable state. Count, min, max, mean and standard deviation
+    are always exact; so is the rest while the state still counts its distinct values. Otherwise
+    quantiles, histogram counts, KDE and boxplot fliers come from the t-digest's CDF.
+    """
+    moments = state['moments']
+    n = moments['n']
+    summary = {'n': n, 'bins': bins, 'quantiles': {}, 'histograms': {}}
+    if n == 0:
+        return summary
+    lo, hi = moments['min'], moments['max']
+    exact = state['distinct'] is not None
+    below, quantile, tail = _distinct_view(*state['distinct']) if exact else _digest_view(state['digest'], n, lo, hi)
+
+    def counts(edges, below=below):
+        # Semántica de np.histogram: bins [a, b) y el último cerrado
+        return np.diff(np.r_[below(edges[:-1], True), below(edges[-1], False)]).astype(np.int64)
+
+    def histogram(edges, kde_range, std, transform=None):
+        hist = {'edges': edges.tolist(), 'counts': counts(edges).tolist()}
+        if kde_range is not None:
+            # El histograma fino es regular en el espacio transformado, como en summarize
+            fine_t = np.linspace(*(edges[[0, -1]] if transform is None else transform(edges[[0, -1]])), KDE_FINE_BINS + 1)
+            if transform is None:
+                fine_counts = counts(fine_t)
+            elif exact:
+                # Conteo sobre los valores transformados, para que los empates en un borde caigan igual que en summarize
+                values, value_counts = tail(np.nextafter(0.0, np.inf), np.inf)
+                fine_counts = counts(fine_t, _distinct_view(transform(values), value_counts)[0])
+            else:
+                fine_counts = counts(10 ** fine_t)
+            hist['kde'] = _binned_kde(fine_t, fine_counts, std, kde_range[0], kde_range[1], bins, transform)
+        return hist
+
+    qs = quantile(np.asarray(QUANTILES))
+    summary['quantiles'] = {str(q): float(v) for q, v in zip(QUANTILES, qs)}
+    summary.update(min=lo, max=hi, mean=moments['mean'], std=_std(moments))
+    q1, med, q3 = (summary['quantiles'][q] for q in ('0.25', '0.5', '0.75'))
+    iqr = q3 - q1
+    lower, upper = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+    n_low, n_high = int(below(lower, True)), int(n - below(upper, False))
+    inside, _ = tail(lower, upper)
+    fliers = np.array([])
+    if n_low + n_high:
+        low_values, low_counts = tail(-np.inf, np.nextafter(lower, -np.inf))
+        high_values, high_counts = tail(np.nextafter(upper, np.inf), np.inf)
+        values, weights = np.r_[low_values, high_values], np.r_[low_counts, high_counts]
+        if exact and n_low + n_high <= MAX_FLIERS:
+            fliers = np.repeat(values, weights.astype(np.int64))
+        elif exact:
+            fliers = _distinct_view(values, weights.astype(np.int64))[1](np.linspace(0, 1, MAX_FLIERS))
+        else:
+            # Outliers representativos: cuantiles de cada cola, en proporción a su tamaño
+            keep = min(n_low + n_high, MAX_FLIERS)
+            keep_low = round(keep * n_low / (n_low + n_high))
+            fliers = np.r_[quantile(np.linspace(0, n_low / n, keep_low)), quantile(np.linspace(1 - n_high / n, 1, keep - keep_low))]
+    summary['box'] = {
+        'q1': q1, 'med': med, 'q3': q3, 'mean': moments['mean'], 'iqr': iqr, 'threshold': upper,
+        'whislo': float(inside[0]) if exact and len(inside) else max(lo, lower) if len(inside) else q1,
+        'whishi': float(inside[-1]) if exact and len(inside) else min(hi, upper) if len(inside) else q3,
+        'n_fliers': n_low + n_high, 'fliers': np.asarray(fliers, dtype='float64').tolist()
+    }
+
+    linear_edges = np.linspace(lo, hi, bins + 1) if hi > lo else np.array([lo - 0.5, lo + 0.5])
+    summary['histograms']['linear'] = histogram(linear_edges, (lo, hi) if kde else None, summary['std'])
+
+    log_moments = state['log_moments']
+    if log_moments['n'] and log_moments['max'] > log_moments['min']:
+        p_lo, p_hi = 10 ** log_moments['min'], 10 ** log_moments['max']
+        log_edges = np.logspace(log_moments['min'], log_moments['max'], bins + 1)
+        summary['histograms']['log'] = histogram(log_edges, (p_lo, p_hi) if kde else None, _std(log_moments), transform=np.log10)
+
+    zoom_max = upper if zoom_max is None else zoom_max
+    zoom_values, zoom_weights = tail(-np.inf, zoom_max)
+    z_hi = float(zoom_values[-1]) if exact and len(zoom_values) else min(hi, zoom_max)
+    if z_hi > lo:
+        # Desviación de la parte acotada: exacta con los conteos, aproximada con los centroides del digest
+        zoom_edges = np.linspace(lo, z_hi, bins + 1)
+        summary['histograms']['zoom'] = histogram(zoom_edges, (lo, z_hi) if kde else None, _weighted_std(zoom_values, zoom_weights))
+        summary['histograms']['zoom']['max'] = float(zoom_max)
+    return summary
+
+
+def box_stats(summary, label=''):
+    """Converts a summary into the dict expected by matplotlib's Axes.bxp."""
+    box = summary['box']
+    return {
+        'label': label, 'med': box['med'], 'q1': box['q1'], 'q3': box['q3'], 'mean': box['mean'],
+        'whislo': box['whislo'], 'whishi': box['whishi'], 'fliers': np.asarray(box['fliers'])
+    }
+
+
+def save_summaries(path, summaries):
+    """Persists a {name: summary} mapping as JSON."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summaries, f, ensure_ascii=False)
+
+
+def load_summaries(path):
+    """Reads summaries saved with save_summaries."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -1,26 +1,33 @@
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
+import argparse
+import html
 import os
-from datetime import datetime
-
-# Get current timestamp for filenames
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+import re
+import shutil
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
 
-# Define paths
-data_path = '02_data_processed/datos_limpios_poblacion_trabajo.csv'
-output_dir = '03_cleaning_evidence/'
-report_path = '04_reports/analisis_exploratorio_detallado.md'
+import numpy as np
+import pandas as pd
 
-# Create output directory if it doesn't exist
-os.makedirs(output_dir, exist_ok=True)
-os.makedirs('04_reports', exist_ok=True)
+from crosstab_engine import crosstab_pass, export_tables
+from distribution_summary import save_summaries, summarize_groups
+from evidence import boxplot_job, crosstab_job, render_jobs
+from weighted_stats import group_codes
 
-# Load data
-df = pd.read_csv(data_path)
+# --- CONFIGURACIÓN ---
+DATA_PATH = '02_data_processed/datos_limpios_poblacion_trabajo.csv'
+OUTPUT_DIR = '03_cleaning_evidence/'
+REPORT_PATH = '04_reports/analisis_exploratorio_detallado.md'
+# Subdirectorio (dentro del de las figuras) con las tablas exportadas
+TABLES_SUBDIR = 'tablas_eda'
+# Modo por segmentos: columnas por defecto, subdirectorio y tamaño mínimo de un segmento
+DEFAULT_SEGMENTS = ['REGION', 'periodo']
+SEGMENTS_SUBDIR = 'segmentos'
+MIN_SEGMENT_ROWS = 30
 
 # Define label mappings
-label_map = {
+LABEL_MAP = {
     'C207': 'Sexo',
     'C310': 'Tipo de Ocupación',
     'C366': 'Nivel Educativo',
@@ -30,82 +37,277 @@ label_map = {
     'INGTOT': 'Ingreso Total Mensual (S/.)',
     'whoraT': 'Horas Trabajadas por Semana'
 }
+INCOME = 'Ingreso Total Mensual (S/.)'
+HOURS = 'Horas Trabajadas por Semana'
+
+# Tablas de contingencia del EDA: nombre -> (filas, columnas)
+EDA_TABLES = {
+    'ocupacion_por_sexo': ('Tipo de Ocupación', 'Sexo'),
+    'ocupacion_por_nivel_educativo': ('Nivel Educativo', 'Tipo de Ocupación'),
+    'informalidad_por_etnia': ('Autoidentificación Étnica', 'Condición Laboral (Informalidad)'),
+}
+# Medianas ponderadas por grupo: nombre -> (variable, grupos)
+EDA_MEDIANS = {
+    'mediana_ingreso_por_educacion_sexo': (INCOME, ['Nivel Educativo', 'Sexo']),
+    'mediana_horas_por_tipo_ocupacion': (HOURS, 'Tipo de Ocupación'),
+}
+
+
+def load_data(data_path=DATA_PATH):
+    """Reads the processed employed population with readable column names and numeric hours and income."""
+    df = pd.read_csv(data_path, low_memory=False)
+    # Rename columns for easier use
+    df = df.rename(columns=LABEL_MAP)
+    # Convert hours to numeric, coercing errors
+    df[HOURS] = pd.to_numeric(df[HOURS], errors='coerce')
+    df = df.dropna(subset=[HOURS])
+    df[INCOME] = pd.to_numeric(df[INCOME], errors='coerce')
+    return df
+
+
+def eda_jobs(df, output_dir=OUTPUT_DIR):
+    """
+    Computes the EDA tables of `df`, exports them to `output_dir` and returns the figure jobs
+    (see evidence.render_jobs) with the table paths; nothing is drawn here.
+
+    Every crosstab (weighted by the expansion factor, so they estimate population totals and
+    shares), its row/column normalizations and the group medians come from one crosstab_pass;
+    the box plots are drawn from per-group summaries. Figures without data are not queued.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = []
+    result = crosstab_pass(df, EDA_TABLES, EDA_MEDIANS)
+    tablas = result['tablas']
+
+    # --- Analysis 1: Occupation Type by Sex ---
+    ocupacion_sexo = tablas['ocupacion_por_sexo']['total']
+    ocupacion_sexo = ocupacion_sexo.loc[ocupacion_sexo.sum(axis=1).sort_values(ascending=False).index]
+    if not ocupacion_sexo.empty:
+        jobs.append(crosstab_job(
+            ocupacion_sexo, output_dir, 'ocupacion_por_sexo', 'Distribución de Tipos de Ocupación por Sexo',
+            'Población estimada (ponderada)', 'Tipo de Ocupación', {'title': 'Sexo'}, invert_yaxis=True, width=0.8
+        ))
+
+    # --- Analysis 2: Occupation by Education Level ---
+    occupation_education_perc = tablas['ocupacion_por_nivel_educativo']['pct_fila']
+    if not occupation_education_perc.empty:
+        jobs.append(crosstab_job(
+            occupation_education_perc, output_dir, 'ocupacion_por_nivel_educativo',
+            'Distribución Porcentual de Ocupación por Nivel Educativo', 'Proporción', 'Nivel Educativo',
+            {'title': 'Tipo de Ocupación', 'bbox_to_anchor': (1.05, 1), 'loc': 'upper left'},
+            figsize=(14, 10), stacked=True, colormap='viridis'
+        ))
+
+    # --- Analysis 3: Labor Informality by Ethnicity ---
+    informality_ethnicity_perc = tablas['informalidad_por_etnia']['pct_fila']
+    if not informality_ethnicity_perc.empty:
+        jobs.append(crosstab_job(
+            informality_ethnicity_perc, output_dir, 'informalidad_por_etnia',
+            'Tasa de Informalidad Laboral por Autoidentificación Étnica', 'Proporción', 'Autoidentificación Étnica',
+            {'title': 'Condición Laboral', 'labels': ['Formal', 'Informal'], 'bbox_to_anchor': (1.05, 1), 'loc': 'upper left'},
+            stacked=True, colormap='coolwarm'
+        ))
+
+    # --- Analysis 4: Income Distribution by Education Level and Sex ---
+    # Box plots are drawn from per-group summaries, so their cost does not grow with the sample size
+    ingreso_resumen = summarize_groups(df, INCOME, ['Nivel Educativo', 'Sexo'])
+    niveles = list(df['Nivel Educativo'].dropna().unique())
+    sexos = list(df['Sexo'].dropna().unique())
+    if any(summary['n'] for summary in ingreso_resumen.values()):
+        jobs.append(boxplot_job(
+            ingreso_resumen, niveles, output_dir, 'ingreso_por_educacion_sexo', 'Distribución del Ingreso por Nivel Educativo y Sexo',
+            'Ingreso Total Mensual (S/.) (Escala Logarítmica)', 'Nivel Educativo', hues=sexos, legend_title='Sexo',
+            xscale='log', figsize=(16, 10)
+        ))
+
+    # --- Analysis 5: Working Hours by Occupation Type ---
+    horas_resumen = summarize_groups(df, HOURS, 'Tipo de Ocupación')
+    # Orden por la mediana ponderada publicada en la tabla (los grupos sin ella van al final)
+    medianas_horas = result['medianas']['mediana_horas_por_tipo_ocupacion'].dropna()
+    ocupaciones = sorted(horas_resumen, key=lambda ocupacion: (ocupacion not in medianas_horas, medianas_horas.get(ocupacion, 0.0)))
+    if ocupaciones:
+        jobs.append(boxplot_job(
+            horas_resumen, ocupaciones, output_dir, 'horas_por_tipo_ocupacion',
+            'Distribución de Horas Trabajadas por Semana según Tipo de Ocupación', 'Horas Trabajadas por Semana', 'Tipo de Ocupación'
+        ))
+
+    # Persist the summaries behind the box plots and the tables behind every figure
+    save_summaries(os.path.join(output_dir, 'resumen_boxplots_eda.json'),
+                   {'ingreso_por_educacion_sexo': ingreso_resumen, 'horas_por_tipo_ocupacion': horas_resumen})
+    table_paths = export_tables(result, os.path.join(output_dir, TABLES_SUBDIR))
+    return jobs, table_paths
+
+
+def run_eda(df, output_dir=OUTPUT_DIR, workers=None):
+    """
+    EDA of the whole of `df`: exports its tables and draws the figures not drawn yet (in a process
+    pool of `workers`), registering them in the artifact index of `output_dir`.
+    Returns ({figure name: path}, [table paths]).
+    """
+    jobs, table_paths = eda_jobs(df, output_dir)
+    print(f"Saved: {len(table_paths)} tables in {os.path.join(output_dir, TABLES_SUBDIR)}")
+    rendered, reused = render_jobs(jobs, workers)
+    print(f"Figures: {len(rendered)} rendered, {len(reused)} unchanged, in {output_dir}")
+    return {job['name']: job['file'] for job in jobs}, table_paths
+
+
+def _slug(text):
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-') or 'na'
+
+
+def partition(df, by):
+    """
+    Splits `df` into its `by` segments with one sort of the combined group codes (rows with a
+    missing segment value are left out). Yields ({column: value}, segment frame).
+    """
+    codes, _, labels = group_codes(df, by)
+    order = np.argsort(codes, kind='stable')
+    order = order[codes[order] >= 0]
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) if len(order) else np.array([], dtype=int)
+    ends = np.r_[starts[1:], len(order)]
+    keys = labels(sorted_codes[starts]) if len(order) else []
+    for key, start, end in zip(keys, starts, ends):
+        key = key if isinstance(key, tuple) else (key,)
+        yield dict(zip(by, key)), df.iloc[order[start:end]]
+
+
+def segment_tables(task):
+    """Worker: computes and exports one segment's tables and returns its figure jobs."""
+    segment, df, segment_dir = task
+    started = time.perf_counter()
+    jobs, table_paths = eda_jobs(df, segment_dir)
+    return {'segment': segment, 'rows': len(df), 'dir': segment_dir, 'jobs': jobs, 'tables': table_paths,
+            'seconds': time.perf_counter() - started}
+
+
+def write_segment_index(path, by, results, skipped, timings, workers):
+    """Writes an HTML page linking every segment's figures and tables, with the runtime report."""
+    root = os.path.dirname(path)
+    rows = []
+    for result in results:
+        figures = ' '.join(
+            f'<a href="{html.escape(os.path.relpath(job["file"], root))}">{html.escape(job["name"])}</a>' for job in result['jobs']
+        )
+        tables = html.escape(os.path.relpath(os.path.join(result['dir'], TABLES_SUBDIR), root))
+        cells = ''.join(f"<td>{html.escape(str(result['segment'][col]))}</td>" for col in by)
+        rows.append(f"<tr>{cells}<td>{result['rows']:,}</td><td>{figures}</td><td><a href=\"{tables}/\">tablas</a></td></tr>")
+    header = ''.join(f"<th>{html.escape(col)}</th>" for col in by)
+    timing_items = ''.join(f"<li>{html.escape(stage)}: {seconds:.2f} s</li>" for stage, seconds in timings.items())
+    skipped_note = ''
+    if skipped:
+        listed = ', '.join(' / '.join(str(v) for v in segment.values()) for segment, _ in skipped)
+        skipped_note = f"<p>Segmentos omitidos (menos de {MIN_SEGMENT_ROWS} filas): {html.escape(listed)}</p>"
+    content = f"""<!DOCTYPE html>
+<html lang="es">
+<head>
+<meta charset="utf-8">
+<title>EDA por segmento</title>
+</head>
+<body>
+<h1>Análisis exploratorio por {html.escape(' × '.join(by))}</h1>
+<p>{len(results)} segmentos, {sum(r['rows'] for r in results):,} filas, {workers} worker(s).</p>
+<ul>{timing_items}</ul>
+{skipped_note}
+<table>
+<thead><tr>{header}<th>Filas</th><th>Figuras</th><th>Tablas</th></tr></thead>
+<tbody>
+{chr(10).join(rows)}
+</tbody>
+</table>
+</body>
+</html>
+"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def prune_segments(output_dir, keep):
+    """Deletes the segment directories of `output_dir` not in `keep` (left by earlier runs); returns their names."""
+    removed = []
+    for name in sorted(os.listdir(output_dir)):
+        path = os.path.join(output_dir, name)
+        if name not in keep and os.path.isdir(path):
+            shutil.rmtree(path)
+            removed.append(name)
+    return removed
+
+
+def run_segments(df, by, output_dir, workers=None):
+    """
+    EDA fan-out: the same tables and figures as run_eda for every `by` segment of `df`.
+
+    The data is partitioned once; the segments' tables are computed and exported in a process
+    pool, then every segment's figures are rendered together in a second pool (only those not
+    drawn yet). Each segment gets its own directory under `output_dir`, and 'index.html' links
+    them all; directories of segments the new index does not list (other `by` columns, segments
+    gone or now below MIN_SEGMENT_ROWS) are deleted. Returns the per-stage timings in seconds.
+    """
+    workers = workers or os.cpu_count() or 1
+    timings = {}
+    started = time.perf_counter()
+    tasks, skipped = [], []
+    for segment, segment_df in partition(df, by):
+        if len(segment_df) < MIN_SEGMENT_ROWS:
+            skipped.append((segment, len(segment_df)))
+            continue
+        name = '__'.join(f"{_slug(col)}_{_slug(value)}" for col, value in segment.items())
+        tasks.append((segment, segment_df, os.path.join(output_dir, name)))
+    timings['Partición'] = time.perf_counter() - started
+
+    stage = time.perf_counter()
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            results = list(pool.map(segment_tables, tasks))
+    else:
+        results = [segment_tables(task) for task in tasks]
+    timings['Tablas'] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    rendered, reused = render_jobs([job for result in results for job in result['jobs']], workers)
+    timings['Figuras'] = time.perf_counter() - stage
+    timings['Total'] = time.perf_counter() - started
+
+    write_segment_index(os.path.join(output_dir, 'index.html'), by, results, skipped, timings, workers)
+    removed = prune_segments(output_dir, {os.path.basename(result['dir']) for result in results})
+    print(f"{len(results)} segments ({len(skipped)} skipped), {len(rendered)} figures rendered, {len(reused)} unchanged, "
+          f"{len(removed)} stale segment directories removed.")
+    return timings
+
+
+def main(argv=None):
+    """Runs the exploratory analysis of the processed employed population."""
+    parser = argparse.ArgumentParser(description="Análisis exploratorio de la población ocupada: figuras y tablas.")
+    parser.add_argument('--data', default=DATA_PATH, help=f"CSV procesado (por defecto: {DATA_PATH}).")
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help=f"Directorio de figuras y tablas (por defecto: {OUTPUT_DIR}).")
+    parser.add_argument('--segment-by', nargs='*', default=None,
+                        help=f"Repite el análisis por cada segmento de estas columnas (sin columnas: {' '.join(DEFAULT_SEGMENTS)}); "
+                             f"los resultados quedan en {SEGMENTS_SUBDIR}/ dentro del directorio de salida.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Procesos para tablas y figuras (por defecto: uno por CPU).")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    os.makedirs(os.path.dirname(REPORT_PATH), exist_ok=True)
+    df = load_data(args.data)
+    print("Data loaded and columns renamed successfully.")
+    if args.segment_by is None:
+        run_eda(df, args.output_dir, args.workers)
+        print(f"EDA completed in {time.perf_counter() - started:.1f} s.")
+        return
+
+    by = [LABEL_MAP.get(col, col) for col in (args.segment_by or DEFAULT_SEGMENTS)]
+    missing = [col for col in by if col not in df.columns]
+    if missing:
+        parser.error(f"segment columns not in the data: {', '.join(missing)}")
+    segments_dir = os.path.join(args.output_dir, SEGMENTS_SUBDIR)
+    timings = run_segments(df, by, segments_dir, args.workers)
+    for stage, seconds in timings.items():
+        print(f"  {stage}: {seconds:.2f} s")
+    print(f"Segment EDA completed in {time.perf_counter() - started:.1f} s (including data load). Index: {os.path.join(segments_dir, 'index.html')}")
+
 
-# Rename columns for easier use
-df.rename(columns=label_map, inplace=True)
-
-# Convert 'Horas Trabajadas por Semana' to numeric, coercing errors
-df['Horas Trabajadas por Semana'] = pd.to_numeric(df['Horas Trabajadas por Semana'], errors='coerce')
-df.dropna(subset=['Horas Trabajadas por Semana'], inplace=True)
-
-
-print("Data loaded and columns renamed successfully.")
-
-# --- Analysis 1: Occupation Type by Sex ---
-plt.figure(figsize=(12, 8))
-sns.countplot(data=df, y='Tipo de Ocupación', hue='Sexo', order = df['Tipo de Ocupación'].value_counts().index)
-plt.title('Distribución de Tipos de Ocupación por Sexo')
-plt.xlabel('Cantidad')
-plt.ylabel('Tipo de Ocupación')
-plt.legend(title='Sexo')
-plt.tight_layout()
-ocupacion_por_sexo_path = os.path.join(output_dir, f'ocupacion_por_sexo_{timestamp}.png')
-plt.savefig(ocupacion_por_sexo_path)
-plt.close()
-print(f"Saved: {ocupacion_por_sexo_path}")
-
-# --- Analysis 2: Occupation by Education Level ---
-occupation_education = df.groupby(['Nivel Educativo', 'Tipo de Ocupación']).size().unstack(fill_value=0)
-occupation_education_perc = occupation_education.apply(lambda x: x / x.sum(), axis=1)
-fig, ax = plt.subplots(figsize=(14, 10))
-occupation_education_perc.plot(kind='barh', stacked=True, ax=ax, colormap='viridis')
-ax.set_title('Distribución Porcentual de Ocupación por Nivel Educativo')
-ax.set_xlabel('Proporción')
-ax.set_ylabel('Nivel Educativo')
-ax.legend(title='Tipo de Ocupación', bbox_to_anchor=(1.05, 1), loc='upper left')
-plt.tight_layout()
-ocupacion_por_nivel_educativo_path = os.path.join(output_dir, f'ocupacion_por_nivel_educativo_{timestamp}.png')
-plt.savefig(ocupacion_por_nivel_educativo_path)
-plt.close()
-print(f"Saved: {ocupacion_por_nivel_educativo_path}")
-
-# --- Analysis 3: Labor Informality by Ethnicity ---
-informality_ethnicity = df.groupby(['Autoidentificación Étnica', 'Condición Laboral (Informalidad)']).size().unstack(fill_value=0)
-informality_ethnicity_perc = informality_ethnicity.apply(lambda x: x / x.sum(), axis=1)
-fig, ax = plt.subplots(figsize=(12, 8))
-informality_ethnicity_perc.plot(kind='barh', stacked=True, ax=ax, colormap='coolwarm')
-ax.set_title('Tasa de Informalidad Laboral por Autoidentificación Étnica')
-ax.set_xlabel('Proporción')
-ax.set_ylabel('Autoidentificación Étnica')
-ax.legend(title='Condición Laboral', labels=['Formal', 'Informal'], bbox_to_anchor=(1.05, 1), loc='upper left')
-plt.tight_layout()
-informalidad_por_etnia_path = os.path.join(output_dir, f'informalidad_por_etnia_{timestamp}.png')
-plt.savefig(informalidad_por_etnia_path)
-plt.close()
-print(f"Saved: {informalidad_por_etnia_path}")
-
-# --- Analysis 4: Income Distribution by Education Level and Sex ---
-plt.figure(figsize=(16, 10))
-sns.boxplot(data=df, x='Ingreso Total Mensual (S/.)', y='Nivel Educativo', hue='Sexo')
-plt.title('Distribución del Ingreso por Nivel Educativo y Sexo')
-plt.xlabel('Ingreso Total Mensual (S/.) (Escala Logarítmica)')
-plt.ylabel('Nivel Educativo')
-plt.xscale('log')
-plt.legend(title='Sexo')
-plt.tight_layout()
-ingreso_por_educacion_sexo_path = os.path.join(output_dir, f'ingreso_por_educacion_sexo_{timestamp}.png')
-plt.savefig(ingreso_por_educacion_sexo_path)
-plt.close()
-print(f"Saved: {ingreso_por_educacion_sexo_path}")
-
-# --- Analysis 5: Working Hours by Occupation Type ---
-plt.figure(figsize=(14, 8))
-sns.boxplot(data=df, x='Horas Trabajadas por Semana', y='Tipo de Ocupación', order = df.groupby('Tipo de Ocupación')['Horas Trabajadas por Semana'].median().sort_values().index)
-plt.title('Distribución de Horas Trabajadas por Semana según Tipo de Ocupación')
-plt.xlabel('Horas Trabajadas por Semana')
-plt.ylabel('Tipo de Ocupación')
-plt.tight_layout()
-horas_por_tipo_ocupacion_path = os.path.join(output_dir, f'horas_por_tipo_ocupacion_{timestamp}.png')
-plt.savefig(horas_por_tipo_ocupacion_path)
-plt.close()
-print(f"Saved: {horas_por_tipo_ocupacion_path}")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib.patches import Patch
+
+from artifact_store import artifact_key, artifact_path, register
+from distribution_summary import box_stats
+
+# --- CONFIGURACIÓN ---
+# Incrementar cuando cambie el dibujo de alguna figura, para que se vuelva a renderizar aunque sus datos no cambien.
+FIGURE_VERSION = 1
+
+
+def _stored_job(job, store_dir, name):
+    # El archivo de la figura se nombra por el hash de su resumen y sus parámetros de dibujo
+    key = artifact_key(FIGURE_VERSION, job)
+    job.update(name=name, store_dir=store_dir, file=artifact_path(store_dir, name, key))
+    return job
+
+
+def histogram_job(summary, store_dir, name, title, xlabel, kde=False, scale='linear'):
+    """Queues a single-histogram evidence figure drawn from a precomputed distribution summary."""
+    job = {'kind': 'histogram', 'title': title, 'xlabel': xlabel, 'summary': summary, 'kde': kde, 'scale': scale}
+    return _stored_job(job, store_dir, name)
+
+
+def income_panel_job(summary, store_dir, name):
+    """Queues the four-panel income figure (overall, log-scale, zoomed and boxplot) drawn from a summary."""
+    return _stored_job({'kind': 'income_panel', 'summary': summary}, store_dir, name)
+
+
+def crosstab_job(table, store_dir, name, title, xlabel, ylabel, legend, figsize=(12, 8), invert_yaxis=False, **plot_kwargs):
+    """
+    Queues a horizontal bar chart of a two-way table (rows on the y axis, one bar or stacked
+    segment per column). `legend` holds the Axes.legend arguments and `plot_kwargs` go to
+    DataFrame.plot (e.g. stacked, colormap, width).
+    """
+    job = {
+        'kind': 'crosstab', 'title': title, 'xlabel': xlabel, 'ylabel': ylabel, 'legend': legend,
+        'figsize': list(figsize), 'invert_yaxis': invert_yaxis, 'plot': plot_kwargs, 'table': table.to_dict(orient='split')
+    }
+    return _stored_job(job, store_dir, name)
+
+
+def boxplot_job(summaries, levels, store_dir, name, title, xlabel, ylabel, hues=None, legend_title=None, xscale='linear', figsize=(14, 8)):
+    """Queues a box plot figure drawn with grouped_boxplot from per-group summaries."""
+    job = {
+        'kind': 'boxplot', 'title': title, 'xlabel': xlabel, 'ylabel': ylabel, 'levels': list(levels),
+        'hues': list(hues) if hues else None, 'legend_title': legend_title, 'xscale': xscale,
+        'figsize': list(figsize), 'summaries': summaries
+    }
+    return _stored_job(job, store_dir, name)
+
+
+def _draw_hist(ax, hist, kde=False, kde_color=None, **kwargs):
+    if hist is None:
+        return
+    edges = np.asarray(hist['edges'])
+    ax.hist(edges[:-1], bins=edges, weights=hist['counts'], **kwargs)
+    if kde and hist.get('kde'):
+        ax.plot(*hist['kde'], color=kde_color or kwargs.get('color'), linewidth=2)
+
+
+def _render_histogram(job):
+    fig, ax = plt.subplots(figsize=(12, 7))
+    hist = job['summary']['histograms'].get(job['scale'])
+    _draw_hist(ax, hist, kde=job['kde'], color='#1f77b4', alpha=0.6, edgecolor='white')
+    if job['scale'] == 'log':
+        ax.set_xscale('log')
+    ax.set_title(job['title'], fontsize=16); ax.set_xlabel(job['xlabel'], fontsize=12); ax.set_ylabel('Frequency', fontsize=12)
+    fig.savefig(job['file'])
+    plt.close(fig)
+
+
+def _render_income_panel(job):
+    summary = job['summary']
+    histograms = summary['histograms']
+    fig, axes = plt.subplots(2, 2, figsize=(18, 12))
+    fig.suptitle('Análisis Exhaustivo de la Distribución del Ingreso Mensual', fontsize=20)
+
+    # Plot 1: Overall Distribution
+    _draw_hist(axes[0, 0], histograms.get('linear'), color='skyblue', edgecolor='black')
+    axes[0, 0].set_title('Distribución General del Ingreso Mensual')
+    axes[0, 0].set_xlabel('Ingreso Total Mensual (S/.)'); axes[0, 0].set_ylabel('Frecuencia')
+    axes[0, 0].ticklabel_format(style='plain', axis='x')
+
+    # Plot 2: Log-Scale Distribution (log-spaced bins)
+    _draw_hist(axes[0, 1], histograms.get('log'), color='lightgreen', edgecolor='black')
+    axes[0, 1].set_xscale('log')
+    axes[0, 1].set_title('Distribución del Ingreso (Escala Logarítmica)')
+    axes[0, 1].set_xlabel('Ingreso Total Mensual (S/.) - Escala Log'); axes[0, 1].set_ylabel('Frecuencia')
+
+    # Plot 3: "Zoomed-In" Distribution on non-outliers
+    zoom = histograms.get('zoom')
+    _draw_hist(axes[1, 0], zoom, color='salmon', edgecolor='black')
+    threshold = zoom['max'] if zoom else summary['box']['threshold']
+    axes[1, 0].set_title(f'Distribución Detallada (Ingresos <= S/.{threshold:,.0f})')
+    axes[1, 0].set_xlabel('Ingreso Total Mensual (S/.)'); axes[1, 0].set_ylabel('Frecuencia')
+
+    # Plot 4: Boxplot for Outlier Identification
+    axes[1, 1].bxp([box_stats(summary, '1')], vert=False, patch_artist=True, boxprops=dict(facecolor='plum'))
+    axes[1, 1].set_xscale('log')
+    axes[1, 1].set_title('Diagrama de Caja para Identificar Outliers')
+    axes[1, 1].set_xlabel('Ingreso Total Mensual (S/.) - Escala Log')
+
+    plt.tight_layout(rect=[0, 0.03, 1, 0.95])
+    fig.savefig(job['file'], bbox_inches='tight')
+    plt.close(fig)
+
+
+def _render_crosstab(job):
+    table = job['table']
+    fig, ax = plt.subplots(figsize=job['figsize'])
+    pd.DataFrame(table['data'], index=table['index'], columns=table['columns']).plot(kind='barh', ax=ax, **job['plot'])
+    if job['invert_yaxis']:
+        ax.invert_yaxis()
+    ax.set_title(job['title'])
+    ax.set_xlabel(job['xlabel'])
+    ax.set_ylabel(job['ylabel'])
+    ax.legend(**job['legend'])
+    plt.tight_layout()
+    fig.savefig(job['file'])
+    plt.close(fig)
+
+
+def _render_boxplot(job):
+    fig, ax = plt.subplots(figsize=job['figsize'])
+    grouped_boxplot(ax, job['summaries'], job['levels'], hues=job['hues'], legend_title=job['legend_title'])
+    ax.set_title(job['title'])
+    ax.set_xlabel(job['xlabel'])
+    ax.set_ylabel(job['ylabel'])
+    ax.set_xscale(job['xscale'])
+    plt.tight_layout()
+    fig.savefig(job['file'])
+    plt.close(fig)
+
+
+RENDERERS = {
+    'histogram': _render_histogram, 'income_panel': _render_income_panel,
+    'crosstab': _render_crosstab, 'boxplot': _render_boxplot
+}
+
+
+def render_job(job):
+    """Draws and saves one precomputed evidence figure; returns its path."""
+    RENDERERS[job['kind']](job)
+    return job['file']
+
+
+def render_jobs(jobs, workers=None):
+    """
+    Renders the queued figures whose artifact does not exist yet, in a process pool when there is
+    more than one such job and worker, and registers every job's file in its store index.
+
+    Returns (rendered paths, reused paths).
+    """
+    pending = [job for job in jobs if not os.path.exists(job['file'])]
+    reused = [job['file'] for job in jobs if os.path.exists(job['file'])]
+    workers = min(len(pending), workers or os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rendered = list(pool.map(render_job, pending))
+    else:
+        rendered = [render_job(job) for job in pending]
+    by_store = {}
+    for job in jobs:
+        by_store.setdefault(job['store_dir'], {})[job['name']] = job['file']
+    for store_dir, paths in by_store.items():
+        register(store_dir, paths)
+    return rendered, reused
+
+
+def grouped_boxplot(ax, summaries, levels, hues=None, vert=False, legend_title=None):
+    """
+    Draws box plots from per-group summaries (see distribution_summary.summarize_groups) with Axes.bxp.
+
+    `summaries` is keyed by 'level' or 'level | hue'; with `hues`, each level gets one box per hue
+    side by side, colored from the default cycle, and a legend is added.
+    """
+    colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+    n_hues = len(hues) if hues else 1
+    width = 0.8 / n_hues
+    for j, hue in enumerate(hues or [None]):
+        stats, positions = [], []
+        for i, level in enumerate(levels):
+            key = str(level) if hue is None else f'{level} | {hue}'
+            if key in summaries and summaries[key]['n']:
+                stats.append(box_stats(summaries[key], str(level)))
+                positions.append(i - 0.4 + width * (j + 0.5))
+        if stats:
+            ax.bxp(stats, positions=positions, widths=width * 0.9, vert=vert, patch_artist=True, manage_ticks=False,
+                   boxprops=dict(facecolor=colors[j % len(colors)]), medianprops=dict(color='black'),
+                   flierprops=dict(marker='d', markersize=3))
+    ticks = range(len(levels))
+    labels = [str(level) for level in levels]
+    if vert:
+        ax.set_xticks(ticks); ax.set_xticklabels(labels)
+    else:
+        ax.set_yticks(ticks); ax.set_yticklabels(labels); ax.invert_yaxis()
+    if hues:
+        ax.legend(title=legend_title, handles=[Patch(facecolor=colors[j % len(colors)], label=str(hue)) for j, hue in enumerate(hues)])
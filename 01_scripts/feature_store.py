@@ -0,0 +1,212 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer, StandardScaler
+
+from artifact_store import artifact_key
+from linear_scorer import build_scoring_artifact
+from quarter_cache import content_hash
+
+# --- CONFIGURACIÓN ---
+STORE_DIR = '02_data_processed/cache/features'
+# Incrementar cuando cambie la codificación de la matriz, para invalidar el caché.
+STORE_VERSION = 2
+
+
+def _python_value(value):
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _codes_dtype(n_levels):
+    # Códigos compactos: int8 alcanza para todas las variables categóricas de la encuesta
+    return np.int8 if n_levels < 2**7 else np.int16 if n_levels < 2**15 else np.int32
+
+
+def _one_hot(codes, n_levels):
+    """CSR one-hot block built straight from category codes (rows with code -1 stay empty)."""
+    valid = codes >= 0
+    indptr = np.concatenate([[0], np.cumsum(valid, dtype=np.int64)])
+    data = np.ones(int(valid.sum()), dtype='float64')
+    return sp.csr_matrix((data, codes[valid].astype(np.int32), indptr), shape=(len(codes), n_levels))
+
+
+def encode_features(df, numeric, categorical, target=None):
+    """
+    Encodes `df` into a CSR design matrix: the `numeric` columns first, then one one-hot block per
+    `categorical` column (levels sorted, as OneHotEncoder does).
+
+    Missing values are imputed as in predictive_modeling.py: numeric columns with their median and
+    categorical columns with their mode. Returns the matrix with its layout: encoded column names,
+    the column positions of every feature ('groups'), the category levels and the fill values.
+    """
+    n_rows = len(df)
+    blocks, columns, groups, fill, categories = [], [], {}, {}, {}
+    for col in numeric:
+        x = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        median = float(np.nanmedian(x)) if not np.isnan(x).all() else 0.0
+        fill[col] = median
+        blocks.append(sp.csr_matrix(np.where(np.isnan(x), median, x).reshape(-1, 1)))
+        groups[col] = [len(columns)]
+        columns.append(col)
+    for col in categorical:
+        values = df[col]
+        if values.notna().any():
+            # La moda se guarda aunque no falten valores: el artefacto de scoring la usa para imputar
+            fill[col] = _python_value(values.mode().iloc[0])
+            values = values.fillna(fill[col])
+        cat = pd.Categorical(values)
+        levels = [_python_value(c) for c in cat.categories]
+        codes = cat.codes.astype(_codes_dtype(len(levels)))
+        blocks.append(_one_hot(codes, len(levels)))
+        categories[col] = levels
+        groups[col] = list(range(len(columns), len(columns) + len(levels)))
+        columns.extend(f"{col}_{c}" for c in levels)
+
+    X = sp.hstack(blocks, format='csr') if blocks else sp.csr_matrix((n_rows, 0))
+    y = df[target].astype(np.int8).to_numpy() if target is not None else None
+    return {
+        'X': X, 'y': y, 'columns': columns, 'groups': groups, 'numeric': list(numeric),
+        'categories': categories, 'fill': fill, 'target': target
+    }
+
+
+def _layout(matrix):
+    return {k: matrix[k] for k in ('columns', 'groups', 'numeric', 'categories', 'fill', 'target')}
+
+
+def save_feature_matrix(matrix, path):
+    """Writes the matrix (.npz) and its layout (.json next to it), each one atomically."""
+    X = matrix['X']
+    tmp_path = f"{path}.tmp.npz"
+    arrays = {'data': X.data, 'indices': X.indices, 'indptr': X.indptr, 'shape': np.asarray(X.shape)}
+    if matrix['y'] is not None:
+        arrays['y'] = matrix['y']
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    layout_path = os.path.splitext(path)[0] + '.json'
+    with open(f"{layout_path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(_layout(matrix), f, ensure_ascii=False)
+    os.replace(f"{layout_path}.tmp", layout_path)
+
+
+def read_feature_matrix(path):
+    """Reads a matrix written by save_feature_matrix."""
+    with np.load(path) as arrays:
+        X = sp.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(arrays['shape']))
+        y = arrays['y'] if 'y' in arrays.files else None
+    with open(os.path.splitext(path)[0] + '.json', 'r', encoding='utf-8') as f:
+        matrix = json.load(f)
+    matrix.update({'X': X, 'y': y})
+    return matrix
+
+
+def load_feature_matrix(data_path, numeric, categorical, target=None, where=None, store_dir=STORE_DIR):
+    """
+    Returns the design matrix of `data_path` for the given features, building it on the first call.
+
+    Matrices are cached in `store_dir` under a key of the file's content hash, the feature lists,
+    the target and the row filter `where` ({column: required value}), so later runs (training,
+    cross-validation) skip reading the CSV and every string operation. The returned dict has
+    'key' and 'cached' (True if it came from the store).
+    """
+    where = where or {}
+    key = artifact_key(content_hash(data_path), list(numeric), list(categorical), target, where, STORE_VERSION)
+    path = os.path.join(store_dir, f"features_{key}.npz")
+    if os.path.exists(path):
+        matrix = read_feature_matrix(path)
+        matrix.update({'key': key, 'path': path, 'cached': True})
+        return matrix
+
+    header = pd.read_csv(data_path, nrows=0).columns
+    wanted = set(numeric) | set(categorical) | set(where) | ({target} if target else set())
+    df = pd.read_csv(data_path, usecols=[col for col in header if col in wanted], low_memory=False)
+    for col, value in where.items():
+        if col in df.columns:
+            df = df[df[col] == value]
+    if target is not None:
+        df = df.dropna(subset=[target])
+    for col in set(numeric) | set(categorical):
+        if col not in df.columns:
+            df[col] = np.nan  # variable ausente en el archivo: queda sin columnas (categórica) o en 0 (numérica)
+
+    matrix = encode_features(df.reset_index(drop=True), numeric, categorical, target)
+    os.makedirs(store_dir, exist_ok=True)
+    save_feature_matrix(matrix, path)
+    matrix.update({'key': key, 'path': path, 'cached': False})
+    return matrix
+
+
+def feature_columns(matrix, features):
+    """Positions of the encoded columns of `features`, in matrix order (numeric columns first)."""
+    return sorted(pos for col in features for pos in matrix['groups'][col])
+
+
+def decode_rows(matrix, rows, features=None):
+    """Rebuilds the (imputed) feature values of `rows` from the matrix, e.g. to display or re-score a sample."""
+    X = matrix['X'][rows]
+    decoded = {}
+    for col in features or list(matrix['groups']):
+        positions = matrix['groups'][col]
+        if col in matrix['categories']:
+            block = X[:, positions]
+            levels = np.asarray(matrix['categories'][col] + [None], dtype=object)
+            # Filas sin categoría (columna ausente) apuntan al None final
+            if not positions:
+                decoded[col] = np.full(X.shape[0], None, dtype=object)
+                continue
+            hit = np.asarray(block.sum(axis=1)).ravel() > 0
+            codes = np.where(hit, np.asarray(block.argmax(axis=1)).ravel(), len(levels) - 1)
+            decoded[col] = levels[codes]
+        else:
+            decoded[col] = X[:, positions[0]].toarray().ravel()
+    return pd.DataFrame(decoded)
+
+
+def _dense(X):
+    return X.toarray() if sp.issparse(X) else X
+
+
+def scaled_pipeline(matrix, features, classifier):
+    """
+    Pipeline for X[:, feature_columns(matrix, features)]: a StandardScaler on the numeric columns
+    (densified first, they are dense anyway) while the one-hot columns pass through sparse, then
+    `classifier`.
+    """
+    numeric = [i for i, pos in enumerate(feature_columns(matrix, features)) if matrix['columns'][pos] in matrix['numeric']]
+    numeric_scaler = Pipeline(steps=[('dense', FunctionTransformer(_dense, accept_sparse=True)), ('scaler', StandardScaler())])
+    scaler = ColumnTransformer([('num', numeric_scaler, numeric)], remainder='passthrough', sparse_threshold=1.0)
+    return Pipeline(steps=[('scaler', scaler), ('classifier', classifier)])
+
+
+def scoring_artifact(matrix, features, pipeline, names=None, metadata=None):
+    """
+    linear_scorer artifact of a scaled_pipeline with a binary LogisticRegression fitted on the
+    columns of `features`. `names` optionally renames the features ({column: model name}).
+    Missing values are imputed as in the matrix: the numeric median and the categorical mode.
+    """
+    names = names or {}
+    classifier = pipeline.named_steps['classifier']
+    scaler = pipeline.named_steps['scaler'].named_transformers_['num'].named_steps['scaler']
+    positions = feature_columns(matrix, features)
+    coef = dict(zip(positions, classifier.coef_[0]))
+
+    numeric = [col for col in matrix['numeric'] if col in features]
+    numeric_stats = [
+        (names.get(col, col), scaler.mean_[j], scaler.scale_[j], matrix['fill'][col])
+        for j, col in enumerate(numeric)
+    ]
+    categorical = [
+        (names.get(col, col), matrix['categories'][col], matrix['fill'].get(col))
+        for col in features if col in matrix['categories']
+    ]
+    ordered = [coef[pos] for col in numeric for pos in matrix['groups'][col]]
+    ordered += [coef[pos] for col in features if col in matrix['categories'] for pos in matrix['groups'][col]]
+    return build_scoring_artifact(
+        classifier.intercept_[0], ordered, numeric_stats, categorical,
+        features=[names.get(col, col) for col in features], classes=classifier.classes_, metadata=metadata
+    )
@@ -0,0 +1,202 @@
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+# --- CONFIGURACIÓN ---
+ARTIFACT_FORMAT = 'linear-logistic'
+# Versión del esquema del artefacto; subirla cuando cambie su estructura
+ARTIFACT_VERSION = 2
+
+
+def _python_value(value):
+    return value.item() if hasattr(value, 'item') else value
+
+
+def build_scoring_artifact(intercept, coef, numeric, categorical, features=None, classes=(0, 1), metadata=None):
+    """
+    Assembles a scoring artifact from raw model parameters.
+
+    `numeric` lists (name, mean, scale, median) per numeric feature and `categorical` lists
+    (name, categories) or (name, categories, fill) per categorical feature, `fill` being the category
+    imputed for missing values (None: missing values contribute 0); `coef` follows the encoded column
+    order: numeric features first, then the categories of each categorical feature. `features`
+    defaults to the numeric and categorical names in that order.
+    """
+    coef = [float(c) for c in coef]
+    n_columns = len(numeric) + sum(len(feat[1]) for feat in categorical)
+    if n_columns != len(coef):
+        raise ValueError(f"The preprocessor produces {n_columns} columns but the model has {len(coef)} coefficients.")
+    artifact = {
+        'format': ARTIFACT_FORMAT, 'version': ARTIFACT_VERSION,
+        'features': list(features) if features else [feat[0] for feat in list(numeric) + list(categorical)],
+        'classes': [_python_value(c) for c in classes],
+        'intercept': float(intercept), 'numeric': [], 'categorical': [], 'columns': [],
+        'metadata': metadata or {}
+    }
+    offset = 0
+    for name, mean, scale, median in numeric:
+        artifact['numeric'].append({
+            'name': name, 'mean': float(mean), 'scale': float(scale), 'coef': coef[offset], 'median': float(median)
+        })
+        artifact['columns'].append(name)
+        offset += 1
+    for name, categories, *fill in categorical:
+        categories = [_python_value(c) for c in categories]
+        fill = _python_value(fill[0]) if fill else None
+        artifact['categorical'].append({
+            'name': name, 'categories': categories, 'coef': coef[offset:offset + len(categories)], 'fill': fill
+        })
+        artifact['columns'].extend(f"{name}_{c}" for c in categories)
+        offset += len(categories)
+    return artifact
+
+
+def export_scoring_artifact(pipeline, medians=None, modes=None, metadata=None):
+    """
+    Extracts a compact, JSON-serializable scoring artifact from a fitted sklearn Pipeline made of a
+    ColumnTransformer (StandardScaler and/or OneHotEncoder blocks) and a binary LogisticRegression.
+
+    The artifact holds, per numeric feature, the scaler mean/scale, its coefficient and the median
+    used to impute missing values (`medians`, by default the scaler mean, which scales to 0); per
+    categorical feature, its categories in encoder column order, their coefficients and the category
+    imputed for missing values (`modes`, by default none: missing values contribute 0); and the
+    intercept. Unknown categories contribute 0, as with OneHotEncoder(handle_unknown='ignore').
+    It also records the schema version, the input features in training order, the encoded column
+    names and the training `metadata` (data, sizes, metrics...), so it can be loaded without sklearn.
+    """
+    preprocessor = pipeline.named_steps['preprocessor']
+    classifier = pipeline.named_steps['classifier']
+    if classifier.coef_.shape[0] != 1:
+        raise ValueError("Only binary logistic regression pipelines can be exported.")
+    medians = medians or {}
+    modes = modes or {}
+    coef = classifier.coef_[0]
+
+    # Los coeficientes se reparten por bloque del ColumnTransformer y se reordenan: numéricas primero
+    numeric, categorical, numeric_coef, categorical_coef = [], [], [], []
+    offset = 0
+    for name, transformer, columns in preprocessor.transformers_:
+        if name == 'remainder' or transformer == 'drop':
+            continue
+        kind = type(transformer).__name__
+        if kind == 'StandardScaler':
+            for j, col in enumerate(columns):
+                mean = float(transformer.mean_[j]) if transformer.with_mean else 0.0
+                scale = float(transformer.scale_[j]) if transformer.with_std else 1.0
+                numeric.append((col, mean, scale, medians.get(col, mean)))
+            numeric_coef.extend(coef[offset:offset + len(columns)])
+            offset += len(columns)
+        elif kind == 'OneHotEncoder':
+            if transformer.drop_idx_ is not None:
+                raise ValueError("OneHotEncoder with drop is not supported by the linear scorer.")
+            for col, categories in zip(columns, transformer.categories_):
+                categorical.append((col, categories, modes.get(col)))
+                categorical_coef.extend(coef[offset:offset + len(categories)])
+                offset += len(categories)
+        else:
+            raise ValueError(f"Unsupported transformer for the linear scorer: {kind}")
+    if offset != len(coef):
+        raise ValueError(f"The preprocessor produces {offset} columns but the model has {len(coef)} coefficients.")
+    features = [str(col) for col in getattr(pipeline, 'feature_names_in_', [])]
+    return build_scoring_artifact(classifier.intercept_[0], numeric_coef + categorical_coef, numeric, categorical,
+                                  features=features, classes=classifier.classes_, metadata=metadata)
+
+
+def save_scoring_artifact(path, artifact):
+    """Writes a scoring artifact as JSON (atomically, so readers never see a partial file)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(artifact, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def validate_scoring_artifact(artifact, name='artifact'):
+    """Checks the format, schema version and internal consistency of a scoring artifact; returns it."""
+    if artifact.get('format') != ARTIFACT_FORMAT:
+        raise ValueError(f"{name} is not a {ARTIFACT_FORMAT} scoring artifact.")
+    version = artifact.get('version')
+    if version != ARTIFACT_VERSION:
+        raise ValueError(f"{name} has schema version {version}; this loader reads version {ARTIFACT_VERSION}. Re-export the model.")
+    n_coef = len(artifact['numeric']) + sum(len(feat['coef']) for feat in artifact['categorical'])
+    if any(len(feat['coef']) != len(feat['categories']) for feat in artifact['categorical']) or n_coef != len(artifact['columns']):
+        raise ValueError(f"{name} is inconsistent: its coefficients do not match its encoded columns.")
+    if any(feat['fill'] is not None and feat['fill'] not in feat['categories'] for feat in artifact['categorical']):
+        raise ValueError(f"{name} is inconsistent: a categorical fill value is not one of its categories.")
+    return artifact
+
+
+def load_scoring_artifact(path):
+    """Reads and validates a scoring artifact written by save_scoring_artifact. Only needs json and NumPy."""
+    with open(path, 'r', encoding='utf-8') as f:
+        artifact = json.load(f)
+    return validate_scoring_artifact(artifact, os.path.basename(path))
+
+
+def compile_scorer(artifact):
+    """
+    Turns an artifact into lookup tables: for each categorical feature a coefficient array with an
+    extra trailing 0 for unknown values (gathered with the category codes), a dict for single-record
+    scoring and the coefficient of its fill category, used for missing values as in training (0 when
+    the artifact has no fill). Numeric features fold the scaler into one slope and offset. 'features'
+    lists the input columns the scorer reads.
+    """
+    numeric = []
+    for feat in artifact['numeric']:
+        slope = feat['coef'] / feat['scale']
+        numeric.append((feat['name'], slope, -feat['mean'] * slope, feat['median']))
+    categorical = []
+    for feat in artifact['categorical']:
+        table = np.append(np.asarray(feat['coef'], dtype='float64'), 0.0)
+        lookup = dict(zip(feat['categories'], feat['coef']))
+        categorical.append((feat['name'], pd.Index(feat['categories']), table, lookup, lookup.get(feat['fill'], 0.0)))
+    # El término constante de las variables numéricas se suma una sola vez al intercepto
+    intercept = artifact['intercept'] + sum(offset for _, _, offset, _ in numeric)
+    return {'intercept': intercept, 'numeric': numeric, 'categorical': categorical, 'features': list(artifact['features'])}
+
+
+def _is_missing(value):
+    # Celdas vacías: NaN/None, o '' cuando el registro viene de un formulario
+    return value is None or value == '' or (isinstance(value, float) and math.isnan(value))
+
+
+def _sigmoid(z):
+    return np.exp(-np.logaddexp(0.0, -z))
+
+
+def decision_function(scorer, df):
+    """Linear score (log-odds) of every row of `df`: category-code gathers plus one multiply-add per numeric feature."""
+    z = np.full(len(df), scorer['intercept'])
+    for name, slope, _, median in scorer['numeric']:
+        x = pd.to_numeric(df[name], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        z += slope * np.where(np.isnan(x), median, x)
+    for name, categories, table, _, fill_coef in scorer['categorical']:
+        values = df[name]
+        codes = pd.Categorical(values, categories=categories).codes
+        missing = (values.isna() | (values == '')).to_numpy()
+        # el código -1 (desconocido) apunta al 0 final de la tabla; los faltantes toman la categoría imputada
+        z += np.where(missing, fill_coef, table[codes])
+    return z
+
+
+def score_frame(scorer, df):
+    """Probability of the positive class for every row of `df` (vectorized)."""
+    return _sigmoid(decision_function(scorer, df))
+
+
+def score_record(scorer, record):
+    """Probability of the positive class for one {feature: value} record, in pure Python."""
+    z = scorer['intercept']
+    for name, slope, _, median in scorer['numeric']:
+        x = record.get(name)
+        try:
+            x = float(x)
+        except (TypeError, ValueError):
+            x = math.nan
+        z += slope * (median if math.isnan(x) else x)
+    for name, _, _, lookup, fill_coef in scorer['categorical']:
+        value = record.get(name)
+        z += fill_coef if _is_missing(value) else lookup.get(value, 0.0)
+    return 1.0 / (1.0 + math.exp(-z)) if z >= 0 else math.exp(z) / (1.0 + math.exp(z))
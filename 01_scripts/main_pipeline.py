@@ -1,16 +1,42 @@
 import pandas as pd
 import numpy as np
 import os
-import matplotlib.pyplot as plt
-import seaborn as sns
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from scipy.stats import ttest_ind
 
+from artifact_store import collect_garbage, lookup
+from cleaning_rules import SPECIAL_CODE_RULES, apply_rules, rules_report
+from distribution_summary import dump_state, load_state, merge_states, save_summaries, summarize, summarize_state, summary_state
+from evidence import histogram_job, income_panel_job, render_jobs
+from periods import PERIOD_COLUMN, discover_quarter_files, write_partition_index
+from quantiles import digest_thresholds, exact_thresholds, merge_periods, period_digests
+from quarter_cache import iter_quarter_csv, load_quarter_csv, update_manifest
+from quarter_partitions import (
+    is_current, iter_partition, load_manifest, partition_columns, partition_files, read_aggregates, remove_partition,
+    save_manifest, source_state, write_partition
+)
+from survey_schema import fill_no_aplica, recode
+from weighted_stats import WEIGHT_COLUMN, weighted_counts, weighted_mean
+
 # --- CONFIGURACIÓN GLOBAL ---
 DATA_SOURCE_DIR = '../00_data_source/'
 PROCESSED_DIR = '../02_data_processed/'
 EVIDENCE_DIR = '../03_cleaning_evidence/'
 REPORTS_DIR = '../04_reports/'
+CACHE_DIR = '../02_data_processed/cache/'
+PARTITIONS_DIR = '../02_data_processed/trimestres/'
+# Columnas cuya distribución cruda se conserva para la evidencia ANTES de la limpieza
+EVIDENCE_COLUMNS = ['C208', 'INGTOT', 'whoraT']
+# Columnas de la población en edad de trabajar que usan los pasos 4 y 5 (factor_expansion: peso de los digests)
+ANALYSIS_COLUMNS = ['INGTOT', 'C207', 'C366', 'grupo_edad', 'REGION', PERIOD_COLUMN, WEIGHT_COLUMN, 'factor_expansion']
+# t-digests del ingreso por trimestre y segmento, para los umbrales de outliers por segmento
+DIGEST_DIR = '../02_data_processed/cache/quantiles/'
+OUTLIER_SEGMENTS = {'C207': 'Sexo', 'C366': 'Nivel Educativo', 'REGION': 'Región'}
+DEFAULT_CHUNKSIZE = 100_000
+# Nombre lógico de la figura de ingresos en el índice de artefactos de EVIDENCE_DIR
+INCOME_PLOT_NAME = 'Analisis_Completo_Ingresos'
 # ... (otras configuraciones como mapas de recodificación, etc.)
 
 # --- HELPER FUNCTIONS ---
@@ -45,78 +71,178 @@ def generar_estadisticas(df, columnas):
             stats_list.append(stats)
     return pd.DataFrame(stats_list).set_index('Columna')
 
+def column_state(series):
+    """Estado combinable de una columna (tipo, conteos y summary_state) para el Paso 2 en modo streaming."""
+    is_numeric = pd.api.types.is_numeric_dtype(series)
+    values = pd.to_numeric(series, errors='coerce').to_numpy(dtype='float64', na_value=np.nan) if is_numeric else np.array([])
+    return {'dtype': series.dtype, 'count': int(series.count()), 'nulls': int(series.isnull().sum()), 'summary': summary_state(values)}
+
+def merge_column_states(a, b):
+    """Combina los estados de dos bloques de la misma columna; el tipo es el que daría pd.concat."""
+    dtype = pd.concat([pd.Series([], dtype=a['dtype']), pd.Series([], dtype=b['dtype'])]).dtype
+    return {'dtype': dtype, 'count': a['count'] + b['count'], 'nulls': a['nulls'] + b['nulls'], 'summary': merge_states(a['summary'], b['summary'])}
+
+def evidence_states(raw_evidence, df):
+    """Estados {'before'|'after': {columna: estado}} de las columnas de evidencia de un bloque o trimestre."""
+    return {stage: {col: column_state(frame[col]) for col in raw_evidence.columns} for stage, frame in (('before', raw_evidence), ('after', df))}
+
+def merge_evidence_states(total, states):
+    """Acumula en `total` los estados de evidencia de otro bloque o trimestre (el orden se conserva)."""
+    for stage, columns in states.items():
+        for col, state in columns.items():
+            stage_states = total.setdefault(stage, {})
+            stage_states[col] = merge_column_states(stage_states[col], state) if col in stage_states else state
+    return total
+
+def dump_evidence_states(states):
+    """Copia serializable en JSON de los estados de evidencia, para guardarlos con una partición."""
+    return {stage: {col: dict(state, dtype=str(state['dtype']), summary=dump_state(state['summary'])) for col, state in columns.items()} for stage, columns in states.items()}
+
+def load_evidence_states(data):
+    """Inversa de dump_evidence_states."""
+    return {stage: {col: dict(state, dtype=pd.api.types.pandas_dtype(state['dtype']), summary=load_state(state['summary'])) for col, state in columns.items()} for stage, columns in data.items()}
+
+def write_evidence_from_states(states, rule_hits, evidence_jobs=None):
+    """Paso 2 a partir de estados combinables (modos streaming e incremental): mismos archivos que clean_special_codes."""
+    summaries = {}
+    for stage, kde in (('before', False), ('after', True)):
+        summaries.update({f'{col}_{stage}': summarize_state(states[stage][col]['summary'], kde=kde) for col in EVIDENCE_COLUMNS if col in states.get(stage, {})})
+    write_cleaning_evidence(estadisticas_de_estados(states.get('before', {})), estadisticas_de_estados(states.get('after', {})), summaries, rule_hits, evidence_jobs)
+
+def estadisticas_de_estados(states):
+    """Las estadísticas de generar_estadisticas a partir de estados combinables {columna: estado}."""
+    stats_list = []
+    for col, state in states.items():
+        moments = state['summary']['moments']
+        is_numeric = pd.api.types.is_numeric_dtype(state['dtype']) and moments['n'] > 0
+        stats_list.append({
+            'Columna': col, 'Tipo de Dato': state['dtype'],
+            'Valores No Nulos': state['count'], 'Valores Nulos': state['nulls'],
+            'Media': moments['mean'] if is_numeric else np.nan,
+            'Desv. Estándar': np.sqrt(moments['m2'] / (moments['n'] - 1)) if is_numeric and moments['n'] > 1 else np.nan,
+            'Mínimo': moments['min'] if is_numeric else np.nan,
+            'Máximo': moments['max'] if is_numeric else np.nan
+        })
+    return pd.DataFrame(stats_list).set_index('Columna')
+
 # --- PIPELINE FUNCTIONS ---
 
-def load_and_unify_data():
-    """Paso 1: Carga, etiqueta y unifica los 6 CSVs en un master_df."""
-    print("--- Paso 1: Cargando y unificando datos ---")
-    files = [f for f in os.listdir(DATA_SOURCE_DIR) if f.endswith('.csv')]
-    quarters = {
-        'Trim Ene-Feb-Mar24.csv': '2024-Q1', 'Trim Abr-May-Jun24.csv': '2024-Q2',
-        'Trim Jul-Ago-Set24.csv': '2024-Q3', 'Trim Set-Oct-Nov24.csv': '2024-Q4',
-        'Trim Ene-Feb-Mar25.csv': '2025-Q1', 'Trim Mar-Abr-May25.csv': '2025-Q2'
-    }
-    df_list = []
-    for file in files:
-        df = pd.read_csv(os.path.join(DATA_SOURCE_DIR, file), low_memory=False)
-        if file in quarters: df['periodo'] = quarters[file]
-        df_list.append(df)
-    if not df_list: raise FileNotFoundError(f"No CSV files found in {DATA_SOURCE_DIR}")
-    master_df = pd.concat(df_list, ignore_index=True)
-    master_df.replace(r'^\s*$', np.nan, regex=True, inplace=True)
-    fa_cols = [col for col in master_df.columns if col.startswith('fa_')]
+def apply_special_codes(df):
+    """Reemplaza in-place los códigos especiales de SPECIAL_CODE_RULES por NaN; devuelve las celdas afectadas por regla."""
+    return apply_rules(df, SPECIAL_CODE_RULES)
+
+def load_quarter(task):
+    """
+    Worker de ingesta: lee un trimestre, lo etiqueta, unifica su factor de expansión y sanea códigos especiales.
+
+    Devuelve el trimestre limpio, una copia cruda de las columnas de evidencia (para que el
+    Paso 2 pueda documentar el estado ANTES de la limpieza sin volver a leer el CSV), el
+    conteo de celdas reemplazadas por cada regla de limpieza y las entradas del manifiesto del
+    caché que el proceso principal debe registrar con update_manifest.
+    """
+    path, periodo, n_files = task
+    df, cache_updates = load_quarter_csv(path, CACHE_DIR)
+    return prepare_quarter_frame(df, periodo, n_files) + (cache_updates,)
+
+def prepare_quarter_frame(df, periodo, n_files):
+    """Etiqueta, unifica el factor de expansión y sanea un trimestre (o un bloque de él) in-place."""
+    if periodo is not None: df['periodo'] = periodo
+    fa_cols = [col for col in df.columns if col.startswith('fa_')]
     if fa_cols:
-        # First, convert all factor columns to numeric, coercing errors
+        # Factor columns arrive typed from the schema; only coerce the ones that did not
         for col in fa_cols:
-            master_df[col] = pd.to_numeric(master_df[col], errors='coerce')
-
-        master_df['factor_expansion'] = master_df[fa_cols].sum(axis=1)
-        master_df['factor_ajustado'] = master_df['factor_expansion'] / len(files)
-        master_df.drop(columns=fa_cols, inplace=True)
-    print("Datos cargados y unificados exitosamente.")
-    return master_df
-
-def clean_special_codes(df, columns_to_visualize):
-    """Paso 2: Sanea códigos especiales y genera evidencia de limpieza."""
+            if not pd.api.types.is_numeric_dtype(df[col]):
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+        df['factor_expansion'] = df[fa_cols].sum(axis=1)
+        df['factor_ajustado'] = df['factor_expansion'] / n_files
+        df.drop(columns=fa_cols, inplace=True)
+    raw_evidence = df[[col for col in EVIDENCE_COLUMNS if col in df.columns]].copy()
+    rule_hits = apply_special_codes(df)
+    return df, raw_evidence, rule_hits
+
+def quarter_tasks():
+    """Lista (ruta, periodo, n_archivos) para cada CSV trimestral bajo DATA_SOURCE_DIR, ordenados por periodo."""
+    files = discover_quarter_files(DATA_SOURCE_DIR)
+    if not files: raise FileNotFoundError(f"No CSV files found in {DATA_SOURCE_DIR}")
+    for path, periodo in files:
+        if periodo is None: print(f"Advertencia: no se pudo determinar el periodo de {path}")
+    return [(path, periodo, len(files)) for path, periodo in files]
+
+def load_and_unify_data(workers=1):
+    """
+    Paso 1: Carga, etiqueta, sanea y unifica los CSVs trimestrales en un master_df.
+
+    Con workers > 1 cada trimestre se procesa en su propio proceso. Devuelve el master_df ya
+    saneado, las columnas de evidencia en crudo y el conteo acumulado por regla de limpieza.
+    """
+    print("--- Paso 1: Cargando y unificando datos ---")
+    tasks = quarter_tasks()
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            results = list(pool.map(load_quarter, tasks))
+    else:
+        results = [load_quarter(task) for task in tasks]
+    # Un solo proceso escribe el manifiesto del caché y poda sus archivos, cuando ya terminaron todos los workers
+    update_manifest(CACHE_DIR, {key: entry for *_, updates in results for key, entry in updates.items()})
+    # Todos los trimestres comparten esquema y tipos, así que la concatenación no necesita re-tipar columnas
+    master_df = pd.concat([df for df, _, _, _ in results], ignore_index=True, copy=False)
+    raw_evidence = pd.concat([raw for _, raw, _, _ in results], ignore_index=True, copy=False)
+    rule_hits = sum(hits for _, _, hits, _ in results)
+    print(f"Datos cargados y unificados exitosamente ({len(tasks)} trimestres, {workers} worker(s)).")
+    return master_df, raw_evidence, rule_hits
+
+def clean_special_codes(df, columns_to_visualize, raw_df=None, rule_hits=None, evidence_jobs=None):
+    """
+    Paso 2: Sanea códigos especiales y genera evidencia de limpieza.
+
+    Si se pasa `raw_df` (columnas crudas devueltas por load_and_unify_data), `df` ya viene saneado
+    por trimestre y solo se genera la evidencia ANTES/DESPUÉS; `rule_hits` trae entonces el conteo
+    por regla acumulado durante la ingesta.
+
+    Aquí solo se calculan los resúmenes de distribución (bins, cuantiles y KDE), que se guardan en
+    resumen_distribuciones_limpieza.json; las figuras se encolan en `evidence_jobs` para
+    renderizarse al final del pipeline, con nombres derivados del hash de su resumen (una figura cuyos
+    datos no cambiaron no se vuelve a dibujar). Con evidence_jobs=None no se genera evidencia visual.
+    """
     print("\n--- Paso 2: Limpiando códigos especiales y generando evidencia ---")
-    master_df = df.copy()
-
-    columnas_a_evaluar = ['C208', 'INGTOT', 'whoraT']
-    codes_to_nan = {
-        'C208': [99], 'C301_DIA': [99], 'C301_MES': [99], 'C301_ANIO': [9999], 'C308_COD': [9999], 'C309_COD': [9999], 'C317A': [9999],
-        'C318_1': [99], 'C318_2': [99], 'C318_3': [99], 'C318_4': [99], 'C318_5': [99], 'C318_6': [99], 'C318_7': [99], 'C318_T': [99],
-        'C328_T': [99], 'whoraT': [99], 'I339_1': [999999], 'C341_T': [999999], 'C342': [999999], 'D344': [999999], 'I345_1': [999999],
-        'D347_T': [999999], 'C348': [999999], 'D350': [999999], 'INGTOT': [999999], 'INGTOTP': [999999], 'INGTRABW': [999999]
-    }
+    already_clean = raw_df is not None
+    if already_clean:
+        master_df = df
+    else:
+        raw_df = df
+        master_df = df.copy()
 
     print("\n--- Generando evidencia ANTES de la limpieza ---")
-    stats_antes = generar_estadisticas(master_df, columnas_a_evaluar)
-    for column in columns_to_visualize:
-        if column in master_df.columns:
-            plt.figure(figsize=(12, 7)); sns.histplot(master_df[column].dropna(), kde=False, bins=50)
-            plt.title(f'Distribution of {column} - BEFORE Cleaning', fontsize=16); plt.xlabel(column, fontsize=12); plt.ylabel('Frequency', fontsize=12)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S"); file_name = f"{column}_before_{timestamp}.png"
-            plt.savefig(os.path.join(EVIDENCE_DIR, file_name)); plt.close()
-            print(f"Evidencia visual guardada en: {os.path.join(EVIDENCE_DIR, file_name)}")
-
-    print("\n--- Aplicando limpieza: Reemplazando códigos especiales con NaN ---")
-    for column, codes in codes_to_nan.items():
-        if column in master_df.columns: master_df[column] = master_df[column].replace(codes, np.nan)
-
-    print("\n--- Forzando tipos numéricos post-limpieza ---")
-    numeric_columns = list(codes_to_nan.keys())
-    for col in numeric_columns:
-        if col in master_df.columns: master_df[col] = pd.to_numeric(master_df[col], errors='coerce')
+    stats_antes = generar_estadisticas(raw_df, EVIDENCE_COLUMNS)
+    summaries = {f'{column}_before': summarize(raw_df[column], kde=False) for column in columns_to_visualize if column in raw_df.columns}
+
+    if not already_clean:
+        print("\n--- Aplicando limpieza: Reemplazando códigos especiales con NaN y forzando tipos numéricos ---")
+        rule_hits = apply_special_codes(master_df)
 
     print("\n--- Generando evidencia DESPUÉS de la limpieza ---")
-    stats_despues = generar_estadisticas(master_df, columnas_a_evaluar)
-    for column in columns_to_visualize:
-        if column in master_df.columns:
-            plt.figure(figsize=(12, 7)); sns.histplot(master_df[column].dropna(), kde=True, bins=50)
-            plt.title(f'Distribution of {column} - AFTER Cleaning', fontsize=16); plt.xlabel(column, fontsize=12); plt.ylabel('Frequency', fontsize=12)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S"); file_name = f"{column}_after_{timestamp}.png"
-            plt.savefig(os.path.join(EVIDENCE_DIR, file_name)); plt.close()
-            print(f"Evidencia visual guardada en: {os.path.join(EVIDENCE_DIR, file_name)}")
+    stats_despues = generar_estadisticas(master_df, EVIDENCE_COLUMNS)
+    summaries.update({f'{column}_after': summarize(master_df[column]) for column in columns_to_visualize if column in master_df.columns})
+    write_cleaning_evidence(stats_antes, stats_despues, summaries, rule_hits, evidence_jobs)
+    return master_df
+
+def write_cleaning_evidence(stats_antes, stats_despues, summaries, rule_hits=None, evidence_jobs=None):
+    """
+    Guarda la evidencia del Paso 2 (resúmenes de distribución, tabla ANTES/DESPUÉS y conteo por
+    regla) y encola las figuras de cada resumen '{columna}_before' / '{columna}_after'.
+    """
+    if evidence_jobs is not None:
+        for name, summary in summaries.items():
+            column, stage = name.rsplit('_', 1)
+            if stage == 'before':
+                evidence_jobs.append(histogram_job(summary, EVIDENCE_DIR, name, f'Distribution of {column} - BEFORE Cleaning', column))
+            else:
+                evidence_jobs.append(histogram_job(summary, EVIDENCE_DIR, name, f'Distribution of {column} - AFTER Cleaning', column, kde=True))
+    ruta_resumenes = os.path.join(EVIDENCE_DIR, 'resumen_distribuciones_limpieza.json')
+    save_summaries(ruta_resumenes, summaries)
+    print(f"Resúmenes de distribución guardados en: {ruta_resumenes}")
+    if evidence_jobs is not None:
+        print(f"{len(evidence_jobs)} figura(s) de evidencia en cola para renderizar.")
 
     print("\n--- Exportando resumen cuantitativo ---")
     tabla_comparativa = pd.concat([stats_antes, stats_despues], axis=1, keys=['ANTES DE LA LIMPIEZA', 'DESPUÉS DE LA LIMPIEZA'])
@@ -124,32 +250,37 @@ def clean_special_codes(df, columns_to_visualize):
     ruta_salida = os.path.join(EVIDENCE_DIR, 'resumen_cuantitativo_limpieza.md')
     tabla_comparativa.to_markdown(ruta_salida)
     print(f"Tabla de resumen de la limpieza guardada en: {ruta_salida}")
+    if rule_hits is not None:
+        ruta_reglas = os.path.join(EVIDENCE_DIR, 'conteo_reglas_limpieza.md')
+        rules_report(SPECIAL_CODE_RULES, rule_hits).to_markdown(ruta_reglas, index=False)
+        print(f"Conteo de celdas reemplazadas por regla guardado en: {ruta_reglas}")
 
     print("Limpieza y generación de evidencia completadas.")
-    return master_df
 
 def segregate_and_prepare(df):
     """Paso 3: Separa por edad, recodifica variables y realiza feature engineering."""
     print("\n--- Paso 3: Segregando y preparando los datos ---")
-    master_df = df.copy()
+    poblacion_trabajo_df, poblacion_no_trabajo_df = prepare_populations(df)
+    print("Datos segregados y preparados exitosamente.")
+    return poblacion_trabajo_df, poblacion_no_trabajo_df
 
-    # Segregate by age (>=14 is considered potential labor force)
-    poblacion_trabajo_df = master_df[master_df['C208'] >= 14].copy()
-    poblacion_no_trabajo_df = master_df[master_df['C208'] < 14].copy()
+def prepare_populations(df):
+    """Segrega, recodifica y genera features sobre un frame saneado (completo o un bloque del modo streaming)."""
+    # Segregate by age (>=14 is considered potential labor force); the filtered frames are already copies
+    poblacion_trabajo_df = df[(df['C208'] >= 14).fillna(False)].copy()
+    poblacion_no_trabajo_df = df[(df['C208'] < 14).fillna(False)].copy()
 
     # --- Clean 'poblacion_trabajo_df' ---
     maps = get_recode_maps()
     for var, mapping in maps.items():
         if var in poblacion_trabajo_df.columns:
-            poblacion_trabajo_df[var] = poblacion_trabajo_df[var].map(mapping)
+            poblacion_trabajo_df[var] = recode(poblacion_trabajo_df[var], mapping)
 
     # Handle Nulls with 'No Aplica' for non-employed individuals
     not_employed_condition = poblacion_trabajo_df['OCUP300'] != 'Ocupado'
     cols_to_fill = [col for col in poblacion_trabajo_df.columns if col.startswith(('C3', 'I3', 'D3'))]
     cols_to_fill.extend(['INGTOT', 'INGTOTP', 'ingtrabw', 'whoraT'])
-    for col in cols_to_fill:
-        if col in poblacion_trabajo_df.columns:
-            poblacion_trabajo_df.loc[not_employed_condition, col] = 'No Aplica'
+    fill_no_aplica(poblacion_trabajo_df, not_employed_condition, cols_to_fill)
 
     # Feature Engineering
     bins = [14, 18, 25, 35, 45, 55, 65, np.inf]
@@ -157,7 +288,8 @@ def segregate_and_prepare(df):
     poblacion_trabajo_df['grupo_edad'] = pd.cut(poblacion_trabajo_df['C208'], bins=bins, labels=labels, right=False)
     poblacion_trabajo_df['es_informal'] = 0
     if 'C361_1' in poblacion_trabajo_df.columns:
-        poblacion_trabajo_df.loc[(poblacion_trabajo_df['OCUP300'] == 'Ocupado') & (poblacion_trabajo_df['C361_1'] == 2), 'es_informal'] = 1
+        informal = (poblacion_trabajo_df['OCUP300'] == 'Ocupado') & (poblacion_trabajo_df['C361_1'] == 2).fillna(False)
+        poblacion_trabajo_df.loc[informal, 'es_informal'] = 1
 
     # --- Clean 'poblacion_no_trabajo_df' ---
     try:
@@ -169,102 +301,217 @@ def segregate_and_prepare(df):
         pass  # C300n not found, continue without pruning
     for var, mapping in maps.items():
         if var in poblacion_no_trabajo_df.columns and var != 'OCUP300':
-            poblacion_no_trabajo_df[var] = poblacion_no_trabajo_df[var].map(mapping)
+            poblacion_no_trabajo_df[var] = recode(poblacion_no_trabajo_df[var], mapping)
 
-    print("Datos segregados y preparados exitosamente.")
     return poblacion_trabajo_df, poblacion_no_trabajo_df
 
-def analyze_outliers_and_visualize(df):
-    """Paso 4: Realiza el análisis profundo de outliers de ingreso y genera visualizaciones avanzadas."""
+def run_streaming(path_trabajo, path_no_trabajo, chunksize, evidence_jobs=None):
+    """
+    Pasos 1-3 en modo streaming: cada trimestre se lee en bloques de `chunksize` filas que pasan por
+    limpieza, segregación y feature engineering y se anexan a los CSVs de salida.
+
+    La memoria pico queda acotada por el tamaño del bloque: de cada bloque solo se conservan
+    acumuladores combinables (estados de las columnas de evidencia antes y después de la limpieza y
+    el conteo por regla), con los que se genera la evidencia del Paso 2 al final. Los Pasos 4 y 5
+    leen después solo las columnas de análisis del CSV de la población en edad de trabajar.
+    """
+    print(f"--- Pasos 1-3 (streaming): procesando trimestres en bloques de {chunksize:,} filas ---")
+    canonical_columns = None
+    written = set()
+    states = {}
+    rule_hits = 0
+    n_rows = 0
+    for path, periodo, n_files in quarter_tasks():
+        for chunk in iter_quarter_csv(path, chunksize):
+            # Los CSVs no comparten el orden de columnas; se alinean al del primer bloque, como haría pd.concat
+            if canonical_columns is None:
+                canonical_columns = list(chunk.columns)
+            else:
+                chunk = chunk.reindex(columns=canonical_columns + [c for c in chunk.columns if c not in canonical_columns])
+            chunk, raw_evidence, chunk_hits = prepare_quarter_frame(chunk, periodo, n_files)
+            rule_hits = rule_hits + chunk_hits
+            merge_evidence_states(states, evidence_states(raw_evidence, chunk))
+            trabajo, no_trabajo = prepare_populations(chunk)
+            for frame, path_out in ((trabajo, path_trabajo), (no_trabajo, path_no_trabajo)):
+                frame.to_csv(path_out, mode='a' if path_out in written else 'w', header=path_out not in written, index=False)
+                written.add(path_out)
+            n_rows += len(chunk)
+        print(f"Trimestre procesado: {os.path.basename(path)}")
+    print(f"{n_rows:,} filas procesadas en modo streaming.")
+
+    print("\n--- Paso 2: Generando evidencia de limpieza desde los acumuladores por bloque ---")
+    write_evidence_from_states(states, rule_hits, evidence_jobs)
+    return pd.read_csv(path_trabajo, usecols=lambda col: col in ANALYSIS_COLUMNS)
+
+def run_incremental(path_trabajo, path_no_trabajo, evidence_jobs=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Pasos 1-3 en modo incremental: solo se ingieren, limpian y segregan los trimestres nuevos o
+    modificados, cuyas salidas se guardan como particiones en PARTITIONS_DIR junto con sus
+    agregados (estados combinables de las columnas de evidencia y conteo por regla).
+
+    La evidencia del Paso 2 se regenera combinando los agregados guardados, sin releer ningún
+    trimestre. Los datasets procesados se reescriben copiando las particiones por bloques de
+    `chunksize` filas: factor_ajustado depende del número de trimestres, así que cambia en todas las
+    filas cuando llega uno nuevo. Los Pasos 4 y 5 leen después las columnas de análisis del histórico.
+
+    Devuelve None si ningún trimestre cambió desde la última corrida y las salidas ya existen.
+    """
+    print("--- Pasos 1-3 (incremental): procesando solo trimestres nuevos o modificados ---")
+    os.makedirs(PARTITIONS_DIR, exist_ok=True)
+    manifest = load_manifest(PARTITIONS_DIR)
+    tasks = quarter_tasks()
+
+    # Trimestres que ya no están en la fuente: sus particiones dejan de formar parte del histórico
+    current_names = {os.path.basename(path) for path, _, _ in tasks}
+    removed = [name for name in manifest if name not in current_names]
+    for name in removed:
+        remove_partition(PARTITIONS_DIR, manifest.pop(name))
+        print(f"Partición eliminada (el trimestre ya no está en la fuente): {name}")
+
+    processed = []
+    for path, periodo, n_files in tasks:
+        name = os.path.basename(path)
+        entry = manifest.get(name)
+        state = source_state(path, entry)
+        if is_current(PARTITIONS_DIR, entry, state) and entry.get('periodo') == periodo and len(entry.get('rule_hits', [])) == len(SPECIAL_CODE_RULES):
+            entry.update(state)  # Solo se refresca el mtime si el archivo fue tocado sin cambiar su contenido
+            continue
+        df, raw_evidence, rule_hits, cache_updates = load_quarter((path, periodo, n_files))
+        update_manifest(CACHE_DIR, cache_updates)
+        aggregates = {'evidencia': dump_evidence_states(evidence_states(raw_evidence, df))}
+        trabajo, no_trabajo = prepare_populations(df)
+        if entry:
+            # Archivos de una versión anterior de la partición que esta ya no produce
+            remove_partition(PARTITIONS_DIR, entry, keep=set(partition_files(name).values()))
+        manifest[name] = write_partition(PARTITIONS_DIR, name, {'trabajo': trabajo, 'no_trabajo': no_trabajo}, state, periodo, aggregates)
+        manifest[name]['rule_hits'] = rule_hits.tolist()
+        save_manifest(PARTITIONS_DIR, manifest)
+        processed.append(name)
+        print(f"Trimestre procesado: {name}")
+    save_manifest(PARTITIONS_DIR, manifest)
+    print(f"{len(processed)} trimestre(s) procesado(s), {len(tasks) - len(processed)} reutilizado(s) desde {PARTITIONS_DIR}")
+
+    if not processed and not removed and os.path.exists(path_trabajo) and os.path.exists(path_no_trabajo):
+        print("Sin trimestres nuevos ni modificados: las salidas existentes están al día.")
+        return None
+
+    # Recombinar en el orden de la fuente, por bloques; factor_ajustado depende del número total de trimestres
+    entries = [manifest[os.path.basename(path)] for path, _, _ in tasks]
+    for output, path_out in (('trabajo', path_trabajo), ('no_trabajo', path_no_trabajo)):
+        headers = [partition_columns(PARTITIONS_DIR, entry, output) for entry in entries]
+        if output == 'no_trabajo':
+            # El recorte hasta C300n depende del orden de columnas; como en el modo completo, manda el primer trimestre
+            columns = headers[0]
+        else:
+            # Las mismas columnas, en el mismo orden, que daría pd.concat de todas las particiones
+            columns = list(dict.fromkeys(col for header in headers for col in header))
+        tmp_path = f"{path_out}.{os.getpid()}.tmp"
+        header = True
+        for entry in entries:
+            for chunk in iter_partition(PARTITIONS_DIR, entry, output, chunksize):
+                chunk = chunk.reindex(columns=columns)
+                if 'factor_expansion' in chunk.columns:
+                    chunk['factor_ajustado'] = pd.to_numeric(chunk['factor_expansion'], errors='coerce') / len(entries)
+                chunk.to_csv(tmp_path, mode='w' if header else 'a', header=header, index=False)
+                header = False
+        if header:
+            pd.DataFrame(columns=columns).to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path_out)
+
+    states = {}
+    for entry in entries:
+        merge_evidence_states(states, load_evidence_states(read_aggregates(PARTITIONS_DIR, entry)['evidencia']))
+    rule_hits = np.sum([entry['rule_hits'] for entry in entries], axis=0)
+    write_evidence_from_states(states, rule_hits, evidence_jobs)
+    return pd.read_csv(path_trabajo, usecols=lambda col: col in ANALYSIS_COLUMNS)
+
+def prepare_income(df):
+    """
+    Columnas de análisis con INGTOT numérico y sin las filas sin ingreso. Se prepara una sola vez
+    y la comparten los Pasos 4 y 5.
+    """
+    df_ingreso = df[[col for col in ANALYSIS_COLUMNS if col in df.columns]]
+    ingreso = pd.to_numeric(df_ingreso['INGTOT'], errors='coerce')
+    return df_ingreso.assign(INGTOT=ingreso)[ingreso.notna()]
+
+def compute_income_thresholds(df_ingreso):
+    """
+    Umbrales de outliers de ingreso (Q1/Q3 -/+ 1.5*IQR, ponderados), calculados una vez para los Pasos 4 y 5.
+
+    El global ('Total') sale de los cuartiles ponderados exactos. Los de cada segmento de
+    OUTLIER_SEGMENTS salen de t-digests por trimestre, cacheados en DIGEST_DIR y fusionados entre
+    trimestres: una corrida con un trimestre nuevo solo construye el digest de ese trimestre.
+    """
+    umbrales = {'Total': exact_thresholds(df_ingreso, 'INGTOT')}
+    if PERIOD_COLUMN in df_ingreso.columns:
+        for col, label in OUTLIER_SEGMENTS.items():
+            if col in df_ingreso.columns:
+                umbrales[label] = digest_thresholds(merge_periods(period_digests(df_ingreso, 'INGTOT', by=col, cache_dir=DIGEST_DIR)))
+    return umbrales
+
+def analyze_outliers_and_visualize(df_ingreso, umbrales, evidence_jobs=None):
+    """
+    Paso 4: Realiza el análisis profundo de outliers de ingreso y prepara sus visualizaciones.
+
+    El resumen de distribución del ingreso (bins lineales, logarítmicos y del rango sin outliers,
+    cuantiles y boxplot) se calcula una vez y se guarda en resumen_distribucion_ingresos.json; la
+    figura se encola en `evidence_jobs`. Devuelve el nombre que tendrá la figura (derivado del hash
+    del resumen), o None si no se genera evidencia visual.
+    """
     print("\n--- Paso 4: Analizando outliers de ingreso y generando visualizaciones ---")
-    df_trabajo = df.copy()
-
-    # Ensure INGTOT is numeric for analysis, dropping rows where it's not applicable
-    df_trabajo['INGTOT'] = pd.to_numeric(df_trabajo['INGTOT'], errors='coerce')
-    df_trabajo.dropna(subset=['INGTOT'], inplace=True)
 
     # --- Profiling High-Income Outliers ---
-    Q1 = df_trabajo['INGTOT'].quantile(0.25)
-    Q3 = df_trabajo['INGTOT'].quantile(0.75)
-    IQR = Q3 - Q1
-    outlier_threshold = Q3 + 1.5 * IQR
-    df_high_earners = df_trabajo[df_trabajo['INGTOT'] > outlier_threshold]
+    # The summary's zoomed histogram stops at the same Q3 + 1.5*IQR outlier threshold as the report
+    income_summary = summarize(df_ingreso['INGTOT'], zoom_max=umbrales['Total']['umbral_superior'].iloc[0])
+    ruta_resumen = os.path.join(EVIDENCE_DIR, 'resumen_distribucion_ingresos.json')
+    save_summaries(ruta_resumen, {'INGTOT': income_summary})
+    print(f"Resumen de distribución del ingreso guardado en: {ruta_resumen}")
+
+    if evidence_jobs is None:
+        print("Evidencia visual omitida (--no-evidence).")
+        return None
 
     # --- Creating Refined Income Visualizations ---
-    fig, axes = plt.subplots(2, 2, figsize=(18, 12))
-    fig.suptitle('Análisis Exhaustivo de la Distribución del Ingreso Mensual', fontsize=20)
-
-    # Plot 1: Overall Distribution
-    axes[0, 0].hist(df_trabajo['INGTOT'], bins=50, color='skyblue', edgecolor='black')
-    axes[0, 0].set_title('Distribución General del Ingreso Mensual')
-    axes[0, 0].set_xlabel('Ingreso Total Mensual (S/.)'); axes[0, 0].set_ylabel('Frecuencia')
-    axes[0, 0].ticklabel_format(style='plain', axis='x')
-
-    # Plot 2: Log-Scale Distribution
-    axes[0, 1].hist(df_trabajo['INGTOT'], bins=50, color='lightgreen', edgecolor='black')
-    axes[0, 1].set_xscale('log')
-    axes[0, 1].set_title('Distribución del Ingreso (Escala Logarítmica)')
-    axes[0, 1].set_xlabel('Ingreso Total Mensual (S/.) - Escala Log'); axes[0, 1].set_ylabel('Frecuencia')
-
-    # Plot 3: "Zoomed-In" Distribution on non-outliers
-    df_zoomed = df_trabajo[df_trabajo['INGTOT'] <= outlier_threshold]
-    axes[1, 0].hist(df_zoomed['INGTOT'], bins=50, color='salmon', edgecolor='black')
-    axes[1, 0].set_title(f'Distribución Detallada (Ingresos <= S/.{outlier_threshold:,.0f})')
-    axes[1, 0].set_xlabel('Ingreso Total Mensual (S/.)'); axes[1, 0].set_ylabel('Frecuencia')
-
-    # Plot 4: Boxplot for Outlier Identification
-    axes[1, 1].boxplot(df_trabajo['INGTOT'], vert=False, patch_artist=True, boxprops=dict(facecolor='plum'))
-    axes[1, 1].set_xscale('log')
-    axes[1, 1].set_title('Diagrama de Caja para Identificar Outliers')
-    axes[1, 1].set_xlabel('Ingreso Total Mensual (S/.) - Escala Log')
-
-    plt.tight_layout(rect=[0, 0.03, 1, 0.95])
-
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    file_name = f"Analisis_Completo_Ingresos_{timestamp}.png"
-    file_path = os.path.join(EVIDENCE_DIR, file_name)
-    fig.savefig(file_path, bbox_inches='tight')
-    plt.close()
-    print(f"Visualización de análisis de ingresos guardada en: {file_path}")
-
-    # This function's purpose is now primarily visual analysis and saving evidence.
-    # The generation of text summaries will be handled by the reporting function.
-
-def generate_final_report(df):
-    """Paso 5: Realiza el análisis inferencial y compila el informe final en Markdown."""
-    print("\n--- Paso 5: Generando el informe analítico final ---")
-    df_trabajo = df.copy()
+    job = income_panel_job(income_summary, EVIDENCE_DIR, INCOME_PLOT_NAME)
+    evidence_jobs.append(job)
+    print(f"Visualización de análisis de ingresos en cola: {job['file']}")
+    return os.path.basename(job['file'])
+
+def generate_final_report(df_ingreso, umbrales, income_plot=None):
+    """
+    Paso 5: Realiza el análisis inferencial y compila el informe final en Markdown.
 
-    # --- 1. Data Preparation for Analysis ---
-    df_trabajo['INGTOT'] = pd.to_numeric(df_trabajo['INGTOT'], errors='coerce')
-    df_trabajo.dropna(subset=['INGTOT'], inplace=True)
+    Promedios, umbral de outliers y perfiles se ponderan con el factor de expansión (WEIGHT_COLUMN),
+    de modo que describen a la población y no solo a la muestra encuestada.
 
-    # --- 2. Hypothesis Testing (T-test: Gender Pay Gap) ---
-    ingreso_hombres = df_trabajo[df_trabajo['C207'] == 'Hombre']['INGTOT']
-    ingreso_mujeres = df_trabajo[df_trabajo['C207'] == 'Mujer']['INGTOT']
+    `income_plot` es el nombre de la figura de ingresos de esta corrida; si falta, se referencia la
+    versión vigente registrada en el índice de artefactos de EVIDENCE_DIR.
+    """
+    print("\n--- Paso 5: Generando el informe analítico final ---")
+    # --- 1. Hypothesis Testing (T-test: Gender Pay Gap) ---
+    ingreso_hombres = df_ingreso[df_ingreso['C207'] == 'Hombre']['INGTOT']
+    ingreso_mujeres = df_ingreso[df_ingreso['C207'] == 'Mujer']['INGTOT']
     t_stat, p_value = ttest_ind(ingreso_hombres, ingreso_mujeres, equal_var=False, nan_policy='omit')
+    ingreso_por_sexo = weighted_mean(df_ingreso, 'INGTOT', by='C207')
 
     ttest_summary = f"""
 ### Prueba de Hipótesis: Brecha Salarial de Género
 Se realizó una prueba T de Student para muestras independientes para comparar los ingresos medios entre hombres y mujeres.
-- **Ingreso Promedio Hombres:** S/. {ingreso_hombres.mean():,.2f}
-- **Ingreso Promedio Mujeres:** S/. {ingreso_mujeres.mean():,.2f}
+- **Ingreso Promedio Hombres (ponderado):** S/. {ingreso_por_sexo.get('Hombre', np.nan):,.2f}
+- **Ingreso Promedio Mujeres (ponderado):** S/. {ingreso_por_sexo.get('Mujer', np.nan):,.2f}
 - **Estadístico T:** {t_stat:.2f}
 - **Valor P:** {p_value:.3f}
 
 **Conclusión de la prueba:** Con un valor p de {p_value:.3f}, se observa una diferencia estadísticamente significativa en los ingresos entre hombres y mujeres.
 """
 
-    # --- 3. High-Earner Profile Analysis ---
-    Q1 = df_trabajo['INGTOT'].quantile(0.25)
-    Q3 = df_trabajo['INGTOT'].quantile(0.75)
-    IQR = Q3 - Q1
-    outlier_threshold = Q3 + 1.5 * IQR
-    df_high_earners = df_trabajo[df_trabajo['INGTOT'] > outlier_threshold]
+    # --- 2. High-Earner Profile Analysis ---
+    outlier_threshold = umbrales['Total']['umbral_superior'].iloc[0]
+    df_high_earners = df_ingreso[df_ingreso['INGTOT'] > outlier_threshold]
 
-    sex_dist = df_high_earners['C207'].value_counts(normalize=True) * 100
-    education_dist = df_high_earners['C366'].value_counts(normalize=True) * 100
-    age_group_dist = df_high_earners['grupo_edad'].value_counts(normalize=True) * 100
+    sex_dist = weighted_counts(df_high_earners, 'C207', normalize=True) * 100
+    education_dist = weighted_counts(df_high_earners, 'C366', normalize=True) * 100
+    age_group_dist = weighted_counts(df_high_earners, 'grupo_edad', normalize=True) * 100
 
     top_education = education_dist.index[0] if not education_dist.empty else "N/A"
     top_age_group = age_group_dist.index[0] if not age_group_dist.empty else "N/A"
@@ -273,13 +520,22 @@ Se realizó una prueba T de Student para muestras independientes para comparar l
 ### Análisis de Outliers: Perfil de Altos Ingresos
 El perfil de individuos con ingresos superiores a S/. {outlier_threshold:,.2f} (outliers) muestra que está predominantemente compuesto por **hombres ({sex_dist.get('Hombre', 0):.1f}%)**.
 El nivel educativo más común en este grupo es **'{top_education}'** ({education_dist.iloc[0]:.1f}%), y el grupo de edad más representativo es **'{top_age_group}'** ({age_group_dist.iloc[0]:.1f}%).
+"""
+    segment_tables = '\n\n'.join(
+        f"#### Por {label}\n\n{table[['n', 'q1', 'q3', 'umbral_superior']].round(2).to_markdown()}"
+        for label, table in umbrales.items() if label != 'Total'
+    )
+    if segment_tables:
+        summary_text += f"""
+### Umbrales de Outliers por Segmento
+Umbrales Q3 + 1.5*IQR del ingreso dentro de cada segmento, estimados con t-digests ponderados por trimestre fusionados entre trimestres (aproximados; el umbral global usa cuartiles exactos).
+
+{segment_tables}
 """
 
-    # --- 4. Assemble the Final Report ---
-    # Find the latest evidence files to reference in the report
-    evidence_files = os.listdir(EVIDENCE_DIR)
-    income_plot_files = sorted([f for f in evidence_files if f.startswith('Analisis_Completo_Ingresos_') and f.endswith('.png')], reverse=True)
-    latest_income_plot = income_plot_files[0] if income_plot_files else "income_plot_not_found.png"
+    # --- 3. Assemble the Final Report ---
+    # Reference this run's figure, or the current one in the artifact index
+    latest_income_plot = income_plot or lookup(EVIDENCE_DIR, INCOME_PLOT_NAME) or "income_plot_not_found.png"
 
     report_content = f"""
 # Informe Analítico de Empleabilidad y Brecha Salarial
@@ -308,15 +564,25 @@ El siguiente gráfico muestra la distribución del ingreso mensual desde cuatro
 El análisis revela una brecha salarial de género estadísticamente significativa. Además, los individuos con altos ingresos tienden a ser hombres con educación superior y en grupos de edad con mayor experiencia. Estos hallazgos subrayan la necesidad de políticas enfocadas en la equidad de género y el desarrollo profesional.
 """
 
-    # --- 5. Write the report file ---
+    # --- 4. Write the report file ---
     report_path = os.path.join(REPORTS_DIR, 'final_analytical_report.md')
     with open(report_path, 'w', encoding='utf-8') as f:
         f.write(report_content)
 
     print(f"Informe analítico final guardado en: {report_path}")
 
-def main():
+def main(argv=None):
     """Orquesta todo el flujo de trabajo."""
+    parser = argparse.ArgumentParser(description="Pipeline de análisis de empleabilidad.")
+    parser.add_argument('--workers', type=int, default=1, help="Procesos para la ingesta por trimestre (por defecto: 1).")
+    parser.add_argument('--stream', action='store_true', help="Procesa cada trimestre por bloques con memoria acotada (ignora --workers).")
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help=f"Filas por bloque en modo --stream y al recombinar particiones en --incremental (por defecto: {DEFAULT_CHUNKSIZE:,}).")
+    parser.add_argument('--no-evidence', action='store_true', help="No genera las figuras de evidencia (histogramas y análisis de ingresos).")
+    parser.add_argument('--evidence-workers', type=int, default=None, help="Procesos para renderizar la evidencia visual (por defecto: uno por CPU).")
+    parser.add_argument('--gc-evidence', action='store_true', help="Borra las figuras de evidencia que ya no están en el índice de artefactos (incluidas las de nombre con marca de tiempo).")
+    parser.add_argument('--incremental', action='store_true', help=f"Procesa solo los trimestres nuevos o modificados, guardando particiones en {PARTITIONS_DIR}.")
+    args = parser.parse_args(argv)
+
     # Asegurarse de que los directorios de salida existan
     os.makedirs(PROCESSED_DIR, exist_ok=True)
     os.makedirs(EVIDENCE_DIR, exist_ok=True)
@@ -325,20 +591,45 @@ def main():
     # Ejecutar el pipeline
     print("--- INICIANDO PIPELINE DE ANÁLISIS DE EMPLEABILIDAD ---")
 
-    master_df = load_and_unify_data()
-    df_cleaned = clean_special_codes(master_df, columns_to_visualize=['C208', 'INGTOT', 'whoraT'])
-    df_trabajo, df_no_trabajo = segregate_and_prepare(df_cleaned)
-
-    # Guardar los datasets procesados
+    evidence_jobs = None if args.no_evidence else []
     path_trabajo = os.path.join(PROCESSED_DIR, 'datos_limpios_poblacion_trabajo.csv')
     path_no_trabajo = os.path.join(PROCESSED_DIR, 'datos_limpios_poblacion_no_trabajo.csv')
-    df_trabajo.to_csv(path_trabajo, index=False)
-    df_no_trabajo.to_csv(path_no_trabajo, index=False)
-    print(f"\nDatasets procesados guardados en: {PROCESSED_DIR}")
+    if args.incremental:
+        df_trabajo = run_incremental(path_trabajo, path_no_trabajo, evidence_jobs, args.chunksize)
+        if df_trabajo is None:
+            print("\n--- PIPELINE COMPLETADO: NADA QUE ACTUALIZAR ---")
+            return
+    elif args.stream:
+        df_trabajo = run_streaming(path_trabajo, path_no_trabajo, args.chunksize, evidence_jobs)
+    else:
+        master_df, raw_evidence, rule_hits = load_and_unify_data(workers=args.workers)
+        df_cleaned = clean_special_codes(master_df, columns_to_visualize=EVIDENCE_COLUMNS, raw_df=raw_evidence, rule_hits=rule_hits, evidence_jobs=evidence_jobs)
+        df_trabajo, df_no_trabajo = segregate_and_prepare(df_cleaned)
+
+        # Guardar los datasets procesados
+        df_trabajo.to_csv(path_trabajo, index=False)
+        df_no_trabajo.to_csv(path_no_trabajo, index=False)
+    for path_out in (path_trabajo, path_no_trabajo):
+        write_partition_index(path_out)
+    print(f"\nDatasets procesados guardados en: {PROCESSED_DIR} (con índice de particiones por periodo)")
 
     # Ejecutar análisis y reporte sobre el dataset principal de trabajo
-    analyze_outliers_and_visualize(df_trabajo)
-    generate_final_report(df_trabajo)
+    df_ingreso = prepare_income(df_trabajo)
+    umbrales = compute_income_thresholds(df_ingreso)
+    income_plot = analyze_outliers_and_visualize(df_ingreso, umbrales, evidence_jobs)
+    generate_final_report(df_ingreso, umbrales, income_plot)
+
+    # Renderizar la evidencia visual al final, en paralelo, una vez escritos los datos y el informe
+    if evidence_jobs:
+        print(f"\n--- Paso 6: Renderizando {len(evidence_jobs)} figura(s) de evidencia ---")
+        rendered, reused = render_jobs(evidence_jobs, args.evidence_workers)
+        for file_path in rendered:
+            print(f"Evidencia visual guardada en: {file_path}")
+        if reused:
+            print(f"{len(reused)} figura(s) sin cambios en sus datos reutilizadas del almacén de artefactos.")
+    if args.gc_evidence:
+        removed = collect_garbage(EVIDENCE_DIR)
+        print(f"Recolección de artefactos: {len(removed)} figura(s) obsoleta(s) eliminada(s) de {EVIDENCE_DIR}")
 
     print("\n--- PIPELINE COMPLETADO EXITOSAMENTE ---")
 
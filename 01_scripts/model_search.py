@@ -0,0 +1,236 @@
+import argparse
+import itertools
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, f1_score, log_loss, roc_auc_score
+from sklearn.model_selection import StratifiedKFold
+from threadpoolctl import threadpool_limits
+
+from artifact_store import artifact_key
+from feature_store import feature_columns, load_feature_matrix, read_feature_matrix, scaled_pipeline
+
+# --- CONFIGURACIÓN ---
+DATA_PATH = '02_data_processed/datos_limpios_poblacion_trabajo.csv'
+CACHE_DIR = '02_data_processed/cache/model_search'
+LEADERBOARD_PATH = '04_reports/model_search_leaderboard.md'
+TARGET = 'es_informal'
+N_SPLITS = 5
+RANDOM_STATE = 42
+# Incrementar cuando cambie la forma de partir los folds, para invalidar el caché.
+FOLD_VERSION = 2
+NUMERIC_FEATURES = ['whoraT']
+# Conjuntos de variables a comparar; 'base' es el del modelo publicado (predictive_modeling.py)
+FEATURE_SETS = {
+    'base': ['grupo_edad', 'C207', 'C366', 'C310', 'whoraT'],
+    'extendido': ['grupo_edad', 'C207', 'C366', 'C310', 'whoraT', 'REGION', 'C311', 'C312', 'C377'],
+}
+# Rejilla de estimadores: nombre -> (clase, lista de parámetros)
+PARAM_GRID = {
+    'logistica': (LogisticRegression, [
+        {'C': C, 'class_weight': cw, 'max_iter': 1000, 'random_state': RANDOM_STATE}
+        for C, cw in itertools.product([0.01, 0.1, 1.0, 10.0], [None, 'balanced'])
+    ]),
+    'hist_gbm': (HistGradientBoostingClassifier, [
+        {'learning_rate': lr, 'max_leaf_nodes': leaves, 'class_weight': cw, 'random_state': RANDOM_STATE}
+        for lr, leaves, cw in itertools.product([0.05, 0.1], [7, 31], [None, 'balanced'])
+    ]),
+}
+# Estimadores que no aceptan matrices dispersas
+DENSE_ESTIMATORS = {'hist_gbm'}
+# Repeticiones para medir la latencia de una predicción individual
+LATENCY_REPEATS = 50
+
+# Matrices y folds ya cargados en este proceso (cada worker guarda los suyos)
+_loaded = {}
+
+
+def load_population(data_path=DATA_PATH):
+    """
+    Design matrix of the employed population with every candidate feature and the target, from the
+    feature store (same filter and imputation as predictive_modeling.py).
+    """
+    features = list(dict.fromkeys(itertools.chain.from_iterable(FEATURE_SETS.values())))
+    categorical = [col for col in features if col not in NUMERIC_FEATURES]
+    numeric = [col for col in features if col in NUMERIC_FEATURES]
+    return load_feature_matrix(data_path, numeric, categorical, TARGET, where={'OCUP300': 'Ocupado'})
+
+
+def usable_features(matrix, features):
+    """Drops categorical features missing from the data or without variation (nothing to learn from them)."""
+    kept, dropped = [], []
+    for col in features:
+        (kept if col in matrix['numeric'] or len(matrix['categories'].get(col, [])) > 1 else dropped).append(col)
+    return kept, dropped
+
+
+def build_folds(matrix, cache_dir=CACHE_DIR, n_splits=N_SPLITS):
+    """
+    Stratified fold indices of the matrix rows, cached as one .npz keyed by the matrix and the split
+    settings. Every feature set and candidate uses the same folds. Returns the file path.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    key = artifact_key(matrix['key'], n_splits, RANDOM_STATE, FOLD_VERSION)
+    path = os.path.join(cache_dir, f"folds_{key}.npz")
+    if not os.path.exists(path):
+        splitter = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=RANDOM_STATE)
+        folds = {}
+        for k, (train_idx, test_idx) in enumerate(splitter.split(np.zeros(len(matrix['y'])), matrix['y'])):
+            folds[f'train{k}'], folds[f'test{k}'] = train_idx, test_idx
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, **folds)
+        os.replace(tmp_path, path)
+    return path
+
+
+def _load(path, reader):
+    if path not in _loaded:
+        _loaded[path] = reader(path)
+    return _loaded[path]
+
+
+def _read_folds(path):
+    with np.load(path) as folds:
+        return {name: folds[name] for name in folds.files}
+
+
+def _init_worker():
+    # Un hilo por proceso: el paralelismo viene de los procesos, no de OpenMP/BLAS
+    threadpool_limits(1)
+
+
+def evaluate_fold(task):
+    """Worker: fits one candidate on one cached fold and returns its metrics and serving costs."""
+    candidate, estimator, params, features, matrix_path, folds_path, k = task
+    matrix = _load(matrix_path, read_feature_matrix)
+    folds = _load(folds_path, _read_folds)
+    X = matrix['X'][:, feature_columns(matrix, features)]
+    if estimator in DENSE_ESTIMATORS:
+        X = X.toarray()
+    X_train, y_train = X[folds[f'train{k}']], matrix['y'][folds[f'train{k}']]
+    X_test, y_test = X[folds[f'test{k}']], matrix['y'][folds[f'test{k}']]
+    model = scaled_pipeline(matrix, features, PARAM_GRID[estimator][0](**params))
+    started = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    probs = model.predict_proba(X_test)[:, 1]
+    batch_seconds = time.perf_counter() - started
+    one_row = X_test[:1]
+    started = time.perf_counter()
+    for _ in range(LATENCY_REPEATS):
+        model.predict_proba(one_row)
+    single_seconds = (time.perf_counter() - started) / LATENCY_REPEATS
+
+    return {
+        'candidato': candidate,
+        'roc_auc': roc_auc_score(y_test, probs),
+        'accuracy': accuracy_score(y_test, probs >= 0.5),
+        'f1': f1_score(y_test, probs >= 0.5, zero_division=0),
+        'log_loss': log_loss(y_test, probs, labels=[0, 1]),
+        'fit_s': fit_seconds,
+        'pred_lote_us_fila': batch_seconds / len(y_test) * 1e6,
+        'pred_individual_ms': single_seconds * 1e3,
+        'tamano_kb': len(pickle.dumps(model)) / 1024,
+    }
+
+
+def candidates(feature_sets=FEATURE_SETS, param_grid=PARAM_GRID):
+    """Yields (candidate name, feature set, estimator, params) for every grid point."""
+    for feature_set, (estimator, (_, grid)) in itertools.product(feature_sets, param_grid.items()):
+        for params in grid:
+            shown = ', '.join(f"{k}={v}" for k, v in params.items() if k not in ('max_iter', 'random_state'))
+            yield f"{estimator}[{shown}]|{feature_set}", feature_set, estimator, params
+
+
+def run_search(matrix, workers=1, cache_dir=CACHE_DIR, n_splits=N_SPLITS):
+    """
+    Cross-validates every candidate of PARAM_GRID on every feature set of FEATURE_SETS.
+
+    All fits read the same cached design matrix (feature sets are column selections of it) and
+    the same cached folds; the (candidate, fold) fits run in a process pool of `workers`. Returns
+    the leaderboard (mean and std over folds), best ROC AUC first, and the features dropped from
+    each set.
+    """
+    folds_path = build_folds(matrix, cache_dir, n_splits)
+    kept, dropped = {}, {}
+    for feature_set, features in FEATURE_SETS.items():
+        kept[feature_set], dropped[feature_set] = usable_features(matrix, features)
+
+    tasks = [(name, estimator, params, kept[feature_set], matrix['path'], folds_path, k)
+             for name, feature_set, estimator, params in candidates()
+             for k in range(n_splits)]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            results = list(pool.map(evaluate_fold, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+    else:
+        _init_worker()
+        results = [evaluate_fold(task) for task in tasks]
+
+    scores = pd.DataFrame(results)
+    leaderboard = scores.groupby('candidato', sort=False).mean()
+    leaderboard.insert(1, 'roc_auc_std', scores.groupby('candidato', sort=False)['roc_auc'].std())
+    leaderboard = leaderboard.sort_values(['roc_auc', 'pred_individual_ms'], ascending=[False, True]).reset_index(drop=False)
+    names = leaderboard.pop('candidato').str.rsplit('|', n=1, expand=True)
+    leaderboard.insert(0, 'modelo', names[0])
+    leaderboard.insert(1, 'variables', names[1])
+    return leaderboard, dropped
+
+
+def write_leaderboard(leaderboard, dropped, path, n_rows, n_splits, workers, elapsed):
+    """Writes the leaderboard as a Markdown report."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    feature_lines = '\n'.join(
+        f"- **{name}**: {', '.join(features)}" + (f" (descartadas por falta de datos o variación: {', '.join(dropped[name])})" if dropped[name] else '')
+        for name, features in FEATURE_SETS.items()
+    )
+    content = f"""# Búsqueda de Modelos: Informalidad Laboral
+
+Validación cruzada estratificada de {n_splits} folds sobre {n_rows:,} personas ocupadas (`{TARGET}`), {workers} worker(s), {elapsed:.1f} s en total.
+
+## Conjuntos de variables
+
+{feature_lines}
+
+## Ranking
+
+Métricas promedio sobre los folds (ordenado por ROC AUC). `fit_s`: tiempo de entrenamiento por fold; `pred_lote_us_fila`: latencia de predicción en lote por fila (µs); `pred_individual_ms`: latencia de una predicción individual (ms); `tamano_kb`: tamaño serializado del estimador.
+
+{leaderboard.round(4).to_markdown(index=False)}
+"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def main(argv=None):
+    """Runs the model search and writes the leaderboard."""
+    parser = argparse.ArgumentParser(description="Búsqueda de hiperparámetros y modelos con validación cruzada en paralelo.")
+    parser.add_argument('--data', default=DATA_PATH, help=f"CSV procesado (por defecto: {DATA_PATH}).")
+    parser.add_argument('--output', default=LEADERBOARD_PATH, help=f"Reporte del ranking (por defecto: {LEADERBOARD_PATH}).")
+    parser.add_argument('--folds', type=int, default=N_SPLITS, help=f"Número de folds (por defecto: {N_SPLITS}).")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Procesos de entrenamiento (por defecto: uno por CPU).")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help=f"Directorio de los folds (por defecto: {CACHE_DIR}).")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    matrix = load_population(args.data)
+    n_rows = len(matrix['y'])
+    n_candidates = sum(1 for _ in candidates())
+    print(f"--- Búsqueda de modelos: {n_candidates} candidatos x {args.folds} folds, {n_rows:,} filas, {args.workers} worker(s) ---")
+    leaderboard, dropped = run_search(matrix, args.workers, args.cache_dir, args.folds)
+    elapsed = time.perf_counter() - started
+    write_leaderboard(leaderboard, dropped, args.output, n_rows, args.folds, args.workers, elapsed)
+
+    print(leaderboard.head(10).round(4).to_markdown(index=False))
+    print(f"\nBúsqueda completada en {elapsed:.1f} s. Ranking guardado en: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import json
+import os
+import re
+
+import pandas as pd
+
+# --- CONFIGURACIÓN ---
+# Abreviaturas de meses usadas en los nombres de archivo del INEI ('Set' es la forma peruana de septiembre).
+MONTHS = {
+    'ene': 1, 'feb': 2, 'mar': 3, 'abr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'ago': 8, 'set': 9, 'sep': 9, 'oct': 10, 'nov': 11, 'dic': 12
+}
+PERIOD_COLUMN = 'periodo'
+INDEX_SUFFIX = '.index.json'
+
+_FILENAME_RE = re.compile(r'^Trim\s+(?P<months>[A-Za-zñÑ]+(?:-[A-Za-zñÑ]+)*)\s*-?\s*(?P<year>\d{4}|\d{2})\.csv$', re.IGNORECASE)
+
+
+def period_label(year, last_month):
+    """Label of the calendar quarter containing `last_month`, e.g. (2024, 11) -> '2024-Q4'."""
+    return f"{year}-Q{(last_month - 1) // 3 + 1}"
+
+
+def window_from_filename(file_name):
+    """
+    Resolves 'Trim Set-Oct-Nov24.csv' to (2024, 11): the year and last month of its rolling
+    window, the month the year suffix refers to. Returns None for names that do not follow the pattern.
+    """
+    match = _FILENAME_RE.match(os.path.basename(file_name))
+    if not match:
+        return None
+    months = [MONTHS.get(token[:3].lower()) for token in match.group('months').split('-')]
+    if not months or None in months:
+        return None
+    year = int(match.group('year'))
+    if year < 100:
+        year += 2000
+    return year, months[-1]
+
+
+def period_from_filename(file_name):
+    """
+    Resolves 'Trim Set-Oct-Nov24.csv' to '2024-Q4'.
+
+    A rolling quarter is labelled by the calendar quarter of its last month. Returns None for
+    names that do not follow the pattern.
+    """
+    window = window_from_filename(file_name)
+    return period_label(*window) if window else None
+
+
+def window_from_columns(path):
+    """
+    Resolves the (year, last month) of a quarterly CSV's window from its ANIO/MES columns.
+
+    MES holds the first month of the rolling quarter, so the window ends two months later
+    (rolling over into the next year when needed).
+    """
+    try:
+        months = pd.read_csv(path, usecols=['ANIO', 'MES'], skipinitialspace=True).dropna()
+    except (ValueError, OSError):
+        return None
+    if months.empty:
+        return None
+    first = months.sort_values(['ANIO', 'MES']).iloc[0]
+    year, last_month = int(first['ANIO']), int(first['MES']) + 2
+    if last_month > 12:
+        year, last_month = year + 1, last_month - 12
+    return year, last_month
+
+
+def period_from_columns(path):
+    """Resolves the period from the ANIO/MES columns of a quarterly CSV."""
+    window = window_from_columns(path)
+    return period_label(*window) if window else None
+
+
+def resolve_window(path):
+    """(year, last month) of a quarterly CSV's window: from its file name, or from its ANIO/MES columns as a fallback."""
+    return window_from_filename(path) or window_from_columns(path)
+
+
+def resolve_period(path):
+    """Period label of a quarterly CSV: from its file name, or from its ANIO/MES columns as a fallback."""
+    window = resolve_window(path)
+    return period_label(*window) if window else None
+
+
+def discover_quarter_files(source_dir):
+    """
+    Finds every 'Trim *.csv' under `source_dir` (recursively) and returns [(path, periodo)]
+    sorted by period, so that unified outputs hold each period in one contiguous block.
+    Files whose period cannot be resolved keep periodo=None and go last.
+
+    INEI's rolling windows overlap, so several files can resolve to one calendar quarter (e.g.
+    'Mar-Abr-May25' and 'Abr-May-Jun25' are both 2025-Q2). Only one file is kept per quarter: the
+    window that ends latest in it, which is the calendar quarter itself once it is published
+    (ties go to the first path in sort order). The files set aside are reported.
+    """
+    found = []
+    for root, _, files in os.walk(source_dir):
+        for file in files:
+            if file.lower().startswith('trim') and file.lower().endswith('.csv'):
+                path = os.path.join(root, file)
+                found.append((path, resolve_window(path)))
+    chosen = {}
+    unresolved = []
+    for path, window in sorted(found):
+        if window is None:
+            unresolved.append((path, None))
+            continue
+        periodo = period_label(*window)
+        chosen.setdefault(periodo, []).append((window[1], path))
+    result = []
+    for periodo, candidates in chosen.items():
+        # La ventana que termina más tarde en el trimestre; sorted() estable: en empate, la primera ruta
+        _, path = sorted(candidates, key=lambda item: -item[0])[0]
+        skipped = [os.path.relpath(other, source_dir) for _, other in candidates if other != path]
+        if skipped:
+            print(f"Aviso: varios archivos corresponden a {periodo}; se usa {os.path.relpath(path, source_dir)} y se omite(n): {', '.join(skipped)}")
+        result.append((path, periodo))
+    return sorted(result, key=lambda item: (item[1], os.path.basename(item[0]))) + sorted(unresolved, key=lambda item: os.path.basename(item[0]))
+
+
+# --- PARTITION INDEX ---
+
+def index_path(csv_path):
+    """Path of the partition index persisted next to a processed CSV."""
+    return csv_path + INDEX_SUFFIX
+
+
+def build_partition_index(periods):
+    """
+    Maps each period to the [start, stop) row range it occupies in `periods`.
+
+    Raises ValueError if a period is split across several blocks, since the index could not
+    then replace a scan.
+    """
+    periods = pd.Series(periods).reset_index(drop=True)
+    partitions = {}
+    valid = periods.notna()
+    for period, positions in periods[valid].groupby(periods[valid].astype(str), sort=False).groups.items():
+        start, stop = int(positions.min()), int(positions.max()) + 1
+        if stop - start != len(positions):
+            raise ValueError(f"Period {period} is not stored contiguously; sort the data by '{PERIOD_COLUMN}' first.")
+        partitions[period] = {'start': start, 'stop': stop}
+    return partitions
+
+
+def write_partition_index(csv_path, column=PERIOD_COLUMN):
+    """Builds the partition index of a processed CSV from its period column and saves it next to it."""
+    periods = pd.read_csv(csv_path, usecols=[column])[column]
+    index = {
+        'file': os.path.basename(csv_path),
+        'column': column,
+        'rows': len(periods),
+        'partitions': build_partition_index(periods)
+    }
+    with open(index_path(csv_path), 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+    return index
+
+
+def load_partition_index(csv_path):
+    """Returns the saved partition index of `csv_path`, or None if it has not been built."""
+    try:
+        with open(index_path(csv_path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def index_matches(index, df):
+    """True if `index` was built for a frame with the same number of rows as `df`."""
+    return index is not None and index.get('rows') == len(df)
+
+
+def select_periods(df, index, periods):
+    """Slices the rows of the selected periods out of `df` using the index ranges instead of a scan."""
+    ranges = sorted((index['partitions'][p]['start'], index['partitions'][p]['stop']) for p in periods if p in index['partitions'])
+    if not ranges:
+        return df.iloc[0:0]
+    if len(ranges) == 1:
+        return df.iloc[ranges[0][0]:ranges[0][1]]
+    return pd.concat([df.iloc[start:stop] for start, stop in ranges])
+
@@ -1,70 +1,46 @@
-import pandas as pd
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler, OneHotEncoder
-from sklearn.compose import ColumnTransformer
-from sklearn.pipeline import Pipeline
 from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import classification_report, confusion_matrix
-import pickle
+from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
+import sklearn
 import numpy as np
+from datetime import datetime, timezone
+
+from feature_store import decode_rows, load_feature_matrix, scaled_pipeline, scoring_artifact
+from linear_scorer import compile_scorer, save_scoring_artifact, score_frame
 
 # --- Phase 1: Model Training and Export ---
 
 # 1. Data Preparation for Modeling
 data_path = '02_data_processed/datos_limpios_poblacion_trabajo.csv'
-df = pd.read_csv(data_path, low_memory=False)
-
-# ** FIX: Filter for the employed population to avoid 'No Aplica' issues **
-# As per process_data.py, OCUP300 defines employment status.
-if 'OCUP300' in df.columns:
-    df = df[df['OCUP300'] == 'Ocupado'].copy()
-
 
 # Corrected feature names based on data processing script
 features = ['grupo_edad', 'C207', 'C366', 'C310', 'whoraT']
 target = 'es_informal'
+numerical_features = ['whoraT']
+categorical_features = ['grupo_edad', 'C207', 'C366', 'C310']
 
-# Rename columns for clarity in the modeling process and output
-df.rename(columns={
+# User-friendly names for the modeling output (and the exported model)
+feature_names = {
     'C207': 'Sexo',
     'C366': 'Nivel Educativo',
     'C310': 'Tipo de Ocupación'
-}, inplace=True)
-
-# The feature list now uses the new, user-friendly names
-features_renamed = ['grupo_edad', 'Sexo', 'Nivel Educativo', 'Tipo de Ocupación', 'whoraT']
-
-X = df[features_renamed]
-y = df[target]
-
+}
 
-# Handle Missing Values (Imputation)
-# The 'No Aplica' strings should now be gone, but we still handle potential NaNs.
-X['whoraT'] = pd.to_numeric(X['whoraT'], errors='coerce')
-X['whoraT'] = X['whoraT'].fillna(X['whoraT'].median())
-
-categorical_cols_renamed = ['grupo_edad', 'Sexo', 'Nivel Educativo', 'Tipo de Ocupación']
-for col in categorical_cols_renamed:
-    if col in X.columns and X[col].isnull().any():
-        X[col] = X[col].fillna(X[col].mode()[0])
-
-
-# Define categorical and numerical features using the new names
-numerical_features = ['whoraT']
-
-# 2. Preprocessing
-preprocessor = ColumnTransformer(
-    transformers=[
-        ('num', StandardScaler(), numerical_features),
-        ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_cols_renamed)
-    ])
+# 2. Preprocessing (feature store)
+# ** FIX: Filter for the employed population to avoid 'No Aplica' issues **
+# As per process_data.py, OCUP300 defines employment status.
+# The store encodes the data once (whoraT median / category mode imputation, one-hot CSR matrix) and
+# caches it by the content of the processed file, so retraining skips reading and encoding the CSV.
+matrix = load_feature_matrix(data_path, numerical_features, categorical_features, target, where={'OCUP300': 'Ocupado'})
+X, y = matrix['X'], matrix['y']
+print(f"Design matrix: {X.shape[0]:,} rows x {X.shape[1]} columns ({'from the feature store' if matrix['cached'] else 'built and cached'})")
 
 # 3. Train-Test Split
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+train_idx, test_idx = train_test_split(np.arange(len(y)), test_size=0.2, random_state=42, stratify=y)
+X_train, X_test, y_train, y_test = X[train_idx], X[test_idx], y[train_idx], y[test_idx]
 
 # 4. Model Training
-model_pipeline = Pipeline(steps=[('preprocessor', preprocessor),
-                                 ('classifier', LogisticRegression(random_state=42, max_iter=1000))])
+model_pipeline = scaled_pipeline(matrix, features, LogisticRegression(random_state=42, max_iter=1000))
 
 model_pipeline.fit(X_train, y_train)
 
@@ -81,24 +57,34 @@ print("---------------------------------")
 
 
 # 6. Export Artifacts
-model_filename = 'informality_model.pickle'
-with open(model_filename, 'wb') as f:
-    pickle.dump(model_pipeline, f)
+# The model is exported as a versioned JSON artifact (scaler, category tables, coefficients, imputation
+# medians and training metadata) instead of a pickle: it loads without sklearn and cannot execute code.
+training_metadata = {
+    'trained_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    'sklearn_version': sklearn.__version__,
+    'data': data_path,
+    'target': target,
+    'train_rows': int(X_train.shape[0]),
+    'test_rows': int(X_test.shape[0]),
+    'test_accuracy': float(accuracy_score(y_test, y_pred)),
+    'random_state': 42
+}
+model_artifact = scoring_artifact(matrix, features, model_pipeline, names=feature_names, metadata=training_metadata)
+model_filename = '05_dashboard/informality_model.json'
+save_scoring_artifact(model_filename, model_artifact)
 print(f"Model saved to {model_filename}")
 
-# Export Model Parameters for JavaScript
-log_reg_model = model_pipeline.named_steps['classifier']
-preprocessor_fitted = model_pipeline.named_steps['preprocessor']
-one_hot_encoder = preprocessor_fitted.named_transformers_['cat']
-
-encoded_feature_names = list(one_hot_encoder.get_feature_names_out(categorical_cols_renamed))
-final_columns = numerical_features + encoded_feature_names
+# Parity check: the NumPy scorer must reproduce the pipeline's probabilities on the test set
+pipeline_probs = model_pipeline.predict_proba(X_test)[:, 1]
+test_records = decode_rows(matrix, test_idx, features).rename(columns=feature_names)
+scorer_probs = score_frame(compile_scorer(model_artifact), test_records)
+max_diff = np.abs(pipeline_probs - scorer_probs).max()
+assert max_diff < 1e-9, f"Scoring artifact diverges from the pipeline (max |diff| = {max_diff:.3g})"
+print(f"Scorer parity check passed on {X_test.shape[0]:,} test rows (max |diff| = {max_diff:.3g})")
 
-print("\n--- JavaScript Model Parameters ---")
-print(f"const model_intercept = {log_reg_model.intercept_[0]};")
-print(f"const model_coefficients = {list(log_reg_model.coef_[0])};")
-print(f"const model_columns = {final_columns};")
-print("-----------------------------------\n")
+# The web pages (index.html, dashboard.html) fetch the same artifact through model_scorer.js,
+# so retraining updates the browser classifier without copying parameters by hand
+print(f"Web pages will load {len(model_artifact['columns'])} coefficients from {model_filename}\n")
 
 
 # --- Phase 3: Automated Documentation Generation ---
@@ -163,8 +149,8 @@ The model demonstrates strong predictive power, with high accuracy, precision, a
 A key innovation in this project is the direct deployment of the model's logic into a client-side web application. This was achieved as follows:
 
 1.  **Model Training**: The `LogisticRegression` model was trained in Python as described.
-2.  **Parameter Extraction**: After training, the model's learned parameters were extracted: Intercept, Coefficients, and the specific order of the preprocessed feature columns.
-3.  **JavaScript Embedding**: These parameters were exported into a JavaScript-friendly format and embedded directly into the `index.html` file. The web application uses these values to replicate the model's prediction formula.
+2.  **Parameter Extraction**: After training, the model's learned parameters were extracted: Intercept, Coefficients, and the specific order of the preprocessed feature columns. They are saved with the scaler statistics, encoder categories and training metadata in the versioned JSON artifact `05_dashboard/informality_model.json`, which the dashboard and the batch scorer load without scikit-learn.
+3.  **JavaScript Scoring**: `index.html` and `dashboard.html` fetch the same JSON artifact at load time and score it with `model_scorer.js`, which replicates the model's prediction formula (including the `whoraT` scaling) over typed arrays. Retraining updates the web application without editing the pages.
 
 This approach makes the predictive tool lightweight, serverless, and easily distributable.
 
@@ -188,7 +174,7 @@ print(f"Documentation generated at {doc_path}")
 
 # Also, let's get a sample of the test data for the web app
 print("\n--- Sample Test Data for Web App (first 20 rows) ---")
-test_sample = X_test.head(20).copy()
-test_sample['es_informal_real'] = y_test.head(20)
+test_sample = test_records.head(20).copy()
+test_sample['es_informal_real'] = y_test[:20]
 print(test_sample.to_json(orient='records', indent=2))
 print("----------------------------------------------------")
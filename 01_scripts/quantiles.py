@@ -0,0 +1,209 @@
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from artifact_store import artifact_key
+from periods import PERIOD_COLUMN
+from weighted_stats import WEIGHT_COLUMN, group_codes, weighted_quantiles, weights_of
+
+# --- CONFIGURACIÓN ---
+DIGEST_DIR = '02_data_processed/cache/quantiles'
+# Compresión del t-digest: a lo sumo ~COMPRESSION/2 centroides por segmento
+COMPRESSION = 200
+# Incrementar cuando cambie la construcción de los digests, para invalidar el caché.
+DIGEST_VERSION = 2
+# Peso de los digests por trimestre: el factor de expansión sin dividir por el número de trimestres
+# (los cuantiles no cambian si se escalan todos los pesos), así agregar un trimestre no invalida los demás
+DIGEST_WEIGHT = 'factor_expansion'
+# Multiplicador del rango intercuartílico para los umbrales de outliers (regla de Tukey)
+IQR_FACTOR = 1.5
+TOTAL_SEGMENT = 'Total'
+
+
+def _k_index(q, compression):
+    # Escala k1 del t-digest desplazada a 0: centroides pequeños en las colas y grandes en el centro
+    return np.floor(compression / (2 * np.pi) * (np.arcsin(2 * np.clip(q, 0.0, 1.0) - 1) + np.pi / 2)).astype(np.int64)
+
+
+def _segment_key(label):
+    return ' | '.join(str(k) for k in label) if isinstance(label, tuple) else str(label)
+
+
+def _digests(codes, x, w, compression):
+    """
+    t-digests of `x` for every group code in one sort of (code, value): each point goes to the
+    centroid given by the k-scale of the group's cumulative weight before it, so no centroid spans
+    more than one unit of k. Points can be raw rows (weight = survey weight) or the centroids of
+    other digests, which is how digests merge. Returns {code: digest}.
+    """
+    keep = (codes >= 0) & np.isfinite(x) & np.isfinite(w) & (w > 0)
+    codes, x, w = codes[keep], x[keep], w[keep]
+    if len(codes) == 0:
+        return {}
+    order = np.lexsort((x, codes))
+    codes, x, w = codes[order], x[order], w[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], len(codes)]
+    group = np.repeat(np.arange(len(starts)), ends - starts)
+    cum = np.cumsum(w)
+    before = np.where(starts > 0, cum[starts - 1], 0.0)
+    totals = cum[ends - 1] - before
+    q_left = (cum - w - before[group]) / totals[group]
+    per_group = compression // 2 + 1
+    cluster = group * per_group + _k_index(q_left, compression)
+    n_clusters = len(starts) * per_group
+    weights = np.bincount(cluster, weights=w, minlength=n_clusters).reshape(len(starts), per_group)
+    sums = np.bincount(cluster, weights=w * x, minlength=n_clusters).reshape(len(starts), per_group)
+    counts = np.bincount(cluster, minlength=n_clusters).reshape(len(starts), per_group)
+
+    digests = {}
+    for i, code in enumerate(codes[starts]):
+        used = counts[i] > 0
+        digests[int(code)] = {
+            'weight': float(totals[i]), 'min': float(x[starts[i]]), 'max': float(x[ends[i] - 1]),
+            'means': (sums[i, used] / weights[i, used]).tolist(), 'weights': weights[i, used].tolist()
+        }
+    return digests
+
+
+def build_digests(df, value, by=None, weight=WEIGHT_COLUMN, compression=COMPRESSION):
+    """
+    Weighted t-digests of `value` per `by` segment (missing values and non-positive weights are
+    ignored), keyed like summarize_groups ('level' or 'level | level'; TOTAL_SEGMENT for by=None).
+    Each digest is a JSON-serializable dict with the total weight, row count, min, max and the
+    centroid means and weights.
+    """
+    x = pd.to_numeric(df[value], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    w = weights_of(df, weight)
+    if by is None:
+        codes, labels = np.zeros(len(df), dtype=np.int64), (lambda ids: [TOTAL_SEGMENT] * len(ids))
+    else:
+        codes, _, labels = group_codes(df, by)
+    digests = _digests(codes, x, w, compression)
+    present = np.isfinite(x) & (w > 0) & (codes >= 0)
+    rows = np.bincount(codes[present], minlength=max(digests, default=-1) + 1)
+    ids = np.asarray(sorted(digests), dtype=np.int64)
+    result = {}
+    for code, label in zip(ids, labels(ids)):
+        result[_segment_key(label)] = dict(digests[int(code)], n=int(rows[code]))
+    return result
+
+
+def merge_digests(digests, compression=COMPRESSION):
+    """Merges digests (e.g. of several quarters) into one, re-compressing their centroids; no raw rows are needed."""
+    digests = [d for d in digests if d and d['weights']]
+    if not digests:
+        return None
+    means = np.concatenate([d['means'] for d in digests])
+    weights = np.concatenate([d['weights'] for d in digests])
+    merged = _digests(np.zeros(len(means), dtype=np.int64), means, weights, compression)[0]
+    merged.update(
+        min=min(d['min'] for d in digests), max=max(d['max'] for d in digests),
+        weight=float(sum(d['weight'] for d in digests)), n=sum(d['n'] for d in digests)
+    )
+    return merged
+
+
+def digest_quantiles(digest, q):
+    """
+    Approximate quantiles from a digest: the weighted CDF is interpolated between centroid
+    centers, anchored at the minimum and maximum. Returns a float for a scalar q.
+    """
+    qs = np.atleast_1d(np.asarray(q, dtype='float64'))
+    if not digest or not digest['weights']:
+        result = np.full(len(qs), np.nan)
+    else:
+        means, weights = np.asarray(digest['means']), np.asarray(digest['weights'])
+        total = weights.sum()
+        centers = np.cumsum(weights) - weights / 2
+        result = np.interp(qs * total, np.r_[0.0, centers, total], np.r_[digest['min'], means, digest['max']])
+    return float(result[0]) if np.ndim(q) == 0 else result
+
+
+def _series_slug(value, by_cols):
+    # Prefijo de los archivos de una serie (valor y segmentos), para podar solo los suyos
+    return '_'.join([value, '-'.join(by_cols) or TOTAL_SEGMENT])
+
+
+def period_digests(df, value, by=None, weight=DIGEST_WEIGHT, period=PERIOD_COLUMN, cache_dir=DIGEST_DIR, compression=COMPRESSION):
+    """
+    {period: {segment: digest}} for every quarter of `df`.
+
+    Each quarter's digests are cached in `cache_dir` under a key of that quarter's rows (value,
+    weight and segment columns) and the digest settings, so a run where one quarter changed only
+    rebuilds that quarter; the others are read back without sorting their rows. The default weight
+    is the unscaled expansion factor: factor_ajustado depends on the number of quarters, which
+    would change every key when a quarter is added. Cached digests of the same value and segments
+    that no quarter uses any more are deleted.
+    """
+    by_cols = [] if by is None else [by] if isinstance(by, str) else list(by)
+    columns = [col for col in [value, weight] + by_cols if col and col in df.columns]
+    slug = _series_slug(value, by_cols)
+    os.makedirs(cache_dir, exist_ok=True)
+    result = {}
+    used = set()
+    for periodo, part in df.groupby(period, sort=True):
+        key = artifact_key(part[columns].reset_index(drop=True), value, by_cols, weight, compression, DIGEST_VERSION)
+        name = f"digests_{slug}_{key}.json"
+        used.add(name)
+        path = os.path.join(cache_dir, name)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                result[periodo] = json.load(f)
+            continue
+        result[periodo] = build_digests(part, value, by, weight, compression)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(result[periodo], f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    # Poda: digests de esta serie que ya no corresponden a ningún trimestre, y los del formato
+    # anterior (sin prefijo de serie), que ninguna corrida vuelve a leer
+    stale = re.compile(rf"digests_(?:{re.escape(slug)}_)?[0-9a-f]+\.json")
+    for name in os.listdir(cache_dir):
+        if name not in used and stale.fullmatch(name):
+            os.remove(os.path.join(cache_dir, name))
+    return result
+
+
+def merge_periods(digests_by_period, periods=None, compression=COMPRESSION):
+    """Merges per-quarter digests into one digest per segment, over `periods` (all quarters by default)."""
+    segments = {}
+    for periodo, digests in digests_by_period.items():
+        if periods is not None and periodo not in periods:
+            continue
+        for segment, digest in digests.items():
+            segments.setdefault(segment, []).append(digest)
+    return {segment: merge_digests(digests, compression) for segment, digests in segments.items()}
+
+
+def _threshold_table(index, rows, q1, q3, factor):
+    iqr = q3 - q1
+    table = pd.DataFrame({'n': rows, 'q1': q1, 'q3': q3, 'iqr': iqr, 'umbral_inferior': q1 - factor * iqr, 'umbral_superior': q3 + factor * iqr}, index=index)
+    table.index.name = 'segmento'
+    return table
+
+
+def digest_thresholds(digests, factor=IQR_FACTOR):
+    """Tukey outlier thresholds (Q1/Q3 -/+ factor * IQR) per segment from {segment: digest}."""
+    segments = [segment for segment, digest in digests.items() if digest]
+    quartiles = np.array([digest_quantiles(digests[segment], [0.25, 0.75]) for segment in segments]).reshape(-1, 2)
+    rows = [digests[segment]['n'] for segment in segments]
+    return _threshold_table(pd.Index(segments), rows, quartiles[:, 0], quartiles[:, 1], factor)
+
+
+def exact_thresholds(df, value, by=None, weight=WEIGHT_COLUMN, factor=IQR_FACTOR):
+    """Tukey outlier thresholds per segment from exact weighted quartiles (one sort of all rows)."""
+    x = pd.to_numeric(df[value], errors='coerce')
+    frame = df.assign(**{value: x})
+    present = x.notna()
+    if by is None:
+        q1, q3 = weighted_quantiles(frame, value, [0.25, 0.75], weight)
+        return _threshold_table(pd.Index([TOTAL_SEGMENT]), [int(present.sum())], np.array([q1]), np.array([q3]), factor)
+    quartiles = weighted_quantiles(frame, value, [0.25, 0.75], weight, by=by)
+    rows = frame[present].groupby(by, sort=True, observed=True).size().reindex(quartiles.index).to_numpy()
+    index = pd.Index([_segment_key(label) for label in quartiles.index])
+    return _threshold_table(index, rows, quartiles[0.25].to_numpy(), quartiles[0.75].to_numpy(), factor)
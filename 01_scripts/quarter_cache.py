@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from survey_schema import coerce_to_schema, fit_schema, read_csv_kwargs, read_dtypes
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow es opcional: sin él se parsea el CSV en cada corrida
+    pa = None
+    feather = None
+
+# --- CONFIGURACIÓN ---
+# Incrementar cuando cambie la forma en que se parsea un trimestre, para invalidar el caché.
+CACHE_VERSION = 3
+MANIFEST_NAME = 'manifest.json'
+# Archivos de trimestres cacheados (cualquier versión); los .tmp de escrituras en curso no coinciden
+CACHE_FILE_PATTERN = re.compile(r'[0-9a-f]{20}-v\d+\.arrow')
+
+
+def file_fingerprint(path):
+    """Returns the cheap stat-based fingerprint (size and mtime) of a source file."""
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def content_hash(path, block_size=1 << 20):
+    """Returns the SHA-256 of a file, read in fixed-size blocks."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _read_untyped(path, **kwargs):
+    # Sin tipos numéricos, para coaccionar columna a columna cuando algún valor no entra en el tipo
+    # declarado; las columnas de texto se leen como texto para no perder ceros a la izquierda
+    text = {col: dtype for col, dtype in read_dtypes().items() if dtype == 'str'}
+    return pd.read_csv(path, dtype=text, low_memory=False, skipinitialspace=True, **kwargs)
+
+
+def parse_quarter_csv(path):
+    """Parses one quarterly CSV with the dictionary dtypes; blank cells come back as NaN."""
+    try:
+        return fit_schema(pd.read_csv(path, **read_csv_kwargs()))
+    except (ValueError, TypeError, OverflowError):
+        # Un valor fuera del dominio declarado: se parsea sin tipos y se coacciona columna a columna.
+        df = _read_untyped(path)
+        df.replace(r'^\s*$', np.nan, regex=True, inplace=True)
+        return coerce_to_schema(df)
+
+
+def iter_quarter_csv(path, chunksize):
+    """
+    Yields typed chunks of at most `chunksize` rows from one quarterly CSV, bypassing the cache.
+    A chunk that does not parse under the declared dtypes switches the rest of the file to the
+    same column-by-column coercion as parse_quarter_csv.
+    """
+    rows = 0
+    try:
+        with pd.read_csv(path, chunksize=chunksize, **read_csv_kwargs()) as reader:
+            for chunk in reader:
+                rows += len(chunk)
+                yield fit_schema(chunk)
+        return
+    except (ValueError, TypeError, OverflowError):
+        pass
+    # Se retoma después de las filas ya entregadas (la fila 0 es el encabezado)
+    with _read_untyped(path, chunksize=chunksize, skiprows=range(1, rows + 1)) as reader:
+        for chunk in reader:
+            chunk.replace(r'^\s*$', np.nan, regex=True, inplace=True)
+            yield coerce_to_schema(chunk)
+
+
+def _load_manifest(cache_dir):
+    manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def update_manifest(cache_dir, updates):
+    """
+    Records {source path: entry} updates from load_quarter_csv in the manifest and deletes the
+    cached quarters no entry references any more. Runs in one process only (the parent of the
+    ingestion pool), so no update is lost and no worker's fresh file is pruned before it is listed.
+    """
+    if not updates:
+        return
+    manifest = _load_manifest(cache_dir)
+    manifest.update(updates)
+    # Las fuentes que ya no existen dejan de fijar su caché
+    manifest = {source: item for source, item in manifest.items() if source in updates or os.path.exists(source)}
+    manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    _prune_cache(cache_dir, manifest)
+
+
+def _prune_cache(cache_dir, manifest):
+    """Deletes the cached quarters (older contents or cache versions) that no manifest entry references."""
+    referenced = {os.path.basename(_cache_path(cache_dir, item['sha256'])) for item in manifest.values() if 'sha256' in item}
+    for name in os.listdir(cache_dir):
+        if CACHE_FILE_PATTERN.fullmatch(name) and name not in referenced:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except FileNotFoundError:  # otro programa (p. ej. el dashboard) ya lo borró
+                pass
+
+
+def _cache_path(cache_dir, digest):
+    return os.path.join(cache_dir, f"{digest[:20]}-v{CACHE_VERSION}.arrow")
+
+
+def load_quarter_csv(path, cache_dir):
+    """
+    Reads one quarterly CSV through a content-addressed Arrow IPC cache.
+
+    The manifest maps each source file to its size, mtime and SHA-256. When size
+    and mtime are unchanged the hash is trusted without re-reading the file;
+    otherwise the file is re-hashed and only re-parsed if its content changed.
+    Cached quarters are memory-mapped instead of parsed.
+
+    The manifest is only read here, so ingestion workers can call this in
+    parallel. Returns (df, updates): the {source path: entry} changes the caller
+    passes to update_manifest once every worker is done.
+    """
+    if feather is None or cache_dir is None:
+        return parse_quarter_csv(path), {}
+
+    os.makedirs(cache_dir, exist_ok=True)
+    key = os.path.abspath(path)
+    fingerprint = file_fingerprint(path)
+    entry = _load_manifest(cache_dir).get(key)
+
+    if entry and entry.get('size') == fingerprint['size'] and entry.get('mtime_ns') == fingerprint['mtime_ns']:
+        digest = entry['sha256']
+    else:
+        digest = content_hash(path)
+    current = dict(fingerprint, sha256=digest)
+    updates = {} if entry == current else {key: current}
+
+    arrow_path = _cache_path(cache_dir, digest)
+    if os.path.exists(arrow_path):
+        try:
+            return feather.read_table(arrow_path, memory_map=True).to_pandas(), updates
+        except (OSError, pa.ArrowInvalid):
+            pass
+
+    df = parse_quarter_csv(path)
+    tmp_path = f"{arrow_path}.{os.getpid()}.tmp"
+    # Sin compresión para que las lecturas posteriores puedan hacer memory-map.
+    feather.write_feather(df, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, arrow_path)
+    return df, {key: current}
+
+
+def read_quarter_csv(path, cache_dir):
+    """Single-process read through the cache: load_quarter_csv plus its manifest update."""
+    df, updates = load_quarter_csv(path, cache_dir)
+    if updates:
+        update_manifest(cache_dir, updates)
+    return df
@@ -0,0 +1,113 @@
+import json
+import os
+
+import pandas as pd
+
+from quarter_cache import content_hash, file_fingerprint
+
+# --- CONFIGURACIÓN ---
+# Incrementar cuando cambie la limpieza o el feature engineering por trimestre, para forzar su reproceso.
+PARTITION_VERSION = 2
+MANIFEST_NAME = 'manifest.json'
+# Salidas que el pipeline guarda por trimestre: poblaciones procesadas (CSV) y agregados combinables
+# de la corrida (JSON, p. ej. los estados de las columnas de evidencia)
+PARTITION_OUTPUTS = ('trabajo', 'no_trabajo')
+AGGREGATES_OUTPUT = 'agregados'
+
+
+def load_manifest(partitions_dir):
+    """Returns {source file name: entry} for the quarters already processed into `partitions_dir`."""
+    manifest_path = os.path.join(partitions_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(partitions_dir, manifest):
+    """Atomically writes the partition manifest."""
+    manifest_path = os.path.join(partitions_dir, MANIFEST_NAME)
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def source_state(path, entry=None):
+    """
+    Fingerprint of a source CSV: size, mtime and SHA-256.
+
+    The stored hash is trusted when size and mtime match the manifest entry, so unchanged
+    quarters are detected without re-reading them.
+    """
+    fingerprint = file_fingerprint(path)
+    if entry and entry.get('size') == fingerprint['size'] and entry.get('mtime_ns') == fingerprint['mtime_ns']:
+        return dict(fingerprint, sha256=entry['sha256'])
+    return dict(fingerprint, sha256=content_hash(path))
+
+
+def is_current(partitions_dir, entry, state):
+    """True if the partition in `entry` was built from `state` by this PARTITION_VERSION and its files exist."""
+    if not entry or entry.get('version') != PARTITION_VERSION or entry.get('sha256') != state['sha256']:
+        return False
+    return all(os.path.exists(os.path.join(partitions_dir, name)) for name in entry['files'].values())
+
+
+def partition_files(source_name):
+    """File names of the outputs of one quarter, derived from its source file name."""
+    stem = os.path.splitext(source_name)[0].replace(' ', '_')
+    files = {output: f"{stem}_{output}.csv" for output in PARTITION_OUTPUTS}
+    files[AGGREGATES_OUTPUT] = f"{stem}_{AGGREGATES_OUTPUT}.json"
+    return files
+
+
+def write_partition(partitions_dir, source_name, frames, state, periodo, aggregates=None):
+    """Writes the outputs and the JSON-serializable `aggregates` of one quarter and returns its manifest entry."""
+    files = partition_files(source_name)
+    for output, frame in frames.items():
+        final_path = os.path.join(partitions_dir, files[output])
+        tmp_path = f"{final_path}.{os.getpid()}.tmp"
+        frame.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, final_path)
+    final_path = os.path.join(partitions_dir, files[AGGREGATES_OUTPUT])
+    tmp_path = f"{final_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(aggregates or {}, f, ensure_ascii=False)
+    os.replace(tmp_path, final_path)
+    rows = {output: len(frame) for output, frame in frames.items()}
+    return dict(state, version=PARTITION_VERSION, periodo=periodo, files=files, rows=rows)
+
+
+def partition_columns(partitions_dir, entry, output):
+    """Header of one population output of a partition."""
+    return list(pd.read_csv(os.path.join(partitions_dir, entry['files'][output]), nrows=0).columns)
+
+
+def iter_partition(partitions_dir, entry, output, chunksize):
+    """
+    Streams one population output of a partition in chunks of `chunksize` rows, read as text so
+    that re-combining them reproduces the cells exactly.
+    """
+    path = os.path.join(partitions_dir, entry['files'][output])
+    with pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def read_aggregates(partitions_dir, entry):
+    """Reads back the aggregates stored with a partition."""
+    with open(os.path.join(partitions_dir, entry['files'][AGGREGATES_OUTPUT]), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def remove_partition(partitions_dir, entry, keep=()):
+    """Deletes the files of a partition whose source quarter is gone (except the names in `keep`)."""
+    for name in entry.get('files', {}).values():
+        if name in keep:
+            continue
+        path = os.path.join(partitions_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
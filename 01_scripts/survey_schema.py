@@ -0,0 +1,192 @@
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+# --- CONFIGURACIÓN ---
+DICTIONARY_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '00_data_source', 'by_trim_nacional', 'diccionario_variables.md'
+)
+
+# Label assigned to non-employed respondents in the C3/I3/D3 block of the worker frame.
+NO_APLICA = 'No Aplica'
+
+_HEADER_RE = re.compile(r'^###\s+(\S+)')
+_TIPO_RE = re.compile(r'\*\*Tipo:\*\*\s*(.+?)\.?\s*$')
+_LABEL_RE = re.compile(r'\*\*Nombre Real \(Etiqueta\):\*\*\s*(.+?)\s*$')
+_CATEGORY_RE = re.compile(r'^\s*-\s*`(-?\d+)`:')
+_RANGE_RE = re.compile(r'Rango de (\d+) a (\d+)')
+_MISSING_RE = re.compile(r'`(\d+)` indica "Missing value"')
+
+
+def _int_dtype(max_value):
+    """Smallest nullable integer dtype able to hold values up to `max_value`."""
+    for dtype, limit in (('Int8', np.iinfo(np.int8).max), ('Int16', np.iinfo(np.int16).max), ('Int32', np.iinfo(np.int32).max)):
+        if max_value <= limit:
+            return dtype
+    return 'Int64'
+
+
+@lru_cache(maxsize=None)
+def parse_dictionary(path=DICTIONARY_PATH):
+    """
+    Parses `diccionario_variables.md` into {variable: spec}.
+
+    Each spec holds the declared type ('Numérica', 'Categórica' or 'Categórica (Carácter)'),
+    the label, the declared category codes, the range upper bound and the missing-value codes.
+    """
+    specs = {}
+    current = None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            header = _HEADER_RE.match(line)
+            if header:
+                current = {'tipo': None, 'label': '', 'codes': [], 'max': None, 'missing': []}
+                specs[header.group(1)] = current
+                continue
+            if current is None:
+                continue
+            tipo = _TIPO_RE.search(line)
+            if tipo:
+                current['tipo'] = tipo.group(1)
+                continue
+            label = _LABEL_RE.search(line)
+            if label:
+                current['label'] = label.group(1)
+                continue
+            category = _CATEGORY_RE.match(line)
+            if category:
+                current['codes'].append(int(category.group(1)))
+                continue
+            rango = _RANGE_RE.search(line)
+            if rango:
+                current['max'] = int(rango.group(2))
+            current['missing'].extend(int(code) for code in _MISSING_RE.findall(line))
+    return {var: spec for var, spec in specs.items() if spec['tipo']}
+
+
+def column_dtype(spec):
+    """
+    Maps one dictionary spec to a compact pandas dtype, or None to let pandas infer it.
+
+    Coded categoricals become the smallest nullable integer that fits their codes; incomes
+    (labels mentioning 'ingreso' or a 999999 sentinel) become float32; expansion factors stay
+    float64 so that weighted sums keep their precision.
+    """
+    tipo = spec['tipo']
+    label = spec['label'].lower()
+    if tipo.startswith('Categórica (Carácter)'):
+        return 'str'
+    if tipo.startswith('Categórica'):
+        codes = spec['codes'] + spec['missing']
+        return _int_dtype(max(codes)) if codes else None
+    if 'factor de expansión' in label:
+        return 'float64'
+    bound = max([spec['max'] or 0] + spec['missing'])
+    if 'ingreso' in label or bound >= 99999:
+        return 'float32'
+    if spec['missing']:
+        # The sentinel does not bound the real range (e.g. whoraT > 99), so leave headroom.
+        return _int_dtype(bound * 100)
+    if spec['max'] is not None:
+        return _int_dtype(bound)
+    return None
+
+
+@lru_cache(maxsize=None)
+def read_dtypes(path=DICTIONARY_PATH):
+    """Returns the `dtype=` mapping passed to `pd.read_csv` for every quarterly file."""
+    dtypes = {}
+    for var, spec in parse_dictionary(path).items():
+        dtype = column_dtype(spec)
+        if dtype is not None:
+            dtypes[var] = dtype
+    return dtypes
+
+
+def parse_dtypes(path=DICTIONARY_PATH):
+    """
+    The `dtype=` mapping actually passed to `pd.read_csv`: integer columns are parsed as Int64,
+    since a value outside a narrow dtype wraps around silently (500 read as Int8 is -12), and
+    fit_schema narrows them afterwards.
+    """
+    return {col: 'Int64' if dtype.startswith('Int') else dtype for col, dtype in read_dtypes(path).items()}
+
+
+def read_csv_kwargs(path=DICTIONARY_PATH):
+    """Keyword arguments shared by every ingestion path: explicit dtypes and blank cells as NaN."""
+    # The source marks empty answers with a single space; skipping initial spaces turns them into NaN.
+    return {'dtype': parse_dtypes(path), 'skipinitialspace': True}
+
+
+def fit_int(values, dtype):
+    """
+    Casts integral float or Int64 `values` to the nullable integer `dtype`, widened to the
+    smallest one that holds them when a value falls outside its range (e.g. an undeclared code).
+    """
+    present = values.dropna()
+    if len(present):
+        needed = _int_dtype(max(float(present.max()), -float(present.min()) - 1))
+        dtype = max(dtype, needed, key=lambda name: int(name[3:]))
+    return values.astype(dtype)
+
+
+def fit_schema(df, path=DICTIONARY_PATH):
+    """Narrows the integer columns read with parse_dtypes to their dictionary dtypes (widened if needed)."""
+    for col, dtype in read_dtypes(path).items():
+        if col in df.columns and dtype.startswith('Int'):
+            df[col] = fit_int(df[col], dtype)
+    return df
+
+
+def coerce_to_schema(df, path=DICTIONARY_PATH):
+    """Fallback for files that do not parse under the declared dtypes: coerces column by column."""
+    for col, dtype in read_dtypes(path).items():
+        if col not in df.columns:
+            continue
+        if dtype == 'str':
+            df[col] = df[col].astype('string').astype(object)
+            continue
+        values = pd.to_numeric(df[col], errors='coerce')
+        if dtype.startswith('Int'):
+            # Non-integers and values beyond Int64 become NA; the rest keep their value
+            values = values.where((values == values.round()) & (values.abs() < 2 ** 63))
+            df[col] = fit_int(values, dtype)
+        else:
+            df[col] = values.astype(dtype)
+    return df
+
+
+def recode_dtype(mapping):
+    """Categorical dtype whose categories are the labels of a recode map."""
+    return CategoricalDtype(categories=list(dict.fromkeys(mapping.values())))
+
+
+def recode(series, mapping):
+    """Maps integer codes to their labels, returning a compact Categorical column."""
+    return series.map(mapping).astype(recode_dtype(mapping))
+
+
+def fill_no_aplica(df, condition, columns):
+    """
+    Writes NO_APLICA into `columns` where `condition` holds.
+
+    Categorical columns gain a 'No Aplica' category; typed numeric columns are cast to object
+    first, since the label cannot live in a numeric dtype.
+    """
+    condition = condition.fillna(False) if condition.dtype != bool else condition
+    if not condition.any():
+        return df
+    for col in columns:
+        if col not in df.columns:
+            continue
+        if isinstance(df[col].dtype, CategoricalDtype):
+            if NO_APLICA not in df[col].cat.categories:
+                df[col] = df[col].cat.add_categories([NO_APLICA])
+        elif df[col].dtype != object:
+            df[col] = df[col].astype(object)
+        df.loc[condition, col] = NO_APLICA
+    return df
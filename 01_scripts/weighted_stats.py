@@ -0,0 +1,220 @@
+import numpy as np
+import pandas as pd
+
+# --- CONFIGURACIÓN ---
+# Peso por defecto: el factor de expansión dividido entre el número de trimestres unificados
+WEIGHT_COLUMN = 'factor_ajustado'
+# Por encima de este número de combinaciones posibles los grupos se compactan con np.unique en lugar de
+# contarse con un bincount de tamaño fijo
+MAX_DENSE_GROUPS = 1 << 20
+
+
+def weights_of(df, weight=WEIGHT_COLUMN):
+    """
+    Survey weights of `df` as a float64 array; missing, negative or non-numeric weights count as 0.
+    Falls back to a weight of 1 per row when `weight` is None or not a column of `df`.
+    """
+    if weight is None or weight not in df.columns:
+        return np.ones(len(df))
+    w = pd.to_numeric(df[weight], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    return np.where(np.isfinite(w) & (w > 0), w, 0.0)
+
+
+def _numeric(series):
+    return pd.to_numeric(series, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+
+def _factorize(series, dropna=True):
+    # Las categóricas ya traen sus códigos; el resto se factoriza ordenado
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, uniques = series.cat.codes.to_numpy(dtype=np.int64), pd.Index(series.cat.categories)
+    else:
+        codes, uniques = pd.factorize(series, sort=True)
+        codes, uniques = codes.astype(np.int64, copy=False), pd.Index(uniques)
+    if not dropna and (codes < 0).any():
+        # Los faltantes pasan a ser un nivel más, al final
+        codes = np.where(codes < 0, len(uniques), codes)
+        uniques = uniques.append(pd.Index([np.nan]))
+    return codes, uniques
+
+
+def group_codes(df, by, dropna=True):
+    """
+    Combines the `by` columns into one integer code per row (-1 where any of them is missing,
+    unless `dropna` is False, in which case missing values form a group of their own).
+
+    Returns (codes, n_groups, labels), where labels(ids) builds the group index for an array of
+    codes. Rows are not sorted or copied, so the codes feed np.bincount directly.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    codes = np.zeros(len(df), dtype=np.int64)
+    missing = np.zeros(len(df), dtype=bool)
+    levels = []
+    for col in by:
+        col_codes, uniques = _factorize(df[col], dropna)
+        missing |= col_codes < 0
+        codes = codes * max(len(uniques), 1) + col_codes
+        levels.append(uniques)
+    codes[missing] = -1
+    sizes = [max(len(level), 1) for level in levels]
+    n_groups = int(np.prod(sizes, dtype=np.float64))
+
+    def labels(ids):
+        if len(by) == 1:
+            return pd.Index(levels[0].take(ids), name=by[0])
+        positions = np.unravel_index(ids, sizes)
+        return pd.MultiIndex.from_arrays([level.take(pos) for level, pos in zip(levels, positions)], names=by)
+
+    return codes, n_groups, labels
+
+
+def _compact(codes, n_groups):
+    # Re-numera los grupos presentes 0..k-1 cuando el producto cartesiano de niveles es demasiado grande
+    valid = codes >= 0
+    if n_groups <= MAX_DENSE_GROUPS:
+        return codes, valid, n_groups, None
+    ids, inverse = np.unique(codes[valid], return_inverse=True)
+    compact = np.full(len(codes), -1, dtype=np.int64)
+    compact[valid] = inverse
+    return compact, valid, len(ids), ids
+
+
+def grouped_sums(df, by, values=(), weight=WEIGHT_COLUMN, dropna=True):
+    """
+    Single grouped pass over `df`: for each group of `by`, the number of rows ('n'), the weight
+    total ('peso') and, for each column in `values`, the weighted sum ('{col}_suma'), weighted sum
+    of squares ('{col}_suma2') and the weight of its non-missing rows ('{col}_peso').
+
+    Every statistic is one np.bincount over the group codes. Only groups with at least one row
+    are returned. With by=None the whole frame is one group; with dropna=False rows with missing
+    `by` values are kept in their own groups, as in DataFrame.groupby(dropna=False).
+    """
+    values = [values] if isinstance(values, str) else list(values)
+    w = weights_of(df, weight)
+    if by is None:
+        codes, n_groups, labels = np.zeros(len(df), dtype=np.int64), 1, (lambda ids: pd.RangeIndex(len(ids)))
+    else:
+        codes, n_groups, labels = group_codes(df, by, dropna)
+    codes, valid, n_groups, ids = _compact(codes, n_groups)
+    codes, w = codes[valid], w[valid]
+
+    sums = {'n': np.bincount(codes, minlength=n_groups), 'peso': np.bincount(codes, weights=w, minlength=n_groups)}
+    for col in values:
+        x = _numeric(df[col])[valid]
+        present = np.isfinite(x)
+        wx = np.where(present, w, 0.0)
+        x = np.where(present, x, 0.0)
+        sums[f'{col}_suma'] = np.bincount(codes, weights=wx * x, minlength=n_groups)
+        sums[f'{col}_suma2'] = np.bincount(codes, weights=wx * x * x, minlength=n_groups)
+        sums[f'{col}_peso'] = np.bincount(codes, weights=wx, minlength=n_groups)
+
+    observed = np.flatnonzero(sums['n'])
+    group_ids = observed if ids is None else ids[observed]
+    return pd.DataFrame({name: s[observed] for name, s in sums.items()}, index=labels(group_ids))
+
+
+def weighted_mean(df, value, weight=WEIGHT_COLUMN, by=None):
+    """Weighted mean of `value` (missing values ignored): a float, or a Series indexed by the `by` groups."""
+    sums = grouped_sums(df, by, [value], weight)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums[f'{value}_suma'] / sums[f'{value}_peso']
+    if by is None:
+        return float(means.iloc[0]) if len(means) else np.nan
+    return means.rename(value)
+
+
+def weighted_rate(df, flag, weight=WEIGHT_COLUMN, by=None):
+    """Weighted share (0-1) of rows where the 0/1 column `flag` is 1, overall or per `by` group."""
+    return weighted_mean(df, flag, weight, by)
+
+
+def weighted_counts(df, column, weight=WEIGHT_COLUMN, normalize=False):
+    """Weighted equivalent of Series.value_counts: estimated population per category, largest first."""
+    totals = grouped_sums(df, column, (), weight)['peso']
+    if normalize:
+        totals = totals / totals.sum() if totals.sum() else totals
+    return totals.sort_values(ascending=False, kind='stable').rename('proportion' if normalize else 'count')
+
+
+def weighted_crosstab(df, index, columns, weight=WEIGHT_COLUMN, normalize=False):
+    """
+    Weighted equivalent of pd.crosstab(df[index], df[columns], normalize=...), built from one
+    grouped pass. `normalize` may be False, 'index', 'columns' or 'all'.
+    """
+    table = grouped_sums(df, [index, columns], (), weight)['peso'].unstack(columns, fill_value=0.0)
+    return normalize_table(table, normalize)
+
+
+def normalize_table(table, normalize):
+    """Shares of a two-way table of totals: per row ('index'), per column ('columns') or of the grand total ('all')."""
+    if normalize == 'index':
+        return table.div(table.sum(axis=1), axis=0)
+    if normalize == 'columns':
+        return table.div(table.sum(axis=0), axis=1)
+    if normalize == 'all':
+        return table / table.to_numpy().sum()
+    if normalize:
+        raise ValueError(f"normalize must be False, 'index', 'columns' or 'all', not {normalize!r}")
+    return table
+
+
+def weighted_quantile(values, weights, q):
+    """
+    Weighted quantiles of `values` (inverse of the weighted empirical CDF, without interpolation):
+    for each q, the smallest value whose cumulative weight reaches q times the total weight.
+    Missing values and non-positive weights are ignored. Returns a float for a scalar q.
+    """
+    x = np.asarray(values, dtype='float64')
+    w = np.asarray(weights, dtype='float64')
+    keep = np.isfinite(x) & np.isfinite(w) & (w > 0)
+    x, w = x[keep], w[keep]
+    qs = np.atleast_1d(np.asarray(q, dtype='float64'))
+    if len(x) == 0:
+        result = np.full(len(qs), np.nan)
+    else:
+        order = np.argsort(x, kind='stable')
+        x, cum = x[order], np.cumsum(w[order])
+        positions = np.searchsorted(cum, qs * cum[-1], side='left')
+        result = x[np.minimum(positions, len(x) - 1)]
+    return float(result[0]) if np.ndim(q) == 0 else result
+
+
+def weighted_quantiles(df, value, q, weight=WEIGHT_COLUMN, by=None):
+    """
+    Weighted quantiles of `value` per `by` group in one sort: rows are ordered by (group, value)
+    and each group's targets are searched in the shared cumulative weight. Returns a DataFrame
+    with one column per q (a Series for by=None).
+    """
+    qs = np.atleast_1d(np.asarray(q, dtype='float64'))
+    x = _numeric(df[value])
+    w = weights_of(df, weight)
+    if by is None:
+        return pd.Series(weighted_quantile(x, w, qs), index=qs, name=value)
+    codes, n_groups, labels = group_codes(df, by)
+    ids, result = coded_quantiles(codes, x, w, qs)
+    if len(ids) == 0:
+        return pd.DataFrame(columns=qs)
+    return pd.DataFrame(result, index=labels(ids), columns=qs)
+
+
+def coded_quantiles(codes, x, w, qs):
+    """
+    Weighted quantiles `qs` of `x` for every group code (rows with code -1, missing values or
+    non-positive weights are ignored), from one sort of (code, value). Returns the group codes
+    present, ascending, and a (groups x quantiles) array.
+    """
+    qs = np.atleast_1d(np.asarray(qs, dtype='float64'))
+    keep = (codes >= 0) & np.isfinite(x) & (w > 0)
+    codes, x, w = codes[keep], x[keep], w[keep]
+    if len(codes) == 0:
+        return codes, np.empty((0, len(qs)))
+    order = np.lexsort((x, codes))
+    codes, x, cum = codes[order], x[order], np.cumsum(w[order])
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], len(codes)]
+    before = np.where(starts > 0, cum[starts - 1], 0.0)
+    totals = cum[ends - 1] - before
+    targets = before[:, None] + qs[None, :] * totals[:, None]
+    positions = np.searchsorted(cum, targets, side='left')
+    positions = np.clip(positions, starts[:, None], (ends - 1)[:, None])
+    return codes[starts], x[positions]
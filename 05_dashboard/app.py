@@ -1,14 +1,33 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import pickle
 import numpy as np
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '01_scripts'))
+from periods import load_partition_index
+from weighted_stats import WEIGHT_COLUMN
+from bitmap_index import build_bitmap_index, select_mask
+from olap_cube import build_cube, cube_matches, cube_mean, load_cube, rollup
+from selection_cache import SelectionCache
+from linear_scorer import compile_scorer, load_scoring_artifact, score_frame, score_record
 
 # --- Path setup ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_PATH = os.path.join(BASE_DIR, "data", "processed_data.csv")
-MODEL_PATH = os.path.join(BASE_DIR, "informality_model.pickle")
+MODEL_PATH = os.path.join(BASE_DIR, "informality_model.json")
+
+# --- Filters ---
+# Sidebar multi-selects (column -> label). Each one gets a bitmap index; a new filter only needs its
+# column here and in olap_cube.CUBE_DIMENSIONS.
+FILTER_COLUMNS = {
+    'periodo': "Seleccione Periodo(s):",
+    'Sexo': "Seleccione Sexo:",
+    'Nivel Educativo': "Seleccione Nivel Educativo:",
+}
+# Memory budget of the per-selection results cache shared by all sessions
+SELECTION_CACHE_MB = 64
 
 
 # --- Page Configuration ---
@@ -33,24 +52,65 @@ def load_data():
     try:
         df = pd.read_csv(DATA_PATH)
         df['periodo'] = pd.Categorical(df['periodo'], categories=sorted(df['periodo'].unique()), ordered=True)
+        # Categorical filter columns give the weighted aggregations their group codes for free
+        for col in [c for c in FILTER_COLUMNS if c != 'periodo'] + ['Tipo de Ocupación']:
+            df[col] = df[col].astype('category')
+        if WEIGHT_COLUMN not in df.columns:
+            st.warning(f"`{DATA_PATH}` no incluye `{WEIGHT_COLUMN}`; los indicadores se muestran sin ponderar. Vuelva a ejecutar `data_prep.py`.")
         return df
     except FileNotFoundError:
         st.error(f"El archivo `{DATA_PATH}` no fue encontrado. Por favor, ejecute `data_prep.py` primero.")
         return pd.DataFrame()
 
+@st.cache_data
+def load_period_index():
+    """Loads the period -> row range index written by data_prep.py, if present."""
+    return load_partition_index(DATA_PATH)
+
+@st.cache_data
+def load_aggregate_cube(_df):
+    """Loads the cube written by data_prep.py, or builds it once from the microdata if it is missing or stale."""
+    cube = load_cube(DATA_PATH)
+    return cube if cube_matches(cube, DATA_PATH) else build_cube(_df)
+
+@st.cache_resource
+def load_bitmap_index(kind, _df, _period_index=None):
+    """
+    Bitmaps of every FILTER_COLUMNS value, built once; filters then combine them with bitwise AND/OR.
+
+    `kind` ('rows' or 'cube') is the cache key: the frames themselves are not hashed, so without it
+    the cube would get the bitmaps cached for the microdata rows.
+    """
+    return build_bitmap_index(_df, FILTER_COLUMNS, _period_index)
+
+@st.cache_resource
+def load_selection_cache():
+    """LRU cache of tab results per filter selection, shared across sessions and reruns."""
+    return SelectionCache(max_bytes=SELECTION_CACHE_MB * 1024 * 1024)
+
 df = load_data()
+period_index = load_period_index()
+cube = load_aggregate_cube(df) if not df.empty else None
+# Separate bitmaps for the microdata rows (tab 3) and for the cube cells (tabs 1 and 2); period bitmaps of
+# the microdata come from the row ranges of the partition index
+row_bitmaps = load_bitmap_index('rows', df, period_index) if not df.empty else None
+cube_bitmaps = load_bitmap_index('cube', cube) if cube is not None else None
 
 # --- Model Loading ---
 @st.cache_resource
 def load_model():
-    """Loads the trained model from the pickle file."""
+    """
+    Loads the informality model from its versioned JSON artifact as a compiled NumPy scorer
+    (no sklearn import, no unpickling).
+    """
     try:
-        with open(MODEL_PATH, "rb") as f:
-            model = pickle.load(f)
-        return model
+        return compile_scorer(load_scoring_artifact(MODEL_PATH))
     except FileNotFoundError:
         st.error(f"El archivo del modelo `{MODEL_PATH}` no fue encontrado.")
         return None
+    except (KeyError, ValueError) as e:
+        st.error(f"El archivo del modelo `{MODEL_PATH}` no es válido: {e}")
+        return None
 
 model = load_model()
 
@@ -58,35 +118,69 @@ model = load_model()
 st.sidebar.header("Filtros Interactivos")
 
 if not df.empty:
-    periodos_disponibles = sorted(df['periodo'].unique())
-    periodo_seleccionado = st.sidebar.multiselect(
-        "Seleccione Periodo(s):",
-        options=periodos_disponibles,
-        default=periodos_disponibles
-    )
+    filtros = {}
+    for col, label in FILTER_COLUMNS.items():
+        disponibles = sorted(df[col].dropna().unique())
+        filtros[col] = st.sidebar.multiselect(label, options=disponibles, default=disponibles)
+    # Cached results are tied to the data file they were computed from
+    data_version = (len(df), os.stat(DATA_PATH).st_mtime_ns)
+else:
+    st.warning("No hay datos para mostrar. Verifique la carga de datos.")
+    filtros, data_version = {}, None
 
-    sexo_disponible = sorted(df['Sexo'].unique())
-    sexo_seleccionado = st.sidebar.multiselect(
-        "Seleccione Sexo:",
-        options=sexo_disponible,
-        default=sexo_disponible
-    )
 
-    nivel_educativo_disponible = sorted(df['Nivel Educativo'].dropna().unique())
-    nivel_educativo_seleccionado = st.sidebar.multiselect(
-        "Seleccione Nivel Educativo:",
-        options=nivel_educativo_disponible,
-        default=nivel_educativo_disponible
-    )
+def filter_microdata():
+    """Rows of the current selection, for the views that need individual respondents (tab 3)."""
+    if df.empty:
+        return df
+    return df[select_mask(row_bitmaps, filtros, df)]
 
-    df_filtrado = df[
-        df['periodo'].isin(periodo_seleccionado) &
-        df['Sexo'].isin(sexo_seleccionado) &
-        df['Nivel Educativo'].isin(nivel_educativo_seleccionado)
-    ]
-else:
-    st.warning("No hay datos para mostrar. Verifique la carga de datos.")
-    df_filtrado = pd.DataFrame()
+
+def filter_cube():
+    """Cube cells of the current selection; tabs 1 and 2 are answered from them, not from respondents."""
+    if cube is None:
+        return pd.DataFrame(columns=['n'])
+    return cube[select_mask(cube_bitmaps, filtros, cube)]
+
+
+def resumen_general():
+    """KPIs and figures of tab 1 for the current selection, or None if it is empty."""
+    celdas = filter_cube()
+    if celdas['n'].sum() == 0:
+        return None
+    totales = rollup(celdas)
+
+    educacion_counts = rollup(celdas, 'Nivel Educativo')['peso'].sort_values(ascending=False).rename('count').reset_index()
+    fig_donut = px.pie(educacion_counts, names='Nivel Educativo', values='count', hole=0.4, title="Proporción por Nivel Educativo")
+    fig_donut.update_traces(textposition='inside', textinfo='percent+label')
+
+    ocupacion_counts = rollup(celdas, 'Tipo de Ocupación')['peso'].sort_values(ascending=False).rename('count').reset_index()
+    fig_bar = px.bar(ocupacion_counts, x='Tipo de Ocupación', y='count', title="Población Estimada por Tipo de Ocupación", color='Tipo de Ocupación')
+
+    return {
+        'ingreso_promedio': cube_mean(totales, 'Ingreso_Mensual'),
+        'tasa_informalidad': cube_mean(totales, 'es_informal') * 100,
+        'total_encuestados': int(totales['n']),
+        'fig_donut': fig_donut,
+        'fig_bar': fig_bar,
+    }
+
+
+def resumen_temporal():
+    """Figures of tab 2 for the current selection, or None if it is empty."""
+    celdas = filter_cube()
+    if celdas['n'].sum() == 0:
+        return None
+    ingreso_temporal = cube_mean(rollup(celdas, 'periodo'), 'Ingreso_Mensual').rename('Ingreso_Mensual').reset_index()
+    fig_line_ingreso = px.line(ingreso_temporal, x='periodo', y='Ingreso_Mensual', title="Ingreso Promedio Mensual por Trimestre", markers=True)
+
+    informalidad_temporal = cube_mean(rollup(celdas, ['periodo', 'Sexo']), 'es_informal').rename('es_informal').reset_index()
+    informalidad_temporal['Tasa_Informalidad'] = informalidad_temporal['es_informal'] * 100
+    fig_bar_informalidad = px.bar(informalidad_temporal, x='periodo', y='Tasa_Informalidad', color='Sexo', barmode='group', title="Tasa de Informalidad por Sexo y Trimestre")
+    return {'fig_line_ingreso': fig_line_ingreso, 'fig_bar_informalidad': fig_bar_informalidad}
+
+
+selection_cache = load_selection_cache()
 
 
 # --- Main Content Tabs ---
@@ -95,33 +189,25 @@ tab1, tab2, tab3 = st.tabs(["Análisis General y KPIs", "Análisis Temporal", "M
 # --- Tab 1: General Analysis & KPIs ---
 with tab1:
     st.header("Análisis General para la Selección Actual")
+    st.caption("Promedios, tasas y distribuciones ponderados por el factor de expansión de la encuesta.")
 
-    if not df_filtrado.empty:
+    general = selection_cache.get_or_compute('general', filtros, resumen_general, data_version)
+    if general is not None:
         col1, col2, col3 = st.columns(3)
-        ingreso_promedio = df_filtrado['Ingreso_Mensual'].mean()
-        col1.metric(label="Ingreso Promedio Mensual (S/.)", value=f"{ingreso_promedio:,.2f}")
-
-        tasa_informalidad = (df_filtrado['es_informal'].mean()) * 100
-        col2.metric(label="Tasa de Informalidad (%)", value=f"{tasa_informalidad:.2f}%")
-
-        total_encuestados = len(df_filtrado)
-        col3.metric(label="Total de Encuestados", value=f"{total_encuestados:,}")
+        col1.metric(label="Ingreso Promedio Mensual (S/.)", value=f"{general['ingreso_promedio']:,.2f}")
+        col2.metric(label="Tasa de Informalidad (%)", value=f"{general['tasa_informalidad']:.2f}%")
+        col3.metric(label="Total de Encuestados", value=f"{general['total_encuestados']:,}")
 
         st.markdown("---")
         col_chart1, col_chart2 = st.columns(2)
 
         with col_chart1:
             st.subheader("Distribución por Nivel Educativo")
-            educacion_counts = df_filtrado['Nivel Educativo'].value_counts().reset_index()
-            fig_donut = px.pie(educacion_counts, names='Nivel Educativo', values='count', hole=0.4, title="Proporción por Nivel Educativo")
-            fig_donut.update_traces(textposition='inside', textinfo='percent+label')
-            st.plotly_chart(fig_donut, use_container_width=True)
+            st.plotly_chart(general['fig_donut'], use_container_width=True)
 
         with col_chart2:
             st.subheader("Distribución por Tipo de Ocupación")
-            ocupacion_counts = df_filtrado['Tipo de Ocupación'].value_counts().reset_index()
-            fig_bar = px.bar(ocupacion_counts, x='Tipo de Ocupación', y='count', title="Encuestados por Tipo de Ocupación", color='Tipo de Ocupación')
-            st.plotly_chart(fig_bar, use_container_width=True)
+            st.plotly_chart(general['fig_bar'], use_container_width=True)
     else:
         st.warning("No hay datos disponibles para la selección actual.")
 
@@ -129,17 +215,13 @@ with tab1:
 with tab2:
     st.header("Evolución de Indicadores Clave a lo Largo del Tiempo")
 
-    if not df_filtrado.empty:
+    temporal = selection_cache.get_or_compute('temporal', filtros, resumen_temporal, data_version)
+    if temporal is not None:
         st.subheader("Evolución del Ingreso Promedio Mensual (S/.)")
-        ingreso_temporal = df_filtrado.groupby('periodo')['Ingreso_Mensual'].mean().reset_index()
-        fig_line_ingreso = px.line(ingreso_temporal, x='periodo', y='Ingreso_Mensual', title="Ingreso Promedio Mensual por Trimestre", markers=True)
-        st.plotly_chart(fig_line_ingreso, use_container_width=True)
+        st.plotly_chart(temporal['fig_line_ingreso'], use_container_width=True)
 
         st.subheader("Evolución de la Tasa de Informalidad (%) por Sexo")
-        informalidad_temporal = df_filtrado.groupby(['periodo', 'Sexo'])['es_informal'].mean().reset_index()
-        informalidad_temporal['Tasa_Informalidad'] = informalidad_temporal['es_informal'] * 100
-        fig_bar_informalidad = px.bar(informalidad_temporal, x='periodo', y='Tasa_Informalidad', color='Sexo', barmode='group', title="Tasa de Informalidad por Sexo y Trimestre")
-        st.plotly_chart(fig_bar_informalidad, use_container_width=True)
+        st.plotly_chart(temporal['fig_bar_informalidad'], use_container_width=True)
     else:
         st.warning("No hay datos disponibles para la selección actual.")
 
@@ -148,24 +230,19 @@ with tab3:
     st.header("Modelo Predictivo de Informalidad Laboral")
 
     if model and not df.empty:
-        # Define the full list of features the model expects
-        model_features = ['grupo_edad', 'Sexo', 'Nivel Educativo', 'Tipo de Ocupación', 'whoraT']
+        df_filtrado = filter_microdata()
+
+        # The features the model expects, in training order, come from the artifact
+        model_features = model['features']
 
         st.subheader("Predicción en Lote (Ejemplo)")
         st.write("A continuación se muestra una muestra de los datos con la probabilidad de informalidad predicha por el modelo.")
 
         if not df_filtrado.empty:
             sample_df = df_filtrado.sample(min(50, len(df_filtrado))).copy()
-            X_predict = sample_df[model_features].copy()
-
-            # Handle potential NaNs from sampling or filtering
-            for col in X_predict.columns:
-                if X_predict[col].dtype == 'object' or pd.api.types.is_categorical_dtype(X_predict[col]):
-                    X_predict[col] = X_predict[col].astype(str).replace('nan', 'Desconocido')
-                elif pd.api.types.is_numeric_dtype(X_predict[col]):
-                    X_predict[col].fillna(X_predict[col].median(), inplace=True)
-
-            pred_probs = model.predict_proba(X_predict)[:, 1]
+            # The scorer imputes missing hours with the training median and scores missing or unknown
+            # categories as the encoder's all-zero column, so no per-sample preprocessing is needed
+            pred_probs = score_frame(model, sample_df[model_features])
             sample_df['Probabilidad_Informalidad'] = np.round(pred_probs * 100, 2)
             st.dataframe(sample_df[['Sexo', 'Edad', 'Nivel Educativo', 'Tipo de Ocupación', 'whoraT', 'Probabilidad_Informalidad']].style.format({'Probabilidad_Informalidad': '{:.2f}%', 'whoraT': '{:.0f}'}))
         else:
@@ -186,15 +263,15 @@ with tab3:
             submit_button = st.form_submit_button("Clasificar")
 
             if submit_button:
-                input_data = pd.DataFrame({
-                    'grupo_edad': [grupo_edad_input],
-                    'Sexo': [sexo_input],
-                    'Nivel Educativo': [nivel_educativo_input],
-                    'Tipo de Ocupación': [tipo_ocupacion_input],
-                    'whoraT': [whoraT_input]
-                })
-
-                prediction = model.predict_proba(input_data)[0, 1]
+                input_data = {
+                    'grupo_edad': grupo_edad_input,
+                    'Sexo': sexo_input,
+                    'Nivel Educativo': nivel_educativo_input,
+                    'Tipo de Ocupación': tipo_ocupacion_input,
+                    'whoraT': whoraT_input
+                }
+
+                prediction = score_record(model, input_data)
                 prob_percent = prediction * 100
 
                 if prob_percent >= 50:
@@ -203,3 +280,17 @@ with tab3:
                     st.success(f"Este perfil tiene una {prob_percent:.2f}% de probabilidad de ser informal.")
     else:
         st.error("No se pudo cargar el modelo o los datos, la funcionalidad de predicción está deshabilitada.")
+
+# --- Debug Panel ---
+with st.sidebar.expander("Depuración: caché de selecciones"):
+    cache_stats = selection_cache.stats()
+    st.write(
+        f"Aciertos: {cache_stats['aciertos']:,} · Fallos: {cache_stats['fallos']:,} "
+        f"({cache_stats['tasa_aciertos']:.0%} de aciertos)"
+    )
+    st.write(
+        f"Entradas: {cache_stats['entradas']:,} · Desalojos: {cache_stats['desalojos']:,} · "
+        f"Memoria: {cache_stats['memoria_mb']:.1f} / {cache_stats['presupuesto_mb']:.0f} MB"
+    )
+    if st.button("Vaciar caché"):
+        selection_cache.clear()
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+
+def _packed(mask):
+    return np.packbits(mask)
+
+
+def bitmap_from_ranges(n_rows, ranges):
+    """Packed bitmap of `n_rows` rows with the [start, stop) `ranges` set, built without scanning any column."""
+    mask = np.zeros(n_rows, dtype=bool)
+    for start, stop in ranges:
+        mask[start:stop] = True
+    return _packed(mask)
+
+
+def column_bitmaps(series):
+    """{value: packed bitmap of the rows holding it} for one column; missing values get no bitmap."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, values = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, values = pd.factorize(series, sort=True)
+    bitmaps = {}
+    for k, value in enumerate(values):
+        mask = codes == k
+        if mask.any():
+            bitmaps[value] = _packed(mask)
+    return bitmaps
+
+
+def build_bitmap_index(df, columns, period_index=None, period_column='periodo'):
+    """
+    Builds one packed bitmap (1 bit per row) per value of each filter column in `columns`.
+
+    With a matching partition index (see periods.write_partition_index), the bitmaps of
+    `period_column` are built from its contiguous row ranges instead of comparing labels.
+    """
+    bitmaps = {}
+    for col in columns:
+        if col == period_column and period_index is not None and period_index.get('rows') == len(df):
+            bitmaps[col] = {p: bitmap_from_ranges(len(df), [(r['start'], r['stop'])]) for p, r in period_index['partitions'].items()}
+        else:
+            bitmaps[col] = column_bitmaps(df[col])
+    return {'rows': len(df), 'bitmaps': bitmaps}
+
+
+def select_mask(index, filters, frame=None):
+    """
+    Boolean row mask for `filters` ({column: selected values}): the bitmaps of the selected values
+    are OR-ed within each column and the columns are AND-ed together, eight rows per byte.
+    As with Series.isin, rows where a filtered column is missing never match.
+
+    With `frame`, the index must have been built for it (same number of rows).
+    """
+    n_rows = index['rows']
+    if frame is not None and n_rows != len(frame):
+        raise ValueError(f"Bitmap index built for {n_rows} rows used on a frame of {len(frame)} rows.")
+    selected = np.full((n_rows + 7) // 8, 0xFF, dtype=np.uint8)
+    for col, values in filters.items():
+        column = index['bitmaps'][col]
+        chosen = [column[value] for value in values if value in column]
+        if not chosen:
+            return np.zeros(n_rows, dtype=bool)
+        selected &= np.bitwise_or.reduce(chosen) if len(chosen) > 1 else chosen[0]
+    return np.unpackbits(selected, count=n_rows).view(bool)
@@ -1,9 +1,18 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '01_scripts'))
+from cleaning_rules import DASHBOARD_RULES, apply_rules
+from periods import discover_quarter_files, write_partition_index
+from quarter_cache import read_quarter_csv
+from survey_schema import recode
+from olap_cube import cube_path, write_cube
 
 # --- Configuration ---
 DATA_SOURCE_DIR = '../00_data_source/'
+CACHE_DIR = '../02_data_processed/cache/'
 OUTPUT_DIR = 'data/'
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, 'processed_data.csv')
 
@@ -20,55 +29,39 @@ def get_recode_maps():
 
 # --- ETL Pipeline Functions ---
 
-def load_and_unify_data(source_dir):
-    """Loads, labels, and unifies all CSVs from the source directory."""
-    files = [f for f in os.listdir(source_dir) if f.endswith('.csv')]
+def load_and_unify_data(source_dir, cache_dir=CACHE_DIR):
+    """Loads, labels, and unifies all quarterly CSVs under the source directory, ordered by period."""
+    files = discover_quarter_files(source_dir)
     if not files:
         raise FileNotFoundError(f"No CSV files found in {source_dir}")
 
-    quarters = {
-        'Trim Ene-Feb-Mar24.csv': '2024-Q1', 'Trim Abr-May-Jun24.csv': '2024-Q2',
-        'Trim Jul-Ago-Set24.csv': '2024-Q3', 'Trim Set-Oct-Nov24.csv': '2024-Q4',
-        'Trim Ene-Feb-Mar25.csv': '2025-Q1', 'Trim Mar-Abr-May25.csv': '2025-Q2'
-    }
-
     df_list = []
-    for file in files:
-        df = pd.read_csv(os.path.join(source_dir, file), low_memory=False)
-        if file in quarters:
-            df['periodo'] = quarters[file]
+    for path, periodo in files:
+        df = read_quarter_csv(path, cache_dir)
+        df['periodo'] = periodo
+        # Each quarter carries its expansion factor in one fa_* column; unify it as the survey weight
+        fa_cols = [col for col in df.columns if col.startswith('fa_')]
+        df['factor_expansion'] = df[fa_cols].apply(pd.to_numeric, errors='coerce').sum(axis=1) if fa_cols else np.nan
+        df['factor_ajustado'] = df['factor_expansion'] / len(files)
+        df.drop(columns=fa_cols, inplace=True)
         df_list.append(df)
 
     master_df = pd.concat(df_list, ignore_index=True)
-    master_df.replace(r'^\s*$', np.nan, regex=True, inplace=True)
     return master_df
 
 def clean_special_codes(df):
-    """Replaces special codes (e.g., 99, 999999) with NaN."""
-    codes_to_nan = {
-        'C208': [99], 'INGTOT': [999999], 'whoraT': [99], 'I339_1': [999999],
-        'C312': [4] # "NO SABE" for C312 is treated as missing
-    }
-
-    for column, codes in codes_to_nan.items():
-        if column in df.columns:
-            df[column] = df[column].replace(codes, np.nan)
-
-    numeric_cols = ['C208', 'INGTOT', 'whoraT', 'I339_1']
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-
+    """Replaces special codes (e.g., 99, 999999, and "NO SABE" for C312) with NaN."""
+    apply_rules(df, DASHBOARD_RULES)
     return df
 
 def process_working_population(df):
     """Filters for the working population, recodes variables, and engineers features."""
-    df_trabajo = df[df['C208'] >= 14].copy()
+    df_trabajo = df[(df['C208'] >= 14).fillna(False)].copy()
 
     maps = get_recode_maps()
     for var, mapping in maps.items():
         if var in df_trabajo.columns:
-            df_trabajo[var] = df_trabajo[var].map(mapping).astype('category')
+            df_trabajo[var] = recode(df_trabajo[var], mapping)
 
     df_trabajo.rename(columns={
         'C207': 'Sexo',
@@ -82,7 +75,7 @@ def process_working_population(df):
     labels = ['14-17', '18-24', '25-34', '35-44', '45-54', '55-64', '65+']
     df_trabajo['grupo_edad'] = pd.cut(df_trabajo['Edad'], bins=bins, labels=labels, right=False)
 
-    df_trabajo['es_informal'] = ((df_trabajo['OCUP300'] == 'Ocupado') & (df_trabajo['C361_1'] == 2)).astype(int)
+    df_trabajo['es_informal'] = ((df_trabajo['OCUP300'] == 'Ocupado') & (df_trabajo['C361_1'] == 2).fillna(False)).astype('int8')
 
     df_trabajo = df_trabajo[df_trabajo['OCUP300'] == 'Ocupado'].copy()
 
@@ -102,7 +95,7 @@ def main():
 
     final_columns = [
         'periodo', 'Sexo', 'Edad', 'grupo_edad', 'Nivel Educativo',
-        'Tipo de Ocupación', 'Ingreso_Mensual', 'whoraT', 'es_informal'
+        'Tipo de Ocupación', 'Ingreso_Mensual', 'whoraT', 'es_informal', 'factor_ajustado'
     ]
 
     for col in final_columns:
@@ -112,6 +105,9 @@ def main():
     df_final = df_final[final_columns]
 
     df_final.to_csv(OUTPUT_FILE, index=False)
+    write_partition_index(OUTPUT_FILE)
+    cube = write_cube(df_final, OUTPUT_FILE)
+    print(f"Aggregated cube with {len(cube):,} cells saved to {cube_path(OUTPUT_FILE)}")
     print(f"--- Data preparation complete. Output saved to {OUTPUT_FILE} ---")
 
 
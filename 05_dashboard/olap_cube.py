@@ -0,0 +1,99 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '01_scripts'))
+from quarter_cache import content_hash
+from weighted_stats import WEIGHT_COLUMN, grouped_sums
+
+# --- Configuration ---
+# Cube dimensions: every filter and chart axis of tabs 1 and 2
+CUBE_DIMENSIONS = ['periodo', 'Sexo', 'Nivel Educativo', 'Tipo de Ocupación', 'grupo_edad']
+# Additive measures kept per cell (weighted sum, sum of squares and weight of non-missing rows)
+CUBE_MEASURES = ['Ingreso_Mensual', 'es_informal']
+CUBE_SUFFIX = '.cube.csv'
+# Manifest next to the cube with the content hash of the microdata it was built from
+CUBE_MANIFEST_SUFFIX = '.cube.json'
+
+
+def cube_path(data_path):
+    """Path of the cube persisted next to the processed microdata."""
+    return os.path.splitext(data_path)[0] + CUBE_SUFFIX
+
+
+def cube_manifest_path(data_path):
+    """Path of the manifest recording which microdata the cube was built from."""
+    return os.path.splitext(data_path)[0] + CUBE_MANIFEST_SUFFIX
+
+
+def build_cube(df, weight=WEIGHT_COLUMN):
+    """
+    Aggregates the microdata into one row per observed combination of CUBE_DIMENSIONS.
+
+    Each cell holds the number of respondents ('n'), the estimated population ('peso') and, per
+    measure, its weighted sum, weighted sum of squares and non-missing weight. All of them are
+    additive, so any filter + group-by over the dimensions is answered by summing cells. Missing
+    dimension values keep their own cells, so totals match the microdata.
+    """
+    return grouped_sums(df, CUBE_DIMENSIONS, CUBE_MEASURES, weight, dropna=False).reset_index()
+
+
+def write_cube(df, data_path, weight=WEIGHT_COLUMN):
+    """
+    Builds the cube of `df` and saves it next to `data_path`; returns it.
+
+    `df` must be the frame just written to `data_path`: the manifest records the content hash of
+    that file, which is what cube_matches checks.
+    """
+    cube = build_cube(df, weight)
+    path = cube_path(data_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    cube.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    manifest_path = cube_manifest_path(data_path)
+    with open(f"{manifest_path}.{os.getpid()}.tmp", 'w', encoding='utf-8') as f:
+        json.dump({'source_hash': content_hash(data_path), 'weight': weight}, f, indent=2)
+    os.replace(f"{manifest_path}.{os.getpid()}.tmp", manifest_path)
+    return cube
+
+
+def load_cube(data_path):
+    """Returns the saved cube of `data_path`, or None if it has not been built."""
+    try:
+        return pd.read_csv(cube_path(data_path))
+    except (OSError, ValueError):
+        return None
+
+
+def cube_matches(cube, data_path, weight=WEIGHT_COLUMN):
+    """
+    True if `cube` was built from the current contents of `data_path`.
+
+    Compares the content hash recorded by write_cube with the file on disk, so a rebuilt CSV with
+    the same number of rows but different values is detected as stale.
+    """
+    if cube is None:
+        return False
+    try:
+        with open(cube_manifest_path(data_path), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        return manifest.get('weight') == weight and manifest.get('source_hash') == content_hash(data_path)
+    except (OSError, ValueError):
+        return False
+
+
+def rollup(cells, by=None):
+    """Sums cube cells over every dimension not in `by` (all of them when by=None)."""
+    measures = [col for col in cells.columns if col not in CUBE_DIMENSIONS]
+    if by is None:
+        return cells[measures].sum()
+    return cells.groupby(by, observed=True, sort=True)[measures].sum()
+
+
+def cube_mean(totals, measure):
+    """Weighted mean of `measure` from rolled-up cells: a float for a total, a Series for a group-by."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return totals[f'{measure}_suma'] / totals[f'{measure}_peso']
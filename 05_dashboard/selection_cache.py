@@ -0,0 +1,96 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# --- Configuration ---
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def normalize_selection(filters):
+    """Order-independent key for a filter selection ({column: selected values})."""
+    return tuple(sorted((col, tuple(sorted(str(v) for v in values))) for col, values in filters.items()))
+
+
+def estimate_size(value):
+    """Approximate memory footprint in bytes of a cached result (frames, arrays, figures and containers)."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    if hasattr(value, 'to_json'):
+        # Figuras de Plotly: su especificación serializada es una buena aproximación de su tamaño
+        return len(value.to_json())
+    return sys.getsizeof(value)
+
+
+class SelectionCache:
+    """
+    LRU cache of dashboard results keyed by (view, data version, normalized filter selection),
+    bounded by an approximate memory budget.
+
+    One instance is shared by every session (see st.cache_resource), so a selection computed
+    once is served to everyone until it is evicted. Safe to use from Streamlit's script threads.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, view, filters, compute, version=None):
+        """Returns the cached result of `view` for `filters`, calling `compute()` on a miss."""
+        key = (view, version, normalize_selection(filters))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+        # Se calcula fuera del lock: dos sesiones con la misma selección pueden calcularla a la vez,
+        # pero ninguna bloquea a las demás
+        value = compute()
+        size = estimate_size(value)
+        with self._lock:
+            if size > self.max_bytes:
+                return value
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        """Drops every entry and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Hit/miss counters and memory use, for the debug panel."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entradas': len(self._entries),
+                'aciertos': self.hits,
+                'fallos': self.misses,
+                'tasa_aciertos': self.hits / lookups if lookups else 0.0,
+                'desalojos': self.evictions,
+                'memoria_mb': self.bytes / 2**20,
+                'presupuesto_mb': self.max_bytes / 2**20,
+            }
@@ -1,29 +1,203 @@
+import argparse
 import csv
+import gzip
 import json
+import os
+import shutil
+import tempfile
 
-csv_file = 'data.csv'
-json_file = 'data.json'
-
-data = []
-with open(csv_file, 'r') as f:
-    csv_reader = csv.DictReader(f)
-    for row in csv_reader:
-        # Only select a few columns to keep the file size small
-        # and filter out rows with "No Aplica"
-        if row['periodo'] != 'No Aplica' and row['INGTOT'] != 'No Aplica':
-            selected_row = {
-                'periodo': row['periodo'],
-                'sexo': row['C207'],
-                'nivel_educativo': row['C366'],
-                'ingreso': float(row['INGTOT']) if row['INGTOT'] else 0,
-                'informal': int(row['es_informal']),
-                'ocupacion': row['OCUP300'],
-                'grupo_edad': row['grupo_edad'],
-                'horas_trabajadas': int(float(row['whoraT'])) if row['whoraT'] else 0,
-            }
-            data.append(selected_row)
-
-with open(json_file, 'w') as f:
-    json.dump(data, f, indent=4)
-
-print(f'Successfully converted {csv_file} to {json_file}')
+# --- Configuration ---
+CSV_FILE = 'data.csv'
+JSON_FILE = 'data.json'
+TILES_DIR = 'tiles'
+FORMAT = 'columnar-v1'
+TILES_FORMAT = 'tiles-v1'
+TILES_INDEX = 'index.json'
+
+# Output columns: name -> (source column, type). 'category' columns are dictionary-encoded
+# (string table + code array); 'float' and 'int' columns become plain numeric arrays.
+COLUMNS = {
+    'periodo': ('periodo', 'category'),
+    'sexo': ('C207', 'category'),
+    'nivel_educativo': ('C366', 'category'),
+    'ingreso': ('INGTOT', 'float'),
+    'informal': ('es_informal', 'int'),
+    'ocupacion': ('OCUP300', 'category'),
+    'grupo_edad': ('grupo_edad', 'category'),
+    'horas_trabajadas': ('whoraT', 'int'),
+}
+COLUMN_TYPES = {name: kind for name, (_, kind) in COLUMNS.items()}
+
+# Pre-aggregated tiles: one cell per combination of these dimensions (within each period shard)
+# with additive measures, so any filter over the dimensions is answered by summing cells.
+TILE_DIMENSIONS = ['periodo', 'sexo', 'nivel_educativo', 'grupo_edad', 'ocupacion']
+TILE_MEASURES = {'n': 'int', 'ingreso_suma': 'float', 'informales': 'int', 'horas_suma': 'float'}
+
+
+def keep_row(row):
+    """Only rows with a period and an income ('No Aplica' marks them as missing)."""
+    return row['periodo'] != 'No Aplica' and row['INGTOT'] != 'No Aplica'
+
+
+def read_rows(csv_file=CSV_FILE):
+    """Streams the selected rows of `csv_file` as {output column: value} dicts (empty numbers as 0)."""
+    with open(csv_file, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if not keep_row(row):
+                continue
+            out = {}
+            for name, (source, kind) in COLUMNS.items():
+                text = row[source]
+                if kind == 'int':
+                    out[name] = int(float(text)) if text else 0
+                elif kind == 'float':
+                    out[name] = float(text) if text else 0.0
+                else:
+                    out[name] = text
+            yield out
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def write_columnar(json_file, columns, rows, compress=False):
+    """
+    Streams `rows` ({column: value} dicts) into a columnar JSON document and returns the row count.
+
+    `columns` maps each output column to its type. Every column is appended to its own temporary
+    file, so memory stays constant whatever the number of rows; only the string tables of the
+    category columns are kept in memory. The document looks like
+    {"format", "rows", "columns": {name: {"type", "values"[, "codes"]}}}, where category
+    columns hold their distinct strings in "values" and one code per row in "codes".
+    """
+    tables = {name: {} for name, kind in columns.items() if kind == 'category'}
+    n_rows = 0
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(json_file))) as tmp_dir:
+        parts = {name: open(os.path.join(tmp_dir, str(i)), 'w', encoding='utf-8') for i, name in enumerate(columns)}
+        try:
+            for row in rows:
+                for name, kind in columns.items():
+                    if kind == 'category':
+                        value = tables[name].setdefault(row[name], len(tables[name]))
+                    else:
+                        value = _number(row[name])
+                    parts[name].write(f",{value}" if n_rows else f"{value}")
+                n_rows += 1
+        finally:
+            for part in parts.values():
+                part.close()
+
+        tmp_path = f"{json_file}.tmp"
+        opener = gzip.open if compress else open
+        with opener(tmp_path, 'wt', encoding='utf-8') as out:
+            out.write(f'{{"format":"{FORMAT}","rows":{n_rows},"columns":{{')
+            for i, (name, kind) in enumerate(columns.items()):
+                out.write(f'{"," if i else ""}{json.dumps(name)}:{{"type":"{kind}",')
+                if kind == 'category':
+                    out.write(f'"values":{json.dumps(list(tables[name]), ensure_ascii=False)},"codes":[')
+                else:
+                    out.write('"values":[')
+                with open(parts[name].name, 'r', encoding='utf-8') as part:
+                    shutil.copyfileobj(part, out)
+                out.write(']}')
+            out.write('}}\n')
+        os.replace(tmp_path, json_file)
+    return n_rows
+
+
+def _tally(rows, tiles):
+    # Acumula las celdas de los tiles mientras las filas pasan hacia el exportador de microdatos
+    for row in rows:
+        key = tuple(row[dim] for dim in TILE_DIMENSIONS)
+        cell = tiles.setdefault(row['periodo'], {}).setdefault(key, [0, 0.0, 0, 0.0])
+        cell[0] += 1
+        cell[1] += row['ingreso']
+        cell[2] += row['informal']
+        cell[3] += row['horas_trabajadas']
+        yield row
+
+
+def _is_shard(file_name):
+    return file_name != TILES_INDEX and (file_name.endswith('.json') or file_name.endswith('.json.gz'))
+
+
+def write_tiles(tiles, tiles_dir=TILES_DIR, compress=False):
+    """
+    Writes one columnar shard of aggregated cells per period plus an index with the period files
+    and the dimension values (for the page filters). Returns the index.
+
+    Once the new index is in place, shards it does not list (periods no longer in the data, or the
+    .json/.json.gz twin left by a run with the other --gzip setting) are deleted.
+    """
+    os.makedirs(tiles_dir, exist_ok=True)
+    columns = {dim: 'category' for dim in TILE_DIMENSIONS}
+    columns.update(TILE_MEASURES)
+    values = {dim: [] for dim in TILE_DIMENSIONS}
+    periods = {}
+    for period in sorted(tiles):
+        cells = [dict(zip(TILE_DIMENSIONS, key), **dict(zip(TILE_MEASURES, measures))) for key, measures in tiles[period].items()]
+        file_name = f"{period}.json" + ('.gz' if compress else '')
+        write_columnar(os.path.join(tiles_dir, file_name), columns, cells, compress)
+        periods[period] = {'file': file_name, 'rows': sum(cell['n'] for cell in cells), 'cells': len(cells)}
+        for cell in cells:
+            for dim in TILE_DIMENSIONS:
+                if cell[dim] not in values[dim]:
+                    values[dim].append(cell[dim])
+    index = {'format': TILES_FORMAT, 'dimensions': TILE_DIMENSIONS, 'measures': list(TILE_MEASURES), 'periods': periods, 'values': values}
+    index_path = os.path.join(tiles_dir, TILES_INDEX)
+    with open(f"{index_path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(f"{index_path}.tmp", index_path)
+    current = {entry['file'] for entry in periods.values()}
+    for file_name in os.listdir(tiles_dir):
+        if _is_shard(file_name) and file_name not in current:
+            os.remove(os.path.join(tiles_dir, file_name))
+    return index
+
+
+def convert(csv_file=CSV_FILE, json_file=None, compress=False, tiles_dir=TILES_DIR):
+    """
+    Exports `csv_file` to per-period tiles in `tiles_dir` (what dashboard.html reads) and, with
+    `json_file`, to the columnar microdata file as well, in one pass. Returns the exported row count.
+    """
+    if not json_file and not tiles_dir:
+        raise ValueError("Nothing to write: pass json_file and/or tiles_dir.")
+    tiles = {}
+    rows = read_rows(csv_file)
+    if tiles_dir:
+        rows = _tally(rows, tiles)
+    if json_file:
+        n_rows = write_columnar(json_file, COLUMN_TYPES, rows, compress)
+    else:
+        n_rows = sum(1 for _ in rows)
+    if tiles_dir:
+        write_tiles(tiles, tiles_dir, compress)
+    return n_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exports data.csv to the tiles read by dashboard.html and, optionally, to a columnar microdata JSON.")
+    parser.add_argument('--input', default=CSV_FILE, help=f"Source CSV (default: {CSV_FILE}).")
+    parser.add_argument('--microdata', action='store_true', help="Also write the row-level columnar file (not read by dashboard.html).")
+    parser.add_argument('--output', default=None, help=f"Microdata file, implies --microdata (default: {JSON_FILE}, or {JSON_FILE}.gz with --gzip).")
+    parser.add_argument('--tiles-dir', default=TILES_DIR, help=f"Directory of the per-period tiles (default: {TILES_DIR}).")
+    parser.add_argument('--no-tiles', action='store_true', help="Do not write the tiles (requires --microdata or --output).")
+    parser.add_argument('--gzip', action='store_true', help="Gzip-compress the output files.")
+    args = parser.parse_args(argv)
+
+    output = args.output or ((f"{JSON_FILE}.gz" if args.gzip else JSON_FILE) if args.microdata else None)
+    tiles_dir = None if args.no_tiles else args.tiles_dir
+    if not output and not tiles_dir:
+        parser.error("--no-tiles requires --microdata or --output.")
+    rows = convert(args.input, output, compress=args.gzip, tiles_dir=tiles_dir)
+    if output:
+        print(f'Successfully converted {args.input} to {output} ({rows:,} rows, {os.path.getsize(output):,} bytes)')
+    if tiles_dir:
+        print(f'Per-period tiles for {rows:,} rows written to {tiles_dir}/')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+// --- Informality model scorer (browser) ---
+// Loads the versioned JSON artifact written by predictive_modeling.py (see 01_scripts/linear_scorer.py)
+// and scores records with the same formula as the Python scorer: scaled numeric features, one
+// coefficient per category (missing values take the category imputed in training, unknown
+// categories contribute 0) and a sigmoid.
+
+const MODEL_URL = '05_dashboard/informality_model.json';
+const MODEL_FORMAT = 'linear-logistic';
+const MODEL_VERSION = 2;
+
+function compileModel(artifact) {
+    if (artifact.format !== MODEL_FORMAT || artifact.version !== MODEL_VERSION) {
+        throw new Error(`Unsupported model artifact (format ${artifact.format}, version ${artifact.version}).`);
+    }
+    // The scaler is folded into one slope per numeric feature; its constant term goes into the intercept
+    let intercept = artifact.intercept;
+    const numeric = artifact.numeric.map(feat => {
+        const slope = feat.coef / feat.scale;
+        intercept -= feat.mean * slope;
+        return { name: feat.name, slope: slope, median: feat.median };
+    });
+    // Per categorical feature: value -> code and a coefficient table whose last slot (0) is for unknown
+    // values; missing values use the code of the category imputed in training (or the 0 slot)
+    const categorical = artifact.categorical.map(feat => {
+        const table = new Float64Array(feat.categories.length + 1);
+        table.set(feat.coef);
+        const fill = feat.fill === null ? -1 : feat.categories.indexOf(feat.fill);
+        return {
+            name: feat.name, categories: feat.categories, codes: new Map(feat.categories.map((c, i) => [c, i])),
+            table: table, fillCode: fill >= 0 ? fill : feat.categories.length
+        };
+    });
+    return { intercept: intercept, numeric: numeric, categorical: categorical, features: artifact.features, metadata: artifact.metadata || {} };
+}
+
+function loadModel(url = MODEL_URL) {
+    return fetch(url)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`Could not load ${url} (HTTP ${response.status}).`);
+            }
+            return response.json();
+        })
+        .then(compileModel);
+}
+
+function modelCategories(model, name) {
+    const feat = model.categorical.find(f => f.name === name);
+    return feat ? feat.categories : [];
+}
+
+function sigmoid(z) {
+    return z >= 0 ? 1 / (1 + Math.exp(-z)) : Math.exp(z) / (1 + Math.exp(z));
+}
+
+// Scores an array of records column by column: each feature is encoded once into a typed array
+// (values or category codes) and accumulated into the log-odds, so thousands of rows stay cheap.
+function scoreRecords(model, records) {
+    const n = records.length;
+    const z = new Float64Array(n).fill(model.intercept);
+    const x = new Float64Array(n);
+    const codes = new Int32Array(n);
+    model.numeric.forEach(feat => {
+        for (let i = 0; i < n; i++) {
+            const value = parseFloat(records[i][feat.name]);
+            x[i] = Number.isNaN(value) ? feat.median : value;
+        }
+        for (let i = 0; i < n; i++) {
+            z[i] += feat.slope * x[i];
+        }
+    });
+    model.categorical.forEach(feat => {
+        const unknown = feat.categories.length;
+        for (let i = 0; i < n; i++) {
+            const value = records[i][feat.name];
+            if (value === undefined || value === null || value === '' || Number.isNaN(value)) {
+                codes[i] = feat.fillCode;
+                continue;
+            }
+            const code = feat.codes.get(value);
+            codes[i] = code === undefined ? unknown : code;
+        }
+        for (let i = 0; i < n; i++) {
+            z[i] += feat.table[codes[i]];
+        }
+    });
+    for (let i = 0; i < n; i++) {
+        z[i] = sigmoid(z[i]);
+    }
+    return z;
+}
+
+function scoreRecord(model, record) {
+    return scoreRecords(model, [record])[0];
+}
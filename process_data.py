@@ -1,10 +1,19 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
 import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '01_scripts'))
+from cleaning_rules import SPECIAL_CODE_RULES, apply_rules, rules_report
+from periods import discover_quarter_files
+from quarter_cache import read_quarter_csv
+from survey_schema import fill_no_aplica, recode
+
+CACHE_DIR = '02_data_processed/cache/'
+
 def get_recode_maps():
     """Returns dictionaries for recoding variables based on the data dictionary."""
     maps = {
@@ -74,21 +83,14 @@ def generar_estadisticas(df, columnas):
 
 def process_data():
     # --- Phase 1: Data Loading and Unification ---
-    files = [f for f in os.listdir('Empleabilidad') if f.endswith('.csv')]
-    quarters = {
-        'Trim Ene-Feb-Mar24.csv': '2024-Q1', 'Trim Abr-May-Jun24.csv': '2024-Q2',
-        'Trim Jul-Ago-Set24.csv': '2024-Q3', 'Trim Set-Oct-Nov24.csv': '2024-Q4',
-        'Trim Ene-Feb-Mar25.csv': '2025-Q1', 'Trim Mar-Abr-May25.csv': '2025-Q2'
-    }
-
+    files = discover_quarter_files('Empleabilidad')
     df_list = []
-    for file in files:
-        df = pd.read_csv(os.path.join('Empleabilidad', file), low_memory=False)
-        df['periodo'] = quarters[file]
+    for path, periodo in files:
+        df = read_quarter_csv(path, CACHE_DIR)
+        df['periodo'] = periodo
         df_list.append(df)
 
     master_df = pd.concat(df_list, ignore_index=True)
-    master_df.replace(r'^\s*$', np.nan, regex=True, inplace=True)
 
     # Lista de columnas representativas para la auditoría
     columnas_a_evaluar = ['C208', 'INGTOT', 'whoraT']
@@ -103,17 +105,6 @@ def process_data():
 
     columns_to_visualize = ['C208', 'I339_1', 'whoraT']
 
-    codes_to_nan = {
-        'C208': [99], 'C301_DIA': [99], 'C301_MES': [99], 'C301_ANIO': [9999],
-        'C308_COD': [9999], 'C309_COD': [9999], 'C317A': [9999],
-        'C318_1': [99], 'C318_2': [99], 'C318_3': [99], 'C318_4': [99],
-        'C318_5': [99], 'C318_6': [99], 'C318_7': [99], 'C318_T': [99],
-        'C328_T': [99], 'whoraT': [99], 'I339_1': [999999], 'C341_T': [999999],
-        'C342': [999999], 'D344': [999999], 'I345_1': [999999], 'D347_T': [999999],
-        'C348': [999999], 'D350': [999999], 'INGTOT': [999999], 'INGTOTP': [999999],
-        'INGTRABW': [999999]
-    }
-
     # Step B: Generate "BEFORE" Visual Evidence
     print("\n--- Generating visual evidence BEFORE cleaning ---\n")
     for column in columns_to_visualize:
@@ -138,21 +129,16 @@ def process_data():
 
     # Step C: Perform Data Sanitization
     print("\n--- Applying cleaning: Replacing special codes with NaN ---\n")
-    for column, codes in codes_to_nan.items():
-        if column in master_df.columns:
-            master_df[column] = master_df[column].replace(codes, np.nan)
+    rule_hits = apply_rules(master_df, SPECIAL_CODE_RULES)
+    print(rules_report(SPECIAL_CODE_RULES, rule_hits).to_string(index=False))
 
     print("\n--- Enforcing numeric types post-cleaning ---\n")
-    numeric_columns = list(codes_to_nan.keys())
-    # The original code extended with factor_expansion and factor_ajustado, let's keep that
+    # Rule columns are already numeric; only the expansion factors may still need coercion
     fa_cols = [col for col in master_df.columns if col.startswith('fa_')]
-    numeric_columns.extend(fa_cols)
-    # The user's code did not include these, but they are important from the original logic
-    numeric_columns.extend(['factor_expansion', 'factor_ajustado'])
-
+    numeric_columns = fa_cols + ['factor_expansion', 'factor_ajustado']
 
     for col in numeric_columns:
-        if col in master_df.columns:
+        if col in master_df.columns and not pd.api.types.is_numeric_dtype(master_df[col]):
             master_df[col] = pd.to_numeric(master_df[col], errors='coerce')
 
     # Step D: Generate "AFTER" Visual Evidence
@@ -203,14 +189,14 @@ def process_data():
     # the filtering conditions below (`>= 14` and `< 14`) will not be met
     # for NaN values, so these rows are automatically excluded from both
     # `poblacion_trabajo_df` and `poblacion_no_trabajo_df`.
-    poblacion_trabajo_df = master_df[master_df['C208'] >= 14].copy()
-    poblacion_no_trabajo_df = master_df[master_df['C208'] < 14].copy()
+    poblacion_trabajo_df = master_df[(master_df['C208'] >= 14).fillna(False)].copy()
+    poblacion_no_trabajo_df = master_df[(master_df['C208'] < 14).fillna(False)].copy()
 
     # --- Phase 3: Cleaning poblacion_trabajo_df ---
     maps = get_recode_maps()
     for var, mapping in maps.items():
         if var in poblacion_trabajo_df.columns:
-            poblacion_trabajo_df[var] = poblacion_trabajo_df[var].map(mapping)
+            poblacion_trabajo_df[var] = recode(poblacion_trabajo_df[var], mapping)
 
     # Handle Nulls with 'No Aplica'
     not_employed_condition = poblacion_trabajo_df['OCUP300'] != 'Ocupado'
@@ -226,9 +212,7 @@ def process_data():
 
     cols_to_fill.extend([col for col in poblacion_trabajo_df.columns if col.startswith('I3') or col.startswith('D3')])
     cols_to_fill.extend(['INGTOT', 'INGTOTP', 'ingtrabw', 'whoraT'])
-    for col in cols_to_fill:
-        if col in poblacion_trabajo_df.columns:
-            poblacion_trabajo_df.loc[not_employed_condition, col] = 'No Aplica'
+    fill_no_aplica(poblacion_trabajo_df, not_employed_condition, cols_to_fill)
 
     # Feature Engineering: grupo_edad
     bins = [14, 18, 25, 35, 45, 55, 65, np.inf]
@@ -237,7 +221,8 @@ def process_data():
 
     # Feature Engineering: es_informal
     poblacion_trabajo_df['es_informal'] = 0
-    poblacion_trabajo_df.loc[(poblacion_trabajo_df['OCUP300'] == 'Ocupado') & (poblacion_trabajo_df['C361_1'] == 2), 'es_informal'] = 1
+    informal = (poblacion_trabajo_df['OCUP300'] == 'Ocupado') & (poblacion_trabajo_df['C361_1'] == 2).fillna(False)
+    poblacion_trabajo_df.loc[informal, 'es_informal'] = 1
 
     # --- Phase 4: Cleaning poblacion_no_trabajo_df ---
     # Prune irrelevant columns
@@ -251,7 +236,7 @@ def process_data():
 
     for var, mapping in maps.items():
         if var in poblacion_no_trabajo_df.columns and var != 'OCUP300':
-            poblacion_no_trabajo_df[var] = poblacion_no_trabajo_df[var].map(mapping)
+            poblacion_no_trabajo_df[var] = recode(poblacion_no_trabajo_df[var], mapping)
 
     # --- Final Output ---
     poblacion_trabajo_df.to_csv('datos_limpios_poblacion_trabajo.csv', index=False)